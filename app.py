@@ -1,45 +1,205 @@
+from werkzeug.exceptions import HTTPException
+from http.client import INTERNAL_SERVER_ERROR, UNAUTHORIZED
 import simplejson as json
+import functools
+import types
+import time
+import os
 
-from flask import Flask, make_response
+from flask import Flask, Response, make_response, request, g, stream_with_context
 from flask_restful import Api
 
-from models import database
+from models import database, compile_validators, ENVIRONMENT
+import auth
+import catalog
+import compression
+import formats
+import metrics
+import queries
+import ratelimit
+import replicas
+import utils
 
-from views.item import ItemResource, ItemsResource, ItemPicturesResource
+from views.item import ItemResource, ItemsResource, ItemsSearchResource, ItemPicturesResource
 from views.order import OrderResource, OrdersResource
 from views.user import UserResource, UsersResource
 from views.address import AddressResource, AddressesResource
 from views.favorites import FavoritesResource, FavoriteResource
 from views.picture import PictureResource
+from views.session import SessionsResource
+
+
+def instrument(view):
+    """Record the latency, the status and the requests in progress of each
+    method of a Resource."""
+    resource = view.view_class.__name__
+
+    @functools.wraps(view)
+    def instrumented_view(*args, **kwargs):
+        labels = {'resource': resource, 'method': request.method}
+        g.metric_labels = labels
+        metrics.add_gauge('http_requests_in_flight', 1, **labels)
+        start = time.perf_counter()
+        status = INTERNAL_SERVER_ERROR
+        try:
+            response = view(*args, **kwargs)
+            status = int(response.status_code)
+            return response
+        except HTTPException as err:
+            status = err.code
+            raise
+        finally:
+            metrics.add_gauge('http_requests_in_flight', -1, **labels)
+            metrics.observe(
+                'http_request_duration_seconds', time.perf_counter() - start, **labels)
+            metrics.incr('http_requests_total', status=status, **labels)
+
+    return instrumented_view
 
 
 app = Flask(__name__)
-api = Api(app)
+app.request_class = formats.Request
+api = Api(app, decorators=[instrument])
 app.config['UPLOADS_FOLDER'] = 'images'
 app.config['ALLOWED_EXTENSIONS'] = set(['jpg', 'jpeg', 'png'])
 
+# Signs the session tokens, so all the workers must share it.
+app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+if not app.config['SECRET_KEY']:
+    if ENVIRONMENT != 'dev':
+        raise RuntimeError('SECRET_KEY is not set')
+    app.config['SECRET_KEY'] = os.urandom(32)
+
+compile_validators()
+
 
 @api.representation('application/json')
 def output_json(data, code, headers=None):
-    resp = make_response(json.dumps(data), code)
+    # Generators are streamed as a JSON array, a chunk at a time, instead of
+    # being encoded in a single string.
+    if isinstance(data, types.GeneratorType):
+        resp = Response(
+            stream_with_context(utils.json_array_stream(data)), code,
+            mimetype='application/json')
+    else:
+        with metrics.timing('serialization'):
+            resp = make_response(json.dumps(data), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+@api.representation(formats.MSGPACK)
+def output_msgpack(data, code, headers=None):
+    # MessagePack arrays carry their length up front, so generators are
+    # collected before encoding.
+    if isinstance(data, types.GeneratorType):
+        data = list(data)
+    with metrics.timing('serialization'):
+        resp = make_response(formats.msgpack_dumps(data), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+@api.representation(formats.CBOR)
+def output_cbor(data, code, headers=None):
+    if isinstance(data, types.GeneratorType):
+        resp = Response(
+            stream_with_context(formats.cbor_array_stream(data)), code, mimetype=formats.CBOR)
+    else:
+        with metrics.timing('serialization'):
+            resp = make_response(formats.cbor_dumps(data), code)
     resp.headers.extend(headers or {})
     return resp
 
 
 @app.before_request
-def database_connect():
-    if database.is_closed():
-        database.connect()
+def count_queries():
+    queries.start_request()
+    metrics.start_timings()
+
+
+@app.after_request
+def query_headers(response):
+    # Statements run before the response, so not those of a streamed body.
+    if app.debug and 'queries' in g:
+        response.headers['X-Query-Count'] = len(g.queries)
+        response.headers['X-Query-Time'] = '{:.2f}'.format(g.queries.duration * 1000)
+        response.headers['X-Query-Repeated'] = len(g.queries.repeated())
+    return response
+
+
+@app.after_request
+def record_write(response):
+    # The next reads of the user go to the primary for a while.
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and 'current_user' in g:
+        replicas.record_write(g.current_user.id)
+    return response
+
+
+@app.after_request
+def rate_limit_headers(response):
+    response.headers.extend(ratelimit.headers())
+    return response
+
+
+@app.after_request
+def compress(response):
+    return compression.compress_response(response)
+
+
+@app.teardown_request
+def catalog_invalidate(response):
+    catalog.invalidate_request()
+    return response
+
+
+@app.teardown_request
+def record_timings(response):
+    # Streamed bodies are encoded after the response and not counted in the
+    # serialization time.
+    timings = metrics.pop_timings()
+    labels = g.get('metric_labels')
+    if labels is not None:
+        database_time = g.queries.duration if 'queries' in g else 0
+        metrics.observe('http_request_database_seconds', database_time, **labels)
+        metrics.observe('http_request_serialization_seconds', timings['serialization'], **labels)
+        metrics.observe('http_request_password_hash_seconds', timings['password_hash'], **labels)
+
+    metrics.flush()
+    return response
 
 
+@app.teardown_request
+def flag_repeated_queries(response):
+    if 'queries' not in g:
+        return response
+
+    for sql, count in g.queries.repeated():
+        metrics.incr('queries_repeated_total', route=request.endpoint)
+        app.logger.warning('Probable N+1 in %s, run %d times: %s', request.endpoint, count, sql)
+    return response
+
+
+# There is no connection at the beginning of a request: the first query
+# checks one out of the pool, so requests rejected before querying, like
+# failed validations, never take one.
 @app.teardown_request
 def database_disconnect(response):
-    if not database.is_closed():
-        database.close()
+    metrics.incr('requests_total')
+
+    # Returns the connections to the pools.
+    used = [db for db in [database] + replicas.databases if not db.is_closed()]
+    for db in used:
+        db.close()
+
+    if not used:
+        metrics.incr('requests_without_database_total')
+
     return response
 
 
 api.add_resource(ItemsResource, '/items/')
+api.add_resource(ItemsSearchResource, '/items/search')
 api.add_resource(ItemResource, '/items/<uuid:uuid>')
 api.add_resource(ItemPicturesResource, '/items/<uuid:item_id>/pictures')
 api.add_resource(UsersResource, '/users/')
@@ -51,3 +211,13 @@ api.add_resource(AddressResource, '/addresses/<uuid:address_id>')
 api.add_resource(FavoritesResource, '/favorites/')
 api.add_resource(FavoriteResource, '/favorites/<uuid:item_id>')
 api.add_resource(PictureResource, '/pictures/<uuid:uuid>')
+api.add_resource(SessionsResource, '/sessions/')
+
+
+@app.route('/metrics')
+@auth.login_required
+def metrics_view():
+    if not g.current_user.superuser:
+        return Response(status=UNAUTHORIZED)
+
+    return Response(metrics.exposition(), content_type='text/plain; version=0.0.4')
@@ -1,25 +1,200 @@
-from flask_httpauth import HTTPBasicAuth
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from collections import OrderedDict
 from models import User
-from flask import g
+from flask import g, current_app
+import threading
+import tempfile
+import hashlib
+import ratelimit
+import metrics
+import sqlite3
+import random
+import hmac
+import time
+import uuid
+import os
 
 
 login_manager = HTTPBasicAuth()
-login_required = login_manager.login_required
+token_manager = HTTPTokenAuth('Bearer')
+login_required = MultiAuth(login_manager, token_manager).login_required
+
+# Seconds a session token is valid for.
+SESSION_TTL = int(os.getenv('SESSION_TTL', 900))
+
+# The lowest session versions accepted for the users changed lately live in
+# a SQLite file, so that a new password or a deletion invalidates the cached
+# credentials and the sessions of the user in all the workers of a machine.
+PATH = os.getenv('AUTH_DATABASE', os.path.join(tempfile.gettempdir(), 'ecommerce-auth.db'))
+# Share of the changes that also delete the versions older than any cached
+# user or session.
+PURGE_PROBABILITY = 0.01
+
+# Users authenticated lately, by a keyed hash of their credentials, so that
+# their next requests skip the database and the password hash verification.
+# A cached user is valid as long as their session version is.
+CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 1024))
+CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', 30))
+
+cache_secret = os.urandom(32)
+cache = OrderedDict()
+cache_lock = threading.Lock()
+
+
+local = threading.local()
+
+
+def connection():
+    if getattr(local, 'key', None) != (PATH, os.getpid()):
+        local.connection = sqlite3.connect(PATH, timeout=10, isolation_level=None)
+        local.connection.execute(
+            'CREATE TABLE IF NOT EXISTS session_version '
+            '(user_id INTEGER PRIMARY KEY, version INTEGER NOT NULL, updated REAL NOT NULL)')
+        local.key = (PATH, os.getpid())
+    return local.connection
+
+
+def session_version(user_id):
+    """Lowest session version accepted for the user."""
+    row = connection().execute(
+        'SELECT version FROM session_version WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row is not None else 0
+
+
+def credentials_key(email, password):
+    credentials = '\0'.join((email, password)).encode()
+    return hmac.new(cache_secret, credentials, hashlib.sha256).digest()
+
+
+def cached_user(key):
+    with cache_lock:
+        try:
+            expires, _, data = cache[key]
+        except KeyError:
+            return None
+
+        if expires < time.monotonic():
+            del cache[key]
+            return None
+
+        cache.move_to_end(key)
+
+    # Changed by another worker since it was cached.
+    if data['session_version'] < session_version(data['id']):
+        with cache_lock:
+            cache.pop(key, None)
+        return None
+
+    # Every request gets its own instance.
+    return User(**data)
+
+
+def cache_user(key, user):
+    with cache_lock:
+        cache[key] = (time.monotonic() + CACHE_TTL, user.id, dict(user._data))
+        cache.move_to_end(key)
+        while len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def forget(user):
+    """Invalidate the cached credentials and the older sessions of `user`,
+    after their session version was bumped."""
+    db = connection()
+    now = time.time()
+    db.execute(
+        'INSERT OR REPLACE INTO session_version (user_id, version, updated) VALUES '
+        '(?, max(?, coalesce((SELECT version FROM session_version WHERE user_id = ?), 0)), ?)',
+        (user.id, user.session_version, user.id, now))
+    if random.random() < PURGE_PROBABILITY:
+        db.execute('DELETE FROM session_version WHERE updated < ?',
+                   (now - max(SESSION_TTL, CACHE_TTL),))
+
+    with cache_lock:
+        for key in [key for key, (_, user_id, _) in cache.items() if user_id == user.id]:
+            del cache[key]
+
+
+def clear_cache():
+    with cache_lock:
+        cache.clear()
+    connection().execute('DELETE FROM session_version')
 
 
 @login_manager.verify_password
 def verify_pw(email, password):
+    # Requests without credentials.
+    if not email:
+        return False
+
+    key = credentials_key(email, password)
+    user = cached_user(key)
+    if user is not None:
+        metrics.incr('auth_cache_hits_total')
+        g.current_user = user
+        return True
+
+    metrics.incr('auth_cache_misses_total')
+
+    # Password checks are expensive, and clients sending wrong
+    # credentials are allowed much fewer of them.
+    ratelimit.check('failed_login', ratelimit.client_address())
+    ratelimit.hit('login', ratelimit.client_address())
+
     try:
         user = User.get(User.email == email)
     except User.DoesNotExist:
-        return False
+        user = None
 
-    if user.verify_password(password):
+    if user is not None and user.verify_password(password):
         g.current_user = user
 
         if g.current_user.status != 'enable':
             return False
 
+        cache_user(key, user)
         return True
 
+    ratelimit.hit('failed_login', ratelimit.client_address())
     return False
+
+
+def session_serializer():
+    return URLSafeTimedSerializer(
+        current_app.config['SECRET_KEY'], salt='session',
+        signer_kwargs={'digest_method': hashlib.sha256})
+
+
+def create_token(user):
+    return session_serializer().dumps({
+        'id': user.id,
+        'uuid': str(user.uuid),
+        'superuser': user.superuser,
+        'version': user.session_version,
+    })
+
+
+@token_manager.verify_token
+def verify_token(token):
+    """Authenticate a session token by its signature, without queries.
+
+    Changing the password or deleting the user bumps its session version,
+    which invalidates the tokens issued before in all the workers at once.
+    """
+    try:
+        data = session_serializer().loads(token, max_age=SESSION_TTL)
+    except BadSignature:
+        return False
+
+    if data['version'] < session_version(data['id']):
+        return False
+
+    g.current_user = User(
+        id=data['id'],
+        uuid=uuid.UUID(data['uuid']),
+        superuser=data['superuser'],
+        status='enable',
+        session_version=data['version'],
+    )
+    return True
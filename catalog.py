@@ -0,0 +1,231 @@
+from flask import g, has_request_context
+from collections import OrderedDict
+from contextlib import contextmanager
+from models import Item
+import simplejson as json
+import threading
+import datetime
+import sqlite3
+import metrics
+import random
+import replicas
+import time
+import os
+
+# Seconds an item stays cached.
+CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', 60))
+# Items cached by each process, when not sharing a SQLite store.
+CACHE_SIZE = int(os.getenv('CATALOG_CACHE_SIZE', 10000))
+# SQLite file shared by the workers of a machine, instead of a cache per
+# process.
+CACHE_DATABASE = os.getenv('CATALOG_CACHE_DATABASE')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class LocalStore:
+    """LRU cache of the process."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                expires, value = self.entries[key]
+            except KeyError:
+                return None
+
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteStore:
+    """Cache in a SQLite file, shared by the processes using it."""
+
+    # Share of the writes that also delete the expired entries.
+    PURGE_PROBABILITY = 0.01
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self.local.connection.execute(
+                'CREATE TABLE IF NOT EXISTS entry '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)')
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def get(self, key):
+        row = self.connection().execute(
+            'SELECT value FROM entry WHERE key = ? AND expires >= ?',
+            (key, time.time())).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0], use_decimal=True)
+
+    def set(self, key, value):
+        db = self.connection()
+        now = time.time()
+        db.execute(
+            'INSERT OR REPLACE INTO entry (key, value, expires) VALUES (?, ?, ?)',
+            (key, json.dumps(value), now + self.ttl))
+        if random.random() < self.PURGE_PROBABILITY:
+            db.execute('DELETE FROM entry WHERE expires < ?', (now,))
+
+    def delete(self, keys):
+        self.connection().executemany('DELETE FROM entry WHERE key = ?', [(key,) for key in keys])
+
+    def clear(self):
+        self.connection().execute('DELETE FROM entry')
+
+
+if CACHE_DATABASE:
+    store = SQLiteStore(CACHE_DATABASE, CACHE_TTL)
+else:
+    store = LocalStore(CACHE_SIZE, CACHE_TTL)
+
+# Loads in progress in this process, by key, with the number of requests
+# waiting for them and the number of invalidations of the key since the
+# first one began: concurrent misses of the same key wait for the first one
+# instead of querying again, and the loads that began before an
+# invalidation are not cached. A key is dropped once nothing waits on it.
+loads = {}
+loads_lock = threading.Lock()
+
+
+@contextmanager
+def single_flight(key):
+    with loads_lock:
+        lock, waiting, invalidated = loads.get(key, (threading.Lock(), 0, 0))
+        loads[key] = (lock, waiting + 1, invalidated)
+    try:
+        with lock:
+            yield
+    finally:
+        with loads_lock:
+            lock, waiting, invalidated = loads[key]
+            if waiting == 1:
+                del loads[key]
+            else:
+                loads[key] = (lock, waiting - 1, invalidated)
+
+
+def generation(key):
+    """Invalidations of `key` since the first of its loads in flight began."""
+    with loads_lock:
+        return loads[key][2]
+
+
+def clear():
+    store.clear()
+
+
+def timestamp(value):
+    return (value - EPOCH).total_seconds()
+
+
+def load_item(uuid):
+    # From the primary: a lagging replica could return the row of before the
+    # last write, that would then stay cached after the replica caught up.
+    with replicas.on_primary():
+        try:
+            item = Item.get(Item.uuid == uuid)
+        except Item.DoesNotExist:
+            return None
+
+        return {
+            'id': item.id,
+            'version': item.version,
+            'updated_at': timestamp(item.updated_at),
+            'document': item.json(),
+        }
+
+
+def get_item(uuid):
+    """The serialized item with the given uuid, with its id, version and
+    update time (a UTC timestamp), or None if it doesn't exist."""
+    key = str(uuid)
+    entry = store.get(key)
+    if entry is not None:
+        metrics.incr('catalog_cache_hits_total')
+        return entry
+
+    metrics.incr('catalog_cache_misses_total')
+    with single_flight(key):
+        # Loaded by a concurrent request while waiting.
+        entry = store.get(key)
+        if entry is not None:
+            return entry
+
+        started = generation(key)
+        entry = load_item(key)
+        if entry is not None and generation(key) == started:
+            store.set(key, entry)
+        return entry
+
+
+def drop(keys):
+    # Only the loads in flight can be stale, the next ones read the change.
+    with loads_lock:
+        for key in keys:
+            if key in loads:
+                lock, waiting, invalidated = loads[key]
+                loads[key] = (lock, waiting, invalidated + 1)
+    store.delete(keys)
+
+
+def invalidate(uuids):
+    """Drop the items from the cache.
+
+    They are dropped again at the end of the request, since the transaction
+    changing them may be committed after this call, letting a concurrent
+    request cache them again in between.
+    """
+    keys = [str(uuid) for uuid in uuids]
+    if not keys:
+        return
+
+    drop(keys)
+    if has_request_context():
+        g.setdefault('catalog_invalidated', set()).update(keys)
+
+
+def invalidate_ids(item_ids):
+    item_ids = list(item_ids)
+    if item_ids:
+        invalidate(uuid for uuid, in Item.select(Item.uuid).where(Item.id << item_ids).tuples())
+
+
+def invalidate_request():
+    """Drop again the items changed by the request, once committed."""
+    keys = g.pop('catalog_invalidated', None)
+    if keys:
+        drop(keys)
@@ -0,0 +1,163 @@
+from flask import request
+from http.client import NOT_MODIFIED, NO_CONTENT
+import catalog
+import metrics
+import time
+import zlib
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this many bytes are sent uncompressed.
+MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+# Compressed bodies of the responses with an ETag kept by each process, so
+# that every representation is compressed once.
+CACHE_SIZE = int(os.getenv('COMPRESSION_CACHE_SIZE', 1000))
+CACHE_TTL = float(os.getenv('COMPRESSION_CACHE_TTL', 3600))
+
+MIMETYPES = {'application/json', 'application/msgpack', 'application/cbor'}
+
+# Encodings in order of preference when the client accepts several of them.
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+cache = catalog.LocalStore(CACHE_SIZE, CACHE_TTL)
+
+
+class GzipCompressor:
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data):
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def process(self, data):
+        return self.compressor.process(data)
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+COMPRESSORS = {
+    'gzip': GzipCompressor,
+    'br': BrotliCompressor,
+}
+
+
+def compress(data, encoding):
+    compressor = COMPRESSORS[encoding]()
+    return compressor.process(data) + compressor.finish()
+
+
+def negotiate():
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def encoded_tag(tag, encoding):
+    return '{}-{}'.format(tag, encoding)
+
+
+def tag_variants(tag):
+    """ETags of the encodings of a representation tagged `tag`, all matching
+    a conditional request for it."""
+    return [tag] + [encoded_tag(tag, encoding) for encoding in ENCODINGS]
+
+
+def record(route, saved, cpu):
+    metrics.incr('compression_bytes_saved_total', saved, route=route)
+    metrics.incr('compression_cpu_seconds_total', cpu, route=route)
+
+
+def compress_stream(chunks, encoding, route):
+    compressor = COMPRESSORS[encoding]()
+    size = compressed = 0
+    cpu = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            start = time.process_time()
+            data = compressor.process(chunk)
+            cpu += time.process_time() - start
+            size += len(chunk)
+            compressed += len(data)
+            if data:
+                yield data
+
+        start = time.process_time()
+        data = compressor.finish()
+        cpu += time.process_time() - start
+        compressed += len(data)
+        yield data
+        record(route, size - compressed, cpu)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    """Compress the body of `response` with the best encoding accepted by the
+    client, unless it's too small or not of a compressible type."""
+    encoding = negotiate()
+    tag, _ = response.get_etag()
+
+    if response.status_code == NOT_MODIFIED:
+        # Confirm the tag of the encoding cached by the client.
+        if tag and encoding and request.if_none_match.contains_weak(encoded_tag(tag, encoding)):
+            response.set_etag(encoded_tag(tag, encoding))
+            response.vary.add('Accept-Encoding')
+        return response
+
+    if response.mimetype not in MIMETYPES or response.direct_passthrough:
+        return response
+    if 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if encoding is None or response.status_code == NO_CONTENT:
+        return response
+
+    route = request.endpoint
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, route)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+
+        # Tags are only unique by resource, hence the path in the key.
+        key = (request.full_path, tag, encoding) if tag else None
+        compressed = cache.get(key) if key else None
+        cpu = 0.0
+        if compressed is not None:
+            metrics.incr('compression_cache_hits_total', route=route)
+        else:
+            start = time.process_time()
+            compressed = compress(data, encoding)
+            cpu = time.process_time() - start
+            if key:
+                cache.set(key, compressed)
+        record(route, len(data) - len(compressed), cpu)
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    if tag:
+        response.set_etag(encoded_tag(tag, encoding))
+    return response
+
+
+def clear():
+    cache.clear()
@@ -0,0 +1,105 @@
+from flask import Request as BaseRequest, request
+from werkzeug.exceptions import BadRequest
+from decimal import Decimal
+import msgpack
+import cbor2
+import uuid
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+CBOR = 'application/cbor'
+
+# Media types of the responses, in order of preference when the client
+# accepts any of them.
+MEDIATYPES = [JSON, MSGPACK, CBOR]
+
+# Suffixes of the ETags, so that each representation has its own.
+TAG_SUFFIXES = {MSGPACK: 'msgpack', CBOR: 'cbor'}
+
+# MessagePack extension types. CBOR has standard tags for both (4 and 37).
+EXT_DECIMAL = 1
+EXT_UUID = 2
+
+# Bytes of a streamed CBOR response sent at once.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def msgpack_default(value):
+    if isinstance(value, Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(value).encode())
+    if isinstance(value, uuid.UUID):
+        return msgpack.ExtType(EXT_UUID, value.bytes)
+    raise TypeError('{!r} is not serializable to MessagePack'.format(value))
+
+
+def msgpack_ext_hook(code, data):
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == EXT_UUID:
+        return uuid.UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+def msgpack_dumps(data):
+    return msgpack.packb(data, default=msgpack_default, use_bin_type=True)
+
+
+def msgpack_loads(data):
+    return msgpack.unpackb(data, ext_hook=msgpack_ext_hook, raw=False)
+
+
+def cbor_dumps(data):
+    return cbor2.dumps(data)
+
+
+def cbor_loads(data):
+    return cbor2.loads(data)
+
+
+def cbor_array_stream(documents, chunk_size=STREAM_CHUNK_SIZE):
+    """Encode an iterable of documents as an indefinite length CBOR array, in
+    chunks of about `chunk_size` bytes."""
+    chunk = bytearray(b'\x9f')
+    for document in documents:
+        chunk += cbor2.dumps(document)
+        if len(chunk) >= chunk_size:
+            yield bytes(chunk)
+            chunk = bytearray()
+    chunk += b'\xff'
+    yield bytes(chunk)
+
+
+DECODERS = {
+    MSGPACK: msgpack_loads,
+    CBOR: cbor_loads,
+}
+
+
+def negotiate():
+    """Media type of the response, chosen like Flask-RESTful does."""
+    return request.accept_mimetypes.best_match(MEDIATYPES, default=JSON)
+
+
+def representation_tag(tag):
+    """ETag of the negotiated representation of a resource tagged `tag`."""
+    suffix = TAG_SUFFIXES.get(negotiate())
+    if suffix is None:
+        return tag
+    return '{}-{}'.format(tag, suffix)
+
+
+class Request(BaseRequest):
+    """Request decoding MessagePack and CBOR bodies like JSON ones, so that
+    `reqparse` and `get_json` work with any of them."""
+
+    def get_json(self, force=False, silent=False, cache=True):
+        decode = DECODERS.get(self.mimetype)
+        if decode is None:
+            return super().get_json(force=force, silent=silent, cache=cache)
+
+        try:
+            return decode(self.get_data(cache=cache))
+        except Exception:
+            if silent:
+                return None
+            raise BadRequest('Failed to decode the {} body'.format(self.mimetype))
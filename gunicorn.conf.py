@@ -0,0 +1,14 @@
+import tempfile
+import os
+
+
+def on_starting(server):
+    """Start with no metrics of a previous run. Several workers write their
+    metrics in a directory, by default a temporary one, for /metrics to sum
+    them: each only knows its own."""
+    import metrics
+
+    if not metrics.DIRECTORY and server.cfg.workers > 1:
+        metrics.DIRECTORY = os.path.join(tempfile.gettempdir(), 'ecommerce-metrics')
+    if metrics.DIRECTORY:
+        metrics.clear_directory()
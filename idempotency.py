@@ -0,0 +1,78 @@
+from flask import g, request
+from flask_restful.utils import unpack
+from http.client import BAD_REQUEST, UNPROCESSABLE_ENTITY
+from peewee import IntegrityError
+from models import IdempotencyKey
+import simplejson as json
+import functools
+import datetime
+import hashlib
+import os
+
+HEADER = 'Idempotency-Key'
+
+# How long a key and its response are kept, in seconds.
+TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def request_hash():
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.get_data()):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def replay(record):
+    return json.loads(record.response, use_decimal=True), record.status, {
+        'Idempotent-Replayed': 'true'}
+
+
+def idempotent(view):
+    """Store the response of `view` under the Idempotency-Key header sent by
+    the client, and return it again when the same request is retried with
+    the same key, without running `view`.
+
+    Must be applied inside `auth.login_required`, since keys belong to the
+    authenticated user.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+
+        if not key.strip() or len(key) > 255:
+            return {'message': 'Invalid {} header'.format(HEADER)}, BAD_REQUEST
+
+        digest = request_hash()
+        expired = datetime.datetime.utcnow() - datetime.timedelta(seconds=TTL)
+
+        with IdempotencyKey.atomic():
+            IdempotencyKey.delete().where(IdempotencyKey.created_at < expired).execute()
+
+            # Concurrent requests with the same key wait on the unique index
+            # until the first one is committed, with its response: a key
+            # found here always has one.
+            try:
+                with IdempotencyKey.atomic():
+                    record = IdempotencyKey.create(
+                        key=key, user=g.current_user.id, request_hash=digest)
+            except IntegrityError:
+                record = IdempotencyKey.get(
+                    IdempotencyKey.user == g.current_user.id, IdempotencyKey.key == key)
+
+                if record.request_hash != digest:
+                    return {'message': 'The key was used for a different request'}, \
+                        UNPROCESSABLE_ENTITY
+                return replay(record)
+
+            data, code, headers = unpack(view(*args, **kwargs))
+
+            record.status = code
+            record.response = json.dumps(data)
+            record.save()
+
+        return data, code, headers
+
+    return wrapper
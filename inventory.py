@@ -0,0 +1,38 @@
+from playhouse.shortcuts import case
+from models import Item
+import catalog
+import utils
+
+
+class OutOfStock(Exception):
+    """Some of the items don't have the requested availability."""
+
+
+def reserve(quantities):
+    """Take the given quantity out of the availability of each item id.
+
+    Every batch of items is updated by a single conditional statement, that
+    only touches the rows with enough availability left, so concurrent
+    reservations can't oversell. If any row is not updated the whole
+    reservation is rolled back and OutOfStock is raised. A negative quantity
+    gives stock back and always succeeds.
+    """
+    with Item.atomic():
+        for batch in utils.batches(list(quantities.items())):
+            amount = case(Item.id, batch)
+            updated = (
+                Item
+                .update(Item.changes(), availability=Item.availability - amount)
+                .where(Item.id << [item_id for item_id, _ in batch])
+                .where(Item.availability >= amount)
+                .execute())
+
+            if updated != len(batch):
+                raise OutOfStock('Some of the items are not available')
+
+            catalog.invalidate_ids(item_id for item_id, _ in batch)
+
+
+def release(quantities):
+    """Give back the given quantity of each item id."""
+    reserve({item_id: -quantity for item_id, quantity in quantities.items()})
@@ -1,21 +1,173 @@
-from flask import render_template
-import os
+from requests.adapters import HTTPAdapter
+from flask import current_app
+from models import Mail, User, database
+import simplejson as json
+import datetime
 import requests
+import metrics
+import utils
+import time
+import os
 
 KEY = os.getenv('MAILGUN_API_KEY')
 SANDBOX = os.getenv('MAILGUN_DOMAIN')
+API_URL = os.getenv('MAILGUN_API_URL', 'https://api.mailgun.net/v2')
+
+# Seconds to connect to the provider and to wait for its response.
+TIMEOUT = (3.05, 10)
+# Mails sent by the worker in a round.
+BATCH_SIZE = 50
+# A failed mail is retried after BACKOFF seconds, doubled at every attempt
+# up to MAX_BACKOFF, and given up after MAX_ATTEMPTS.
+BACKOFF = 30
+MAX_BACKOFF = 3600
+MAX_ATTEMPTS = 8
+# Seconds a mail taken by a worker is hidden from the others, longer than
+# the longest send allowed by TIMEOUT.
+LEASE = 120
+# Seconds the worker sleeps when there is nothing to send.
+POLL_INTERVAL = 5
+# Recipients of a bulk mail, the most accepted by Mailgun in a request.
+BULK_SIZE = 1000
 
 
 def send_email(sender, receiver, subject, template='default', **kwargs):
-    request_url = 'https://api.mailgun.net/v2/{0}/messages'.format(SANDBOX)
-
-    requests.post(
-        request_url,
-        auth=('api', KEY),
-        data={
-            'from': sender,
-            'to': receiver,
-            'subject': subject,
-            'html': render_template('mails/{}.html'.format(template), **kwargs)
-        }
+    """Queue a mail rendering `mails/<template>.html` with `kwargs`, which
+    must be serializable to JSON. The mail worker sends it."""
+    return Mail.create(
+        sender=sender,
+        receiver=receiver,
+        subject=subject,
+        template=template,
+        context=json.dumps(kwargs),
     )
+
+
+def send_bulk(sender, recipients, subject, template='default', **kwargs):
+    """Queue a mail to many recipients, one per `BULK_SIZE` of them.
+
+    `recipients` is an iterable of `(address, variables)` pairs, consumed
+    lazily. The variables of each recipient are replaced by the provider
+    where the rendered template contains `%recipient.<name>%`.
+    """
+    context = json.dumps(kwargs)
+    return [
+        Mail.create(
+            sender=sender,
+            recipients=json.dumps(dict(batch)),
+            subject=subject,
+            template=template,
+            context=context,
+        ) for batch in utils.batches(recipients, BULK_SIZE)]
+
+
+def user_recipients(query):
+    """Recipients of a bulk mail from a query of users, with their names."""
+    rows = query.select(User.email, User.first_name, User.last_name).tuples().iterator()
+    for email, first_name, last_name in rows:
+        yield email, {'first_name': first_name, 'last_name': last_name}
+
+
+def create_session():
+    """HTTP session reusing the connections to the provider."""
+    session = requests.Session()
+    session.auth = ('api', KEY)
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    return session
+
+
+def render(mail):
+    # Jinja keeps the compiled templates.
+    template = current_app.jinja_env.get_template('mails/{}.html'.format(mail.template))
+    return template.render(**json.loads(mail.context))
+
+
+def deliver(session, mail):
+    data = {
+        'from': mail.sender,
+        'to': mail.receiver,
+        'subject': mail.subject,
+        'html': render(mail),
+    }
+    if mail.recipients is not None:
+        recipients = json.loads(mail.recipients)
+        data['to'] = list(recipients)
+        data['recipient-variables'] = json.dumps(recipients)
+
+    resp = session.post(
+        '{}/{}/messages'.format(API_URL, SANDBOX), data=data, timeout=TIMEOUT)
+    resp.raise_for_status()
+
+
+def backoff(attempts):
+    return min(BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+def due(now):
+    """The mails due at `now`, in the order they should be sent."""
+    return list(Mail
+                .select()
+                .where(Mail.status == 'pending', Mail.next_attempt <= now)
+                .order_by(Mail.next_attempt, Mail.id)
+                .limit(BATCH_SIZE))
+
+
+def take(mail):
+    """Lease `mail` to this worker for the time of one send.
+
+    The mail is taken by moving its next attempt forward, conditioned on the
+    value read with it, so that concurrent workers never send it twice. The
+    lease starts right before the send, not at the start of the round, so
+    that a slow provider cannot make it expire while the mail is sent.
+    """
+    lease = datetime.datetime.utcnow() + datetime.timedelta(seconds=LEASE)
+    updated = (Mail
+               .update(next_attempt=lease)
+               .where(Mail.id == mail.id,
+                      Mail.status == 'pending',
+                      Mail.next_attempt == mail.next_attempt)
+               .execute())
+    return bool(updated)
+
+
+def send_pending(session):
+    """Send a round of the due mails and return how many were taken."""
+    now = datetime.datetime.utcnow()
+    taken = 0
+
+    for mail in due(now):
+        if not take(mail):
+            continue
+        taken += 1
+        mail.attempts += 1
+        try:
+            deliver(session, mail)
+        except Exception as err:
+            metrics.incr('mails_failed_total')
+            mail.last_error = str(err)
+            if mail.attempts >= MAX_ATTEMPTS:
+                mail.status = 'failed'
+            else:
+                mail.next_attempt = datetime.datetime.utcnow() + datetime.timedelta(
+                    seconds=backoff(mail.attempts))
+        else:
+            metrics.incr('mails_sent_total')
+            mail.status = 'sent'
+            mail.sent_at = datetime.datetime.utcnow()
+        mail.save()
+
+    return taken
+
+
+def run_worker(app):
+    session = create_session()
+    while True:
+        with app.app_context():
+            try:
+                taken = send_pending(session)
+            finally:
+                # Back to the pool between the rounds.
+                if not database.is_closed():
+                    database.close()
+        if not taken:
+            time.sleep(POLL_INTERVAL)
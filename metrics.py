@@ -0,0 +1,279 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import simplejson as json
+import threading
+import tempfile
+import time
+import os
+
+# Directory where each worker process writes its metrics, to be summed by
+# the one serving /metrics, emptied by `clear_directory` when the server
+# starts. Unset, only the metrics of the process are shown.
+DIRECTORY = os.getenv('METRICS_DIR')
+# Seconds between the writes of the metrics of a process.
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
+
+# Upper bounds of the buckets of the histograms, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10)
+
+# Counters of this process, keyed by name and labels.
+counters = Counter()
+# Values that go up and down, like the requests in progress.
+gauges = Counter()
+# Histograms, as the count of each bucket followed by the sum and the count.
+histograms = {}
+lock = threading.Lock()
+last_flush = 0.0
+# Pid and start time of this process, naming its file in DIRECTORY, so that
+# a new process with the pid of an exited one doesn't replace its metrics.
+process = None
+# Flush scheduled for the end of the interval, so that the metrics of an
+# idle process are written too.
+timer = None
+
+# Seconds spent by the current request of each thread, by name.
+local = threading.local()
+
+
+def key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def incr(name, value=1, **labels):
+    with lock:
+        counters[key(name, labels)] += value
+
+
+def get(name, **labels):
+    return counters[key(name, labels)]
+
+
+def add_gauge(name, value, **labels):
+    with lock:
+        gauges[key(name, labels)] += value
+
+
+def get_gauge(name, **labels):
+    return gauges[key(name, labels)]
+
+
+def observe(name, value, **labels):
+    with lock:
+        histogram = histograms.setdefault(key(name, labels), [0] * (len(BUCKETS) + 2))
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[index] += 1
+                break
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+def get_histogram(name, **labels):
+    """Count and sum of the values observed."""
+    histogram = histograms.get(key(name, labels))
+    if histogram is None:
+        return 0, 0
+    return histogram[-1], histogram[-2]
+
+
+def start_timings():
+    local.timings = Counter()
+
+
+def pop_timings():
+    timings = getattr(local, 'timings', Counter())
+    local.timings = None
+    return timings
+
+
+@contextmanager
+def timing(name):
+    """Add the seconds spent in the block to `name` in the timings of the
+    current request, if any."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = getattr(local, 'timings', None)
+        if timings is not None:
+            timings[name] += time.perf_counter() - start
+
+
+def reset():
+    with lock:
+        counters.clear()
+        gauges.clear()
+        histograms.clear()
+
+
+def snapshot():
+    with lock:
+        return {
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'gauges': [[name, labels, value] for (name, labels), value in gauges.items()],
+            'histograms': [
+                [name, labels, values] for (name, labels), values in histograms.items()],
+        }
+
+
+def flush_later(delay):
+    global timer
+    with lock:
+        if timer is not None and timer.pid == os.getpid():
+            return
+        timer = threading.Timer(delay, flush_scheduled)
+        timer.pid = os.getpid()
+        timer.daemon = True
+        timer.start()
+
+
+def flush_scheduled():
+    global timer
+    with lock:
+        timer = None
+    flush(force=True)
+
+
+def filename():
+    global process
+    if process is None or process[0] != os.getpid():
+        process = (os.getpid(), int(time.time() * 1e6))
+    return '{}-{}.json'.format(*process)
+
+
+def parse_filename(name):
+    """Pid and start time of the process of a file of DIRECTORY, or None."""
+    stem, extension = os.path.splitext(name)
+    pid, _, started = stem.partition('-')
+    if extension != '.json' or not pid.isdigit() or not started.isdigit():
+        return None
+    return int(pid), int(started)
+
+
+def clear_directory():
+    """Create DIRECTORY or delete the metrics in it, of a previous run."""
+    os.makedirs(DIRECTORY, exist_ok=True)
+    for name in os.listdir(DIRECTORY):
+        if parse_filename(name) is not None or name.startswith('.tmp'):
+            os.remove(os.path.join(DIRECTORY, name))
+
+
+def flush(force=False):
+    """Write the metrics of this process in DIRECTORY, at most once per
+    FLUSH_INTERVAL unless forced."""
+    global last_flush
+    if not DIRECTORY:
+        return
+
+    now = time.monotonic()
+    if not force and now - last_flush < FLUSH_INTERVAL:
+        flush_later(FLUSH_INTERVAL - (now - last_flush))
+        return
+    last_flush = now
+
+    data = json.dumps(snapshot())
+    descriptor, path = tempfile.mkstemp(dir=DIRECTORY, prefix='.tmp')
+    with os.fdopen(descriptor, 'w') as output:
+        output.write(data)
+    os.replace(path, os.path.join(DIRECTORY, filename()))
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def snapshots():
+    """Metrics of each process, with whether it is still running."""
+    if not DIRECTORY:
+        yield True, snapshot()
+        return
+
+    flush(force=True)
+    files = {}
+    for name in os.listdir(DIRECTORY):
+        parsed = parse_filename(name)
+        if parsed is not None:
+            files[name] = parsed
+
+    # Of the files of a pid, only the last started process may be running.
+    latest = {}
+    for pid, started in files.values():
+        latest[pid] = max(started, latest.get(pid, started))
+
+    for name, (pid, started) in files.items():
+        try:
+            with open(os.path.join(DIRECTORY, name)) as data:
+                data = json.load(data)
+        except (OSError, ValueError):
+            # Removed or being replaced meanwhile.
+            continue
+        running = started == latest[pid] and (pid == os.getpid() or alive(pid))
+        yield running, data
+
+
+def collect():
+    """Metrics of all the processes, summed: the counters and histograms of
+    the exited processes are kept, their gauges dropped."""
+    totals = {'counter': Counter(), 'gauge': Counter(), 'histogram': {}}
+
+    for running, data in snapshots():
+        for name, labels, value in data['counters']:
+            totals['counter'][key(name, dict(labels))] += value
+        if running:
+            for name, labels, value in data['gauges']:
+                totals['gauge'][key(name, dict(labels))] += value
+        for name, labels, values in data['histograms']:
+            histogram = totals['histogram'].setdefault(
+                key(name, dict(labels)), [0] * len(values))
+            for index, value in enumerate(values):
+                histogram[index] += value
+
+    return totals
+
+
+def format_labels(labels, **extra):
+    labels = list(labels) + sorted(extra.items())
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in labels))
+
+
+def exposition():
+    """All the metrics in the Prometheus text format."""
+    totals = collect()
+    lines = []
+
+    for kind in ('counter', 'gauge'):
+        series = defaultdict(list)
+        for (name, labels), value in totals[kind].items():
+            series[name].append((labels, value))
+        for name in sorted(series):
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, value in sorted(series[name]):
+                lines.append('{}{} {}'.format(name, format_labels(labels), value))
+
+    series = defaultdict(list)
+    for (name, labels), values in totals['histogram'].items():
+        series[name].append((labels, values))
+    for name in sorted(series):
+        lines.append('# TYPE {} histogram'.format(name))
+        for labels, values in sorted(series[name]):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    name, format_labels(labels, le=bound), cumulative))
+            lines.append('{}_bucket{} {}'.format(
+                name, format_labels(labels, le='+Inf'), values[-1]))
+            lines.append('{}_sum{} {}'.format(name, format_labels(labels), values[-2]))
+            lines.append('{}_count{} {}'.format(name, format_labels(labels), values[-1]))
+
+    return '\n'.join(lines) + '\n'
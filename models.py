@@ -1,32 +1,98 @@
-from peewee import Model, SqliteDatabase, PostgresqlDatabase, Check
+from peewee import Model, PostgresqlDatabase, Check
 from peewee import DecimalField, TextField, CharField
-from peewee import UUIDField, ForeignKeyField, IntegerField, BooleanField
+from peewee import UUIDField, ForeignKeyField, IntegerField, BooleanField, DateTimeField
+from playhouse.sqlite_ext import SqliteExtDatabase, FTS5Model, SearchField
+from playhouse.pool import PooledSqliteExtDatabase, PooledPostgresqlDatabase
 from schemas import ItemSchema, UserSchema, AddressSchema
-from schemas import OrderSchema, OrderItemSchema, FavoritesSchema
-from passlib.hash import pbkdf2_sha256
-from jsonschema import validate
+from schemas import OrderSchema, OrderItemSchema, FavoritesSchema, PictureSchema
+from serializers import RowSerializer
+from jsonschema import validators
 from marshmallow_jsonschema import JSONSchema
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qsl
+from collections import defaultdict
+import passwords
+import queries
+import replicas
+import datetime
 import uuid
 import os
 
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'dev')
 
+url_db = urlparse(os.getenv('DATABASE_URL', ''))
+
+# Each worker process keeps its own pool of connections, configured by the
+# query string of DATABASE_URL, e.g. postgres://...?max_connections=10.
+# max_connections=0 disables the pool.
+pool_options = dict(parse_qsl(url_db.query))
+POOL_MAX_CONNECTIONS = int(pool_options.get('max_connections', 20))
+# Seconds after which an idle connection is closed instead of reused.
+POOL_STALE_TIMEOUT = int(pool_options.get('stale_timeout', 300))
+# Seconds to wait for a free connection when all of them are in use.
+POOL_TIMEOUT = int(pool_options.get('pool_timeout', 10))
+
+
+def connect_database(database_class, pooled_class, name, **kwargs):
+    if not POOL_MAX_CONNECTIONS:
+        return queries.instrumented(database_class)(name, **kwargs)
+
+    return queries.instrumented(pooled_class)(
+        name,
+        max_connections=POOL_MAX_CONNECTIONS,
+        stale_timeout=POOL_STALE_TIMEOUT,
+        timeout=POOL_TIMEOUT,
+        **kwargs
+    )
+
+
 database = ''
 
 if ENVIRONMENT == 'dev':
-    database = SqliteDatabase('database.db')
+    database = connect_database(
+        SqliteExtDatabase, PooledSqliteExtDatabase, 'database.db',
+        # Pooled connections are handed to whichever thread asks next.
+        check_same_thread=False,
+    )
 else:
-    url_db = urlparse(os.getenv('DATABASE_URL'))
-
-    database = PostgresqlDatabase(
+    database = connect_database(
+        PostgresqlDatabase, PooledPostgresqlDatabase,
         url_db.path[1:],
         user=url_db.username,
         password=url_db.password,
         host=url_db.hostname,
+        port=url_db.port,
+    )
+
+# Read-only replicas, a comma separated list of SQLite files in development
+# or of Postgres URLs, sharing the pool options of DATABASE_URL.
+REPLICA_URLS = [url for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url]
+
+
+def connect_replica(url):
+    if ENVIRONMENT == 'dev':
+        return connect_database(
+            SqliteExtDatabase, PooledSqliteExtDatabase, url, check_same_thread=False)
+
+    url = urlparse(url)
+    return connect_database(
+        PostgresqlDatabase, PooledPostgresqlDatabase,
+        url.path[1:],
+        user=url.username,
+        password=url.password,
+        host=url.hostname,
+        port=url.port,
     )
 
 
+replicas.databases.extend(connect_replica(url) for url in REPLICA_URLS)
+
+# Validator of the JSON Schema of each model, built once per process.
+json_validators = {}
+
+# Serializer of each model, built once per process.
+row_serializers = {}
+
+
 class BaseModel(Model):
     class Meta:
         database = database
@@ -35,19 +101,53 @@ class BaseModel(Model):
         cls = type(self)
         return cls.get(cls.id == self.id)
 
+    @classmethod
+    def select(cls, *selection):
+        query = super().select(*selection)
+        replica = replicas.replica_for(cls._meta.database)
+        if replica is not None:
+            query.database = replica
+        return query
+
+    @classmethod
+    def atomic(cls):
+        return cls._meta.database.atomic()
+
     @classmethod
     def get_schema(cls):
         raise NotImplementedError
 
+    @classmethod
+    def get_validator(cls):
+        try:
+            return json_validators[cls]
+        except KeyError:
+            json_schema = JSONSchema().dump(cls.get_schema()).data
+            validator_class = validators.validator_for(json_schema)
+            validator_class.check_schema(json_schema)
+            return json_validators.setdefault(cls, validator_class(json_schema))
+
     @classmethod
     def verify_json(cls, json):
-        schema = cls.get_schema()
-        json_schema = JSONSchema().dump(schema).data
-        validate(json, json_schema)
+        cls.get_validator().validate(json)
+
+    @classmethod
+    def get_serializer(cls):
+        try:
+            return row_serializers[cls]
+        except KeyError:
+            return row_serializers.setdefault(cls, RowSerializer(cls))
 
     def json(self):
-        schema = self.get_schema()
-        return schema.dump(self).data
+        return self.get_serializer().dump(self)
+
+    @classmethod
+    def serialize_many(cls, query=None):
+        """Serialize all the rows of `query` (by default the whole table) in
+        one go, with the same output of calling `json()` on each of them."""
+        if query is None:
+            query = cls.select()
+        return cls.get_serializer().dump_many(query)
 
     @classmethod
     def count(cls):
@@ -61,11 +161,45 @@ class Item(BaseModel):
     description = TextField()
     category = CharField()
     availability = IntegerField(constraints=[Check('availability >= 0')])
+    # Changed with every update of the item or of its pictures, to tell the
+    # clients when their cached copies are stale. Not part of the schema.
+    version = IntegerField(default=1)
+    updated_at = DateTimeField(default=datetime.datetime.utcnow)
 
     @classmethod
     def get_schema(cls):
         return ItemSchema()
 
+    @classmethod
+    def changes(cls):
+        """Values of an update query marking the items as changed."""
+        return {cls.version: cls.version + 1, cls.updated_at: datetime.datetime.utcnow()}
+
+    def update_changed(self, **values):
+        """Write `values` to the item and return it as stored.
+
+        The version is incremented by the database, so that concurrent
+        updates never give the same version to different contents. Run it in
+        a transaction, for the returned item to be the one just written.
+        """
+        Item.update(Item.changes(), **values).where(Item.id == self.id).execute()
+        return self.reload()
+
+
+class ItemIndex(FTS5Model):
+    """Full-text index of the catalog, used on SQLite only.
+
+    The rowid of each entry is the id of the indexed item. On Postgres the
+    search runs on a GIN expression index over the item table instead.
+    """
+    name = SearchField()
+    description = SearchField()
+    category = SearchField()
+
+    class Meta:
+        database = database
+        extension_options = {'tokenize': 'porter unicode61'}
+
 
 class User(BaseModel):
     uuid = UUIDField(unique=True)
@@ -76,16 +210,42 @@ class User(BaseModel):
     superuser = BooleanField(default=False)
     status = CharField(default='enable', constraints=[Check(
         "status IN ('deleted','blocked','enable')")])
+    # Bumped when the password or the status change, to end the sessions.
+    session_version = IntegerField(default=0)
 
     @classmethod
     def get_schema(cls):
         return UserSchema()
 
     def verify_password(self, origin_password):
-        return pbkdf2_sha256.verify(origin_password, self.password)
+        valid, new_hash = passwords.verify_password(origin_password, self.password)
+        if valid and new_hash:
+            self.password = new_hash
+            User.update(password=new_hash).where(User.id == self.id).execute()
+        return valid
 
     def favorite_items(self):
-        return [favorite.item.json() for favorite in self.favorites]
+        return Item.serialize_many(
+            Item.select().join(Favorites).where(Favorites.user == self).order_by(Favorites.id))
+
+    def iter_favorite_items(self, size=1000):
+        """Yield the same documents of `favorite_items`, serializing `size`
+        favorites at a time."""
+        favorites = (
+            Favorites.select(Favorites.id).where(Favorites.user == self).order_by(Favorites.id))
+        last_id = 0
+        while True:
+            ids = [favorite_id for favorite_id, in
+                   favorites.where(Favorites.id > last_id).limit(size).tuples()]
+            if not ids:
+                return
+
+            yield from Item.serialize_many(
+                Item.select().join(Favorites).where(Favorites.id << ids).order_by(Favorites.id))
+
+            if len(ids) < size:
+                return
+            last_id = ids[-1]
 
     def add_favorite(self, item):
         favorite = Favorites.create(
@@ -123,6 +283,41 @@ class Order(BaseModel):
     def get_schema(cls):
         return OrderSchema()
 
+    def json(self):
+        return self.serialize_many(Order.select().where(Order.id == self.id))[0]
+
+    @classmethod
+    def serialize_many(cls, query=None):
+        """Serialize the orders of `query` with their line items in two
+        queries, whatever the number of orders and lines."""
+        if query is None:
+            query = cls.select()
+
+        user = User.alias()
+        orders = list(
+            query.switch(cls)
+            .join(user, on=(cls.user == user.id))
+            .select(cls.id, cls.uuid, cls.total_price, user.uuid)
+            .tuples())
+        if not orders:
+            return []
+
+        lines = defaultdict(list)
+        order_items = (
+            OrderItem.select()
+            .where(OrderItem.order << query.select(cls.id))
+            .order_by(OrderItem.id))
+        for order_id, line in OrderItem.get_serializer().dump_many(
+                order_items, key=OrderItem.order):
+            lines[order_id].append(line)
+
+        return [{
+            'uuid': str(order_uuid),
+            'total_price': total_price,
+            'user': {'uuid': str(user_uuid)},
+            'items': lines[order_id],
+        } for order_id, order_uuid, total_price, user_uuid in orders]
+
 
 class OrderItem(BaseModel):
     order = ForeignKeyField(Order, related_name="order_items")
@@ -141,12 +336,9 @@ class Picture(BaseModel):
     extension = CharField()
     item = ForeignKeyField(Item, related_name="pictures")
 
-    def json(self):
-        return {
-            'uuid': str(self.uuid),
-            'title': self.title,
-            'extension': self.extension,
-        }
+    @classmethod
+    def get_schema(cls):
+        return PictureSchema()
 
 
 class Favorites(BaseModel):
@@ -164,3 +356,51 @@ class Favorites(BaseModel):
             'user': str(self.user.uuid),
             'item': str(self.item.uuid)
         }
+
+
+class IdempotencyKey(BaseModel):
+    key = CharField(max_length=255)
+    user = ForeignKeyField(User, related_name="idempotency_keys")
+    request_hash = CharField()
+    status = IntegerField(null=True)
+    response = TextField(null=True)
+    created_at = DateTimeField(default=datetime.datetime.utcnow, index=True)
+
+    class Meta:
+        indexes = (
+            (('user', 'key'), True),
+        )
+
+
+class Mail(BaseModel):
+    """Outbox of the emails, sent by the mail worker.
+
+    A bulk mail has no receiver: it goes to all the addresses of its
+    `recipients`, a JSON object of the variables of each address.
+    """
+    sender = CharField()
+    receiver = CharField(null=True)
+    recipients = TextField(null=True)
+    subject = CharField()
+    template = CharField()
+    # JSON object of the variables of the template.
+    context = TextField()
+    status = CharField(default='pending', constraints=[Check(
+        "status IN ('pending','sent','failed')")])
+    attempts = IntegerField(default=0)
+    next_attempt = DateTimeField(default=datetime.datetime.utcnow)
+    last_error = TextField(null=True)
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    sent_at = DateTimeField(null=True)
+
+    class Meta:
+        indexes = (
+            (('status', 'next_attempt'), False),
+        )
+
+
+def compile_validators():
+    """Build the validators of all the models with a schema, so that the
+    first requests don't pay for it."""
+    for model in (Item, User, Address, Order, OrderItem, Favorites):
+        model.get_validator()
@@ -0,0 +1,179 @@
+from playhouse.shortcuts import case
+from models import Item, Order, OrderItem
+import inventory
+import utils
+import uuid
+
+
+class OrderError(Exception):
+    """The requested line items can't be ordered."""
+
+
+def parse_lines(lines):
+    """Map the uuid of each requested item to its quantity.
+
+    `lines` is the list of `[item uuid, quantity]` pairs sent by the client.
+    """
+    if not isinstance(lines, list) or not lines:
+        raise OrderError('The order has no items')
+
+    quantities = {}
+    for line in lines:
+        try:
+            item_uuid, quantity = line
+            item_uuid = uuid.UUID(str(item_uuid))
+        except (TypeError, ValueError):
+            raise OrderError('Malformed order line {}'.format(line))
+
+        # JSON `true` is a bool, and so an int, in Python.
+        if (not isinstance(quantity, int) or isinstance(quantity, bool)
+                or quantity <= 0):
+            raise OrderError('Invalid quantity for item {}'.format(item_uuid))
+        if item_uuid in quantities:
+            raise OrderError('Item {} is repeated'.format(item_uuid))
+
+        quantities[item_uuid] = quantity
+
+    return quantities
+
+
+def fetch_items(quantities):
+    """Load in a single query the items of the order lines."""
+    items = list(Item.select().where(Item.uuid << list(quantities)))
+    if len(items) != len(quantities):
+        raise OrderError('Some of the items do not exist')
+
+    return items
+
+
+def check_availability(items, deltas):
+    """Fail early, before writing anything, when the items loaded don't
+    have enough availability. The reservation checks it again on the
+    current rows."""
+    for item in items:
+        if deltas.get(item.id, 0) > item.availability:
+            raise OrderError('Item {} is not available'.format(item.uuid))
+
+
+def total_price(items, quantities):
+    return sum(float(item.price * quantities[item.uuid]) for item in items)
+
+
+def add_lines(order, items, quantities):
+    rows = [{
+        'order': order.id,
+        'item': item.id,
+        'quantity': quantities[item.uuid],
+        'subtotal': float(item.price * quantities[item.uuid]),
+    } for item in items]
+
+    for batch in utils.batches(rows):
+        OrderItem.insert_many(batch).execute()
+
+
+def reserve(deltas):
+    try:
+        inventory.reserve(deltas)
+    except inventory.OutOfStock as err:
+        raise OrderError(str(err))
+
+
+def place_order(user, lines):
+    quantities = parse_lines(lines)
+    items = fetch_items(quantities)
+    deltas = {item.id: quantities[item.uuid] for item in items}
+    check_availability(items, deltas)
+
+    with Order.atomic():
+        order = Order.create(
+            uuid=uuid.uuid4(),
+            total_price=total_price(items, quantities),
+            user=user.id,
+        )
+        add_lines(order, items, quantities)
+        reserve(deltas)
+
+    return order
+
+
+def update_order(order, lines):
+    """Bring the line items of `order` to `lines`.
+
+    The new lines are compared with the stored ones: added lines are
+    inserted, removed lines deleted and changed quantities updated, each
+    with a statement per batch, and the stock of each item moves only by
+    the difference between the new and the old quantity. Added and changed
+    lines are priced at the current price of their item, the others keep
+    their subtotal, and the total is the sum of the subtotals.
+    """
+    quantities = parse_lines(lines)
+    items = fetch_items(quantities)
+
+    with Order.atomic():
+        previous = {
+            item_id: (line_id, quantity, subtotal)
+            for line_id, item_id, quantity, subtotal in (
+                OrderItem
+                .select(OrderItem.id, OrderItem.item, OrderItem.quantity, OrderItem.subtotal)
+                .where(OrderItem.order == order.id)
+                .tuples())}
+
+        deltas = {}
+        added = []
+        changed = []
+        total = 0
+        for item in items:
+            quantity = quantities[item.uuid]
+            if item.id not in previous:
+                added.append(item)
+                deltas[item.id] = quantity
+            else:
+                line_id, old_quantity, subtotal = previous.pop(item.id)
+                if quantity != old_quantity:
+                    changed.append((line_id, item))
+                    deltas[item.id] = quantity - old_quantity
+                else:
+                    total += float(subtotal)
+
+        # The items left in `previous` are not in the order anymore.
+        for item_id, (_, old_quantity, _) in previous.items():
+            deltas[item_id] = -old_quantity
+
+        check_availability(items, deltas)
+        reserve(deltas)
+
+        removed = [line_id for line_id, _, _ in previous.values()]
+        for batch in utils.batches(removed):
+            OrderItem.delete().where(OrderItem.id << batch).execute()
+
+        add_lines(order, added, quantities)
+
+        for batch in utils.batches(changed):
+            (OrderItem
+             .update(
+                 quantity=case(OrderItem.id, [
+                     (line_id, quantities[item.uuid]) for line_id, item in batch]),
+                 subtotal=case(OrderItem.id, [
+                     (line_id, float(item.price * quantities[item.uuid]))
+                     for line_id, item in batch]))
+             .where(OrderItem.id << [line_id for line_id, _ in batch])
+             .execute())
+
+        total += total_price(added + [item for _, item in changed], quantities)
+        order.total_price = total
+        order.save()
+
+    return order
+
+
+def cancel_order(order):
+    with Order.atomic():
+        lines = (
+            OrderItem
+            .select(OrderItem.item, OrderItem.quantity)
+            .where(OrderItem.order == order.id)
+            .tuples())
+        inventory.release(dict(lines))
+
+        OrderItem.delete().where(OrderItem.order == order.id).execute()
+        order.delete_instance()
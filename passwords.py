@@ -0,0 +1,160 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.exceptions import ServiceUnavailable
+from passlib.context import CryptContext
+import threading
+import tempfile
+import metrics
+import sqlite3
+import time
+import os
+
+# PBKDF2 rounds of the new hashes. Hashes with fewer rounds are upgraded
+# on the next successful login.
+ROUNDS = int(os.getenv('PASSWORD_ROUNDS', 29000))
+
+# Hashing runs in a pool of processes of each worker, so that it doesn't
+# hold the request threads; PASSWORD_POOL_SIZE=0 hashes inline instead.
+POOL_SIZE = int(os.getenv('PASSWORD_POOL_SIZE', 2))
+# Hashes waiting for a free process before the next ones are refused.
+QUEUE_SIZE = int(os.getenv('PASSWORD_QUEUE_SIZE', 8))
+# Hashes running or waiting on the machine. They are counted in a SQLite
+# file shared by the workers: a sync worker serves a request at a time, so
+# it would never fill a bound of its own.
+SLOTS = POOL_SIZE + QUEUE_SIZE
+PATH = os.getenv(
+    'PASSWORD_DATABASE', os.path.join(tempfile.gettempdir(), 'ecommerce-passwords.db'))
+# Seconds after which a slot is given back, should its worker die while
+# hashing.
+LEASE = 60
+# Seconds to wait for a hash.
+TIMEOUT = float(os.getenv('PASSWORD_TIMEOUT', 5))
+# Seconds the clients are asked to wait when the pool is busy.
+RETRY_AFTER = 1
+
+context = CryptContext(
+    schemes=['pbkdf2_sha256'],
+    pbkdf2_sha256__default_rounds=ROUNDS,
+    pbkdf2_sha256__min_rounds=ROUNDS,
+)
+
+executor = None
+executor_pid = None
+executor_lock = threading.Lock()
+local = threading.local()
+
+
+class Busy(ServiceUnavailable):
+    """Too many passwords are being hashed, the client should retry later."""
+    description = 'Too many requests are being authenticated, retry later.'
+
+    def get_headers(self, environ=None):
+        return super().get_headers(environ) + [('Retry-After', str(RETRY_AFTER))]
+
+
+def connection():
+    if getattr(local, 'key', None) != (PATH, os.getpid()):
+        local.connection = sqlite3.connect(PATH, timeout=10, isolation_level=None)
+        local.connection.execute(
+            'CREATE TABLE IF NOT EXISTS slot '
+            '(id INTEGER PRIMARY KEY AUTOINCREMENT, taken REAL NOT NULL)')
+        local.key = (PATH, os.getpid())
+    return local.connection
+
+
+def acquire():
+    """Take one of the SLOTS of the machine, or return None when they are
+    all taken."""
+    db = connection()
+    now = time.time()
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        db.execute('DELETE FROM slot WHERE taken < ?', (now - LEASE,))
+        taken, = db.execute('SELECT COUNT(*) FROM slot').fetchone()
+        slot = None
+        if taken < SLOTS:
+            slot = db.execute('INSERT INTO slot (taken) VALUES (?)', (now,)).lastrowid
+        db.execute('COMMIT')
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+
+    return slot
+
+
+def release(slot):
+    connection().execute('DELETE FROM slot WHERE id = ?', (slot,))
+
+
+def reset():
+    connection().execute('DELETE FROM slot')
+
+
+def get_executor():
+    global executor, executor_pid
+
+    # A pool created before forking the workers is not usable by them.
+    with executor_lock:
+        if executor is None or executor_pid != os.getpid():
+            executor = ProcessPoolExecutor(POOL_SIZE)
+            executor_pid = os.getpid()
+        return executor
+
+
+def discard_executor(broken):
+    """Drop a pool that lost a process, e.g. killed when out of memory, so
+    that the next hash starts a new one."""
+    global executor
+    with executor_lock:
+        if executor is broken:
+            executor = None
+    broken.shutdown(wait=False)
+    metrics.incr('password_pools_broken_total')
+
+
+def run(function, *args):
+    if not POOL_SIZE:
+        return function(*args)
+
+    slot = acquire()
+    if slot is None:
+        metrics.incr('password_hashes_rejected_total')
+        raise Busy()
+
+    pool = get_executor()
+    try:
+        future = pool.submit(function, *args)
+        return future.result(timeout=TIMEOUT)
+    except TimeoutError:
+        metrics.incr('password_hashes_timed_out_total')
+        # The slot is taken until the hash is over, even after a timeout.
+        future.add_done_callback(lambda _, slot=slot: release(slot))
+        slot = None
+        raise Busy()
+    except BrokenProcessPool:
+        discard_executor(pool)
+        raise Busy()
+    finally:
+        if slot is not None:
+            release(slot)
+
+
+def _hash(password):
+    return context.hash(password)
+
+
+def _verify(password, hashed):
+    return context.verify_and_update(password, hashed)
+
+
+def hash_password(password):
+    with metrics.timing('password_hash'):
+        return run(_hash, password)
+
+
+def verify_password(password, hashed):
+    """Return whether `password` matches `hashed`, and the new hash to
+    store in its place when it is out of date, or None."""
+    with metrics.timing('password_hash'):
+        return run(_verify, password, hashed)
@@ -0,0 +1,96 @@
+from flask import g, has_request_context
+from collections import Counter
+from contextlib import contextmanager
+import threading
+import time
+import re
+import os
+
+# Statements of the same shape run this many times by a request are flagged
+# as a probable N+1.
+REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', 5))
+
+# Recorders opened with `recording` in each thread.
+local = threading.local()
+
+# Placeholders of the lists of values, e.g. of `IN (?, ?, ?)`.
+PLACEHOLDERS = re.compile(r'(\?|%s)(\s*,\s*(\?|%s))+')
+
+
+def shape(sql):
+    """The statement with its lists of placeholders collapsed, so that the
+    same query with any number of values has the same shape."""
+    return PLACEHOLDERS.sub(r'\1', sql)
+
+
+class Recorder:
+    """Statements run while recording, with their duration in seconds."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __len__(self):
+        return len(self.statements)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.statements)
+
+    def repeated(self, threshold=None):
+        """Shapes run at least `threshold` times, with their count."""
+        if threshold is None:
+            threshold = REPEAT_THRESHOLD
+        shapes = Counter(shape(sql) for sql, _ in self.statements)
+        return [(sql, count) for sql, count in shapes.most_common() if count >= threshold]
+
+
+def recorders():
+    active = list(getattr(local, 'recorders', ()))
+    if has_request_context() and 'queries' in g:
+        active.append(g.queries)
+    return active
+
+
+def record(sql, duration):
+    for recorder in recorders():
+        recorder.statements.append((sql, duration))
+
+
+@contextmanager
+def recording():
+    """Record the statements run by this thread in the block."""
+    recorder = Recorder()
+    stack = local.__dict__.setdefault('recorders', [])
+    stack.append(recorder)
+    try:
+        yield recorder
+    finally:
+        stack.remove(recorder)
+
+
+def start_request():
+    g.queries = Recorder()
+
+
+class QueryCounterMixin:
+    """Database mixin recording every statement it runs."""
+
+    def execute_sql(self, sql, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute_sql(sql, *args, **kwargs)
+        finally:
+            record(sql, time.perf_counter() - start)
+
+
+# Instrumented subclass of each database class, built once.
+instrumented_classes = {}
+
+
+def instrumented(database_class):
+    """Subclass of `database_class` recording its statements."""
+    try:
+        return instrumented_classes[database_class]
+    except KeyError:
+        return instrumented_classes.setdefault(database_class, type(
+            'Instrumented' + database_class.__name__, (QueryCounterMixin, database_class), {}))
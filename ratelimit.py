@@ -0,0 +1,211 @@
+from werkzeug.exceptions import TooManyRequests
+from collections import namedtuple
+from flask import g, request
+from models import ENVIRONMENT
+import functools
+import tempfile
+import threading
+import sqlite3
+import random
+import math
+import time
+import os
+
+# The buckets live in a SQLite file, so that all the workers of a machine
+# share the same budget.
+PATH = os.getenv(
+    'RATELIMIT_DATABASE', os.path.join(tempfile.gettempdir(), 'ecommerce-ratelimit.db'))
+
+# Number of proxies in front of the app appending the client address to
+# X-Forwarded-For: by default none in development, and the router of
+# Heroku otherwise. Counting the proxy as the client would give all the
+# clients the same buckets.
+PROXIES = int(os.getenv('RATELIMIT_PROXIES', 0 if ENVIRONMENT == 'dev' else 1))
+
+
+class Limit(namedtuple('Limit', ['requests', 'period'])):
+    """Up to `requests` in a burst, refilled over `period` seconds."""
+
+    @classmethod
+    def parse(cls, value):
+        requests, period = value.split('/')
+        return cls(int(requests), float(period))
+
+    @property
+    def rate(self):
+        return self.requests / self.period
+
+
+# Limits of each class of routes, overridden by RATELIMIT_<CLASS>=<requests>/<seconds>.
+LIMITS = {
+    # Sign ups, by client address.
+    'signup': Limit(10, 60),
+    # Orders placed, by user.
+    'orders': Limit(30, 60),
+    # Password checks of the credentials not in the cache of auth, by address.
+    'login': Limit(60, 60),
+    # Wrong credentials, by address.
+    'failed_login': Limit(5, 300),
+}
+for name in LIMITS:
+    if os.getenv('RATELIMIT_' + name.upper()):
+        LIMITS[name] = Limit.parse(os.getenv('RATELIMIT_' + name.upper()))
+
+# Share of the updates that also delete the full buckets.
+PURGE_PROBABILITY = 0.01
+
+
+class Bucket(namedtuple('Bucket', ['limit', 'tokens'])):
+    @property
+    def remaining(self):
+        return int(self.tokens)
+
+    @property
+    def reset(self):
+        """Seconds until the bucket is full again."""
+        return math.ceil((self.limit.requests - self.tokens) / self.limit.rate)
+
+    @property
+    def retry_after(self):
+        """Seconds until the next request is allowed."""
+        return max(1, math.ceil((1 - self.tokens) / self.limit.rate))
+
+
+class RateLimited(TooManyRequests):
+    description = 'Too many requests, retry later.'
+
+    def __init__(self, bucket):
+        super().__init__()
+        self.bucket = bucket
+
+    def get_headers(self, environ=None):
+        return super().get_headers(environ) + [('Retry-After', str(self.bucket.retry_after))]
+
+
+local = threading.local()
+
+
+def connection():
+    if getattr(local, 'key', None) != (PATH, os.getpid()):
+        local.connection = sqlite3.connect(PATH, timeout=10, isolation_level=None)
+        local.connection.execute(
+            'CREATE TABLE IF NOT EXISTS bucket '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+        local.key = (PATH, os.getpid())
+    return local.connection
+
+
+def refilled(row, limit, now):
+    """Tokens of the bucket read as `row`, refilled since its last update."""
+    if row is None:
+        return limit.requests
+    tokens, updated = row
+    return min(limit.requests, tokens + (now - updated) * limit.rate)
+
+
+def take(key, limit, cost=1):
+    """Take `cost` tokens from the bucket `key`, refilled since its last
+    update. Return the bucket and whether there were enough tokens: when
+    there were not, nothing is taken."""
+    db = connection()
+    now = time.time()
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        row = db.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+        tokens = refilled(row, limit, now)
+        taken = tokens >= cost
+        if taken:
+            tokens -= cost
+
+        db.execute(
+            'INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)',
+            (key, tokens, now))
+        if random.random() < PURGE_PROBABILITY:
+            longest = max(each.period for each in LIMITS.values())
+            db.execute('DELETE FROM bucket WHERE updated < ?', (now - longest,))
+        db.execute('COMMIT')
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+
+    return Bucket(limit, tokens), taken
+
+
+def peek(key, limit):
+    """The bucket `key`, refilled since its last update, read without
+    locking the file for writing."""
+    row = connection().execute(
+        'SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+    return Bucket(limit, refilled(row, limit, time.time()))
+
+
+def reset():
+    connection().execute('DELETE FROM bucket')
+
+
+def client_address():
+    forwarded = request.headers.get('X-Forwarded-For')
+    if PROXIES and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        return addresses[-min(PROXIES, len(addresses))]
+    return request.remote_addr
+
+
+def client_key():
+    user = g.get('current_user')
+    if user is not None:
+        return 'user:{}'.format(user.id)
+    return 'address:{}'.format(client_address())
+
+
+def track(bucket):
+    """Keep the bucket with the fewest tokens left for the headers."""
+    if 'ratelimit' not in g or bucket.tokens < g.ratelimit.tokens:
+        g.ratelimit = bucket
+
+
+def bucket_key(route_class, key):
+    return '{}:{}'.format(route_class, key or client_key())
+
+
+def hit(route_class, key=None):
+    """Count a request of `route_class` by the client, failing with 429
+    when its bucket is empty."""
+    bucket, taken = take(bucket_key(route_class, key), LIMITS[route_class])
+    track(bucket)
+    if not taken:
+        raise RateLimited(bucket)
+
+
+def check(route_class, key=None):
+    """Fail with 429 if the bucket of the client is empty, without taking
+    anything from it."""
+    bucket = peek(bucket_key(route_class, key), LIMITS[route_class])
+    track(bucket)
+    if bucket.tokens < 1:
+        raise RateLimited(bucket)
+
+
+def limit(route_class):
+    """Rate limit the view by user, or by client address for anonymous
+    requests. Applied below `login_required` to count by user."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            hit(route_class)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def headers():
+    bucket = g.get('ratelimit')
+    if bucket is None:
+        return []
+
+    return [
+        ('RateLimit-Limit', str(bucket.limit.requests)),
+        ('RateLimit-Remaining', str(bucket.remaining)),
+        ('RateLimit-Reset', str(bucket.reset)),
+    ]
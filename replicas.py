@@ -0,0 +1,112 @@
+from flask import g, has_request_context
+from contextlib import contextmanager
+import functools
+import itertools
+import threading
+import tempfile
+import sqlite3
+import random
+import time
+import os
+
+# Read-only replicas of the database, filled by `models` from
+# DATABASE_REPLICA_URLS.
+databases = []
+
+# Seconds after a write of a user during which their reads stay on the
+# primary, as the replicas may not have caught up with it yet.
+READ_YOUR_WRITES_WINDOW = float(os.getenv('REPLICA_READ_YOUR_WRITES_WINDOW', 5))
+
+# The time of the last write of each user lives in a SQLite file, so that
+# the reads following a write stay on the primary whichever worker serves
+# them.
+PATH = os.getenv(
+    'REPLICA_WRITES_DATABASE', os.path.join(tempfile.gettempdir(), 'ecommerce-writes.db'))
+
+# Share of the writes that also delete the ones older than the window.
+PURGE_PROBABILITY = 0.01
+
+requests_count = itertools.count()
+
+local = threading.local()
+
+
+def read_only(view):
+    """Let the selects of the view run on a replica.
+
+    Applied below `login_required`, so that the user is always loaded
+    from the primary.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def on_primary():
+    """Run the selects of the block on the primary, even in a read-only
+    view, e.g. to fill a cache that must not keep stale rows."""
+    if not has_request_context():
+        yield
+        return
+
+    read_only = g.get('read_only', False)
+    g.read_only = False
+    try:
+        yield
+    finally:
+        g.read_only = read_only
+
+
+def connection():
+    if getattr(local, 'key', None) != (PATH, os.getpid()):
+        local.connection = sqlite3.connect(PATH, timeout=10, isolation_level=None)
+        local.connection.execute(
+            'CREATE TABLE IF NOT EXISTS write '
+            '(user_id INTEGER PRIMARY KEY, time REAL NOT NULL)')
+        local.key = (PATH, os.getpid())
+    return local.connection
+
+
+def record_write(user_id):
+    if not databases:
+        return
+
+    db = connection()
+    now = time.time()
+    db.execute('INSERT OR REPLACE INTO write (user_id, time) VALUES (?, ?)', (user_id, now))
+    if random.random() < PURGE_PROBABILITY:
+        db.execute('DELETE FROM write WHERE time < ?', (now - READ_YOUR_WRITES_WINDOW,))
+
+
+def recently_wrote(user_id):
+    row = connection().execute('SELECT time FROM write WHERE user_id = ?', (user_id,)).fetchone()
+    return row is not None and time.time() - row[0] < READ_YOUR_WRITES_WINDOW
+
+
+def reset():
+    connection().execute('DELETE FROM write')
+
+
+def replica_for(primary):
+    """The replica to run a select on instead of `primary`, or None.
+
+    Selects go to a replica only in read-only views, outside of any
+    transaction of the primary, and when the current user didn't write
+    anything lately. All the selects of a request use the same replica.
+    """
+    if not databases or not has_request_context() or not g.get('read_only'):
+        return None
+
+    if primary.transaction_depth():
+        return None
+
+    user = g.get('current_user')
+    if user is not None and recently_wrote(user.id):
+        return None
+
+    if 'replica' not in g:
+        g.replica = databases[next(requests_count) % len(databases)]
+    return g.replica
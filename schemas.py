@@ -51,3 +51,9 @@ class FavoritesSchema(Schema):
     uuid = fields.UUID(dump_only=True)
     user = fields.UUID(required=True, attribute='user.uuid')
     item = fields.UUID(required=True, attribute='item.uuid')
+
+
+class PictureSchema(Schema):
+    uuid = fields.UUID(dump_only=True)
+    title = fields.Str(required=True, validate=check_empty_str)
+    extension = fields.Str(required=True, validate=check_empty_str)
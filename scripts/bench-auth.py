@@ -0,0 +1,60 @@
+from models import User, Order, OrderItem
+from playhouse.sqlite_ext import SqliteExtDatabase
+from views.user import crypt_password
+from tempfile import mkdtemp
+import app as application
+import argparse
+import base64
+import shutil
+import time
+import uuid
+import auth
+import os
+
+MODELS = [User, Order, OrderItem]
+EMAIL = 'bench@domain.com'
+PASSWORD = 'p4ssw0rd'
+
+
+def requests_per_second(client, number):
+    headers = {'Authorization': 'Basic ' + base64.b64encode(
+        '{}:{}'.format(EMAIL, PASSWORD).encode()).decode()}
+
+    start = time.perf_counter()
+    for _ in range(number):
+        resp = client.get('/orders/?limit=1', headers=headers)
+        assert resp.status_code == 200
+    return number / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure requests/sec of an authenticated GET /orders/ '
+                    'with and without the cache of the authenticated users.')
+    parser.add_argument('--number', type=int, default=500)
+    args = parser.parse_args()
+
+    temp_dir = mkdtemp()
+    try:
+        database = SqliteExtDatabase(os.path.join(temp_dir, 'bench.db'))
+        for model in MODELS:
+            model._meta.database = database
+            model.create_table()
+        application.database = database
+
+        User.create(uuid=uuid.uuid4(), first_name='First', last_name='Last',
+                    email=EMAIL, password=crypt_password(PASSWORD))
+
+        client = application.app.test_client()
+        cache_size = auth.CACHE_SIZE
+        for name, size in (('without cache', 0), ('with cache', cache_size)):
+            auth.CACHE_SIZE = size
+            auth.clear_cache()
+            print('{:<14} {:>8.0f} requests/s'.format(
+                name, requests_per_second(client, args.number)))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
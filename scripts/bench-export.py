@@ -0,0 +1,78 @@
+from models import Item
+from playhouse.sqlite_ext import SqliteExtDatabase
+from tempfile import mkdtemp
+import simplejson as json
+import app as application
+import tracemalloc
+import argparse
+import shutil
+import utils
+import uuid
+import os
+
+
+def create_items(number):
+    rows = ({
+        'uuid': uuid.uuid4(),
+        'name': 'Item {}'.format(index),
+        'price': 10,
+        'description': 'Description of the item {}'.format(index),
+        'category': 'Category',
+        'availability': 1,
+    } for index in range(number))
+    with Item.atomic():
+        for batch in utils.batches(rows):
+            Item.insert_many(batch).execute()
+
+
+def peak_memory(function):
+    """Peak of the memory allocated by Python while running `function`, in MiB."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def export_in_memory():
+    json.dumps(Item.serialize_many())
+
+
+def export_streamed(client):
+    def export():
+        resp = client.get('/items/?stream=true')
+        assert resp.status_code == 200
+        for _ in resp.response:
+            pass
+        resp.close()
+    return export
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the peak memory of exporting the whole catalog as a single '
+                    'JSON string and streamed by GET /items/?stream=true.')
+    parser.add_argument('--number', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    temp_dir = mkdtemp()
+    try:
+        database = SqliteExtDatabase(os.path.join(temp_dir, 'bench.db'))
+        Item._meta.database = database
+        application.database = database
+        Item.create_table()
+
+        client = application.app.test_client()
+        created = 0
+        for number in sorted(args.number):
+            create_items(number - created)
+            created = number
+            print('{:>7} items  in memory {:>7.1f} MiB  streamed {:>7.1f} MiB'.format(
+                number, peak_memory(export_in_memory), peak_memory(export_streamed(client))))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
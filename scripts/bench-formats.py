@@ -0,0 +1,91 @@
+from models import Item, User, Order, OrderItem
+from playhouse.sqlite_ext import SqliteExtDatabase
+from tempfile import mkdtemp
+from decimal import Decimal
+import simplejson as json
+import argparse
+import formats
+import random
+import shutil
+import utils
+import time
+import uuid
+import os
+
+MODELS = [Item, User, Order, OrderItem]
+
+FORMATS = [
+    ('json', lambda data: json.dumps(data).encode(),
+     lambda data: json.loads(data.decode(), use_decimal=True)),
+    ('msgpack', formats.msgpack_dumps, formats.msgpack_loads),
+    ('cbor', formats.cbor_dumps, formats.cbor_loads),
+]
+
+
+def create_rows(items, orders):
+    with Item.atomic():
+        for batch in utils.batches({
+                'uuid': uuid.uuid4(),
+                'name': 'Item {}'.format(index),
+                'price': Decimal(random.randrange(100, 100000)) / 100,
+                'description': 'Description of the item {}'.format(index),
+                'category': 'Category',
+                'availability': 10,
+        } for index in range(items)):
+            Item.insert_many(batch).execute()
+
+        user = User.create(uuid=uuid.uuid4(), first_name='First', last_name='Last',
+                           email='bench@domain.com', password='')
+        item_ids = [item_id for item_id, in Item.select(Item.id).tuples()]
+        for _ in range(orders):
+            order = Order.create(uuid=uuid.uuid4(), total_price=0, user=user)
+            OrderItem.insert_many({
+                'order': order,
+                'item': item_id,
+                'quantity': 2,
+                'subtotal': Decimal('19.98'),
+            } for item_id in random.sample(item_ids, 5)).execute()
+
+
+def timed(function, data, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        function(data)
+    return (time.perf_counter() - start) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare payload size, encode and decode time of the item and order '
+                    'listings in JSON, MessagePack and CBOR.')
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=200)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    temp_dir = mkdtemp()
+    try:
+        database = SqliteExtDatabase(os.path.join(temp_dir, 'bench.db'))
+        for model in MODELS:
+            model._meta.database = database
+            model.create_table()
+        create_rows(args.items, args.orders)
+
+        listings = [
+            ('{} items'.format(args.items), Item.serialize_many()),
+            ('{} orders'.format(args.orders), Order.serialize_many()),
+        ]
+        for name, data in listings:
+            print(name)
+            for format_name, dumps, loads in FORMATS:
+                payload = dumps(data)
+                assert loads(payload) == data
+                print('  {:<8} {:>9} bytes  encode {:>7.2f} ms  decode {:>7.2f} ms'.format(
+                    format_name, len(payload), timed(dumps, data, args.number),
+                    timed(loads, payload, args.number)))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
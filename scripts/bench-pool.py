@@ -0,0 +1,83 @@
+from models import Item, User, Address, Order, OrderItem, Favorites, Picture
+from models import IdempotencyKey, ItemIndex
+from playhouse.pool import PooledSqliteExtDatabase, PooledPostgresqlDatabase
+from playhouse.sqlite_ext import SqliteExtDatabase
+from peewee import PostgresqlDatabase
+from urllib.parse import urlparse
+from tempfile import mkdtemp
+import app as application
+import argparse
+import shutil
+import search
+import time
+import uuid
+import os
+
+MODELS = [Item, ItemIndex, User, Address, Order, OrderItem, Favorites, Picture, IdempotencyKey]
+
+
+def databases(url, path):
+    """Return a plain and a pooled database object for the same database."""
+    if url:
+        url_db = urlparse(url)
+        kwargs = dict(
+            user=url_db.username,
+            password=url_db.password,
+            host=url_db.hostname,
+            port=url_db.port,
+        )
+        return (PostgresqlDatabase(url_db.path[1:], **kwargs),
+                PooledPostgresqlDatabase(url_db.path[1:], max_connections=8, **kwargs))
+
+    return (SqliteExtDatabase(path),
+            PooledSqliteExtDatabase(path, max_connections=8, check_same_thread=False))
+
+
+def use_database(database):
+    application.database = database
+    for model in MODELS:
+        model._meta.database = database
+
+
+def requests_per_second(client, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        resp = client.get('/items/?limit=1')
+        assert resp.status_code == 200
+    return number / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure requests/sec of GET /items/ with and without a connection pool.')
+    parser.add_argument('--url', default=os.getenv('BENCH_DATABASE_URL'),
+                        help='Postgres url of a scratch database, SQLite is used by default')
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    temp_dir = mkdtemp()
+    try:
+        plain, pooled = databases(args.url, os.path.join(temp_dir, 'bench.db'))
+
+        use_database(plain)
+        Item.create_table(fail_silently=True)
+        search.create_index()
+        Item.create(uuid=uuid.uuid4(), name='Item', price=1, description='Description',
+                    category='Category', availability=1)
+        plain.close()
+
+        client = application.app.test_client()
+        for name, database in (('without pool', plain), ('with pool', pooled)):
+            use_database(database)
+            print('{:<13} {:>8.0f} requests/s'.format(
+                name, requests_per_second(client, args.number)))
+
+        use_database(plain)
+        Item.drop_table()
+        search.drop_index()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+from models import Item, User, Address, json_validators
+from jsonschema import validate
+from marshmallow_jsonschema import JSONSchema
+import argparse
+import timeit
+
+PAYLOADS = {
+    Item: {
+        'name': 'Item one',
+        'price': 15,
+        'description': 'Item description',
+        'category': 'Category',
+        'availability': 11,
+    },
+    Address: {
+        'nation': 'Italy',
+        'city': 'Prato',
+        'postal_code': '59100',
+        'local_address': 'Via Roncioni 10',
+        'phone': '0574100100',
+    },
+    User: {
+        'first_name': 'First Name',
+        'last_name': 'Last name',
+        'email': 'email@domain.com',
+        'password': 'p4ssw0rd',
+    },
+}
+
+
+def uncached_verify_json(model, json):
+    # The validation as it was done before the validators registry.
+    json_schema = JSONSchema().dump(model.get_schema()).data
+    validate(json, json_schema)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure JSON Schema validations per second.')
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    json_validators.clear()
+
+    for model, payload in PAYLOADS.items():
+        before = timeit.timeit(
+            lambda: uncached_verify_json(model, payload), number=args.number)
+        after = timeit.timeit(lambda: model.verify_json(payload), number=args.number)
+
+        print('{:<8} before: {:>9.0f}/s  after: {:>9.0f}/s  speedup: {:.1f}x'.format(
+            model.__name__, args.number / before, args.number / after, before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from models import database, Item, User, Address, Order, OrderItem
+import search
 from faker import Factory
 from random import seed, randint
 import argparse
@@ -30,6 +31,8 @@ def main():
             )
         items_list.append(item)
 
+    search.rebuild_index()
+
     for _ in range(20):
         user = User.create(
             uuid=fake.uuid4(),
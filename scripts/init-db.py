@@ -1,10 +1,15 @@
-from models import database, Item, User, Address, Order, OrderItem, Picture
+from models import database, Item, User, Address, Order, OrderItem, Picture, IdempotencyKey
+from models import Mail
+import search
 
 
 def drop_tables():
     database.connect()
 
     # Initialize db by deleting all tables
+    search.drop_index()
+    Mail.drop_table(fail_silently=True)
+    IdempotencyKey.drop_table(fail_silently=True)
     Picture.drop_table(fail_silently=True)
     OrderItem.drop_table(fail_silently=True)
     Address.drop_table(fail_silently=True)
@@ -20,11 +25,14 @@ def create_tables():
 
     # Create new table with the same name
     Item.create_table()
+    search.create_index()
     User.create_table()
     Address.create_table()
     Order.create_table()
     OrderItem.create_table()
     Picture.create_table()
+    IdempotencyKey.create_table()
+    Mail.create_table()
 
     database.close()
 
@@ -0,0 +1,10 @@
+from app import app
+import mail
+
+
+def main():
+    mail.run_worker(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+from peewee import PostgresqlDatabase, SQL
+from models import Item, ItemIndex
+
+# Must match the expression of the GIN index for Postgres to use it.
+TSVECTOR = "to_tsvector('english', name || ' ' || description || ' ' || category)"
+
+
+def use_fts5():
+    return not isinstance(Item._meta.database, PostgresqlDatabase)
+
+
+def create_index():
+    if use_fts5():
+        ItemIndex.create_table(fail_silently=True)
+    else:
+        Item._meta.database.execute_sql(
+            'CREATE INDEX IF NOT EXISTS item_search ON item USING GIN ({})'.format(TSVECTOR))
+
+
+def drop_index():
+    if use_fts5():
+        ItemIndex.drop_table(fail_silently=True)
+    else:
+        Item._meta.database.execute_sql('DROP INDEX IF EXISTS item_search')
+
+
+def rebuild_index():
+    """Index again the whole catalog, for items created outside of the API."""
+    if not use_fts5():
+        return
+
+    with Item.atomic():
+        ItemIndex.delete().execute()
+        ItemIndex.insert_from(
+            [ItemIndex.rowid, ItemIndex.name, ItemIndex.description, ItemIndex.category],
+            Item.select(Item.id, Item.name, Item.description, Item.category)).execute()
+
+
+def index_item(item):
+    # The Postgres expression index is maintained by the database itself.
+    if not use_fts5():
+        return
+
+    ItemIndex.insert(
+        rowid=item.id,
+        name=item.name,
+        description=item.description,
+        category=item.category,
+    ).upsert().execute()
+
+
+def unindex_item(item):
+    if not use_fts5():
+        return
+
+    ItemIndex.delete().where(ItemIndex.rowid == item.id).execute()
+
+
+def fts5_query(text):
+    # Quote every term so that user input is never parsed as FTS5 syntax.
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in text.split())
+
+
+def search_items(text):
+    """Return the query of the items matching all the words of `text`,
+    best matches first."""
+    if use_fts5():
+        return (
+            Item.select()
+            .join(ItemIndex, on=(Item.id == ItemIndex.rowid))
+            .where(ItemIndex.match(fts5_query(text)))
+            .order_by(ItemIndex.rank(), Item.id))
+
+    tsquery = 'plainto_tsquery(%s, %s)'
+    return (
+        Item.select()
+        .where(SQL('{} @@ {}'.format(TSVECTOR, tsquery), 'english', text))
+        .order_by(SQL('ts_rank({}, {}) DESC'.format(TSVECTOR, tsquery), 'english', text),
+                  Item.id))
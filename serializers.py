@@ -0,0 +1,79 @@
+from marshmallow import fields
+from peewee import JOIN
+
+
+class RowSerializer:
+    """Serialize the rows of a model query like the model schema does.
+
+    The schema is inspected once: each dumped field becomes a column of the
+    query, and fields with a dotted attribute such as `user.uuid` become a
+    column of the related model, joined in the same query. Rows are then
+    fetched as tuples and every value is formatted by the `_serialize` of
+    its marshmallow field, so the output is the same of `schema.dump` without
+    building a model instance and running the schema marshalling per row.
+
+    Schemas with nested fields can't be flattened to a single query and
+    fall back to dumping the model instances.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.schema = model.get_schema()
+        self.flat = not any(
+            isinstance(field, fields.Nested) for field in self.schema.fields.values())
+
+        self.keys = []
+        self.columns = []
+        self.formatters = []
+        self.joins = []
+
+        if not self.flat:
+            return
+
+        for name, field in self.schema.fields.items():
+            if field.load_only:
+                continue
+
+            attribute = (field.attribute or name).split('.')
+            if len(attribute) == 1:
+                column = model._meta.fields[attribute[0]]
+            else:
+                foreign_key = model._meta.fields[attribute[0]]
+                related = foreign_key.rel_model.alias()
+                self.joins.append((foreign_key, related))
+                column = getattr(related, attribute[1])
+
+            self.keys.append(name)
+            self.columns.append(column)
+            self.formatters.append(field._serialize)
+
+    def dump(self, obj):
+        return self.schema.dump(obj).data
+
+    def dump_many(self, query, key=None):
+        """Serialize the rows of `query`.
+
+        When a `key` column is given, it is fetched too and the rows are
+        returned as `(key value, document)` pairs, so that they can be
+        grouped by it.
+        """
+        if not self.flat:
+            return self.schema.dump(list(query), many=True).data
+
+        query = query.switch(self.model)
+        for foreign_key, related in self.joins:
+            query = query.join(
+                related, JOIN.LEFT_OUTER, on=(foreign_key == related.id)).switch(self.model)
+
+        keys = self.keys
+        formatters = self.formatters
+
+        def dump(row):
+            return {name: formatter(value, name, None)
+                    for name, formatter, value in zip(keys, formatters, row)}
+
+        if key is None:
+            return [dump(row) for row in query.select(*self.columns).tuples()]
+
+        return [(row[0], dump(row[1:]))
+                for row in query.select(key, *self.columns).tuples()]
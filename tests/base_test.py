@@ -1,12 +1,21 @@
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
-from models import Item, User, Address, Order, OrderItem, Favorites, Picture
-from peewee import SqliteDatabase
+from models import Item, ItemIndex, User, Address, Order, OrderItem, Favorites, Picture
+from models import IdempotencyKey, Mail
+from playhouse.sqlite_ext import SqliteExtDatabase
 from tempfile import mkdtemp
 import shutil
 
 from views.user import crypt_password
 from app import app
+from contextlib import contextmanager
+import catalog
+import compression
+import queries
+import auth
+import passwords
+import ratelimit
+import replicas
 import base64
 import uuid
 from uuid import UUID
@@ -25,14 +34,23 @@ class UUIDEncoder(json.JSONEncoder):
 class BaseTest:
     @classmethod
     def setup_class(cls):
-        database = SqliteDatabase(':memory:')
+        database = queries.instrumented(SqliteExtDatabase)(':memory:')
 
-        cls.tables = [Item, User, Address, Order, OrderItem, Favorites, Picture]
+        cls.tables = [Item, ItemIndex, User, Address, Order, OrderItem, Favorites, Picture,
+                      IdempotencyKey, Mail]
         for table in cls.tables:
             table._meta.database = database
             table.create_table()
 
         cls.temp_dir = mkdtemp()
+        cls.ratelimit_path = ratelimit.PATH
+        ratelimit.PATH = os.path.join(cls.temp_dir, 'ratelimit.db')
+        cls.auth_path = auth.PATH
+        auth.PATH = os.path.join(cls.temp_dir, 'auth.db')
+        cls.passwords_path = passwords.PATH
+        passwords.PATH = os.path.join(cls.temp_dir, 'passwords.db')
+        cls.replicas_path = replicas.PATH
+        replicas.PATH = os.path.join(cls.temp_dir, 'writes.db')
 
         app.config['TESTING'] = True
         app.config['UPLOADS_FOLDER'] = cls.temp_dir
@@ -41,11 +59,49 @@ class BaseTest:
 
     @classmethod
     def teardown_class(cls):
+        ratelimit.PATH = cls.ratelimit_path
+        auth.PATH = cls.auth_path
+        passwords.PATH = cls.passwords_path
+        replicas.PATH = cls.replicas_path
         shutil.rmtree(cls.temp_dir)
 
     def setup_method(self):
         for table in self.tables:
             table.delete().execute()
+        auth.clear_cache()
+        catalog.clear()
+        compression.clear()
+        ratelimit.reset()
+        passwords.reset()
+        replicas.reset()
+
+    def use_temp_database(self, filename, models=None, database_class=SqliteExtDatabase,
+                          **kwargs):
+        """Move `models`, all the tables by default, to a new database in the
+        file `filename` of a temporary directory, until `restore_databases`."""
+        models = self.tables if models is None else models
+        self.database_dir = mkdtemp()
+        self.previous_databases = [(model, model._meta.database) for model in models]
+
+        database = database_class(os.path.join(self.database_dir, filename), **kwargs)
+        for model in models:
+            model._meta.database = database
+            model.create_table()
+        return database
+
+    def restore_databases(self):
+        for model, database in self.previous_databases:
+            model._meta.database = database
+        shutil.rmtree(self.database_dir)
+
+    @contextmanager
+    def assert_max_queries(self, number):
+        """Fail when the block runs more than `number` statements."""
+        with queries.recording() as recorder:
+            yield recorder
+
+        assert len(recorder) <= number, 'Expected at most {} queries, ran {}:\n{}'.format(
+            number, len(recorder), '\n'.join(sql for sql, _ in recorder.statements))
 
     def create_user(self, email="email@domain.com", first_name="First Name",
                     last_name="Last name", password="p4ssw0rd", superuser=False):
@@ -162,12 +218,14 @@ class BaseTest:
             url, method=method, data=data, content_type=content_type
         )
 
-    def open_with_auth(self, url, method, email, password, data, content_type='application/json'):
+    def open_with_auth(self, url, method, email, password, data, content_type='application/json',
+                       headers=None):
         if content_type == 'application/json':
             data = json.dumps(data, cls=UUIDEncoder)
 
-        headers = {'Authorization': 'Basic ' + base64.b64encode(
-            bytes(email + ":" + password, 'ascii')).decode('ascii')}
+        headers = dict(headers or {})
+        headers['Authorization'] = 'Basic ' + base64.b64encode(
+            bytes(email + ":" + password, 'ascii')).decode('ascii')
 
         return self.app.open(
             url, method=method, headers=headers, data=data, content_type=content_type
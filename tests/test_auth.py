@@ -0,0 +1,117 @@
+from http.client import OK, CREATED, NO_CONTENT, UNAUTHORIZED
+from multiprocessing import get_context
+
+from models import User
+import metrics
+import auth
+
+from .base_test import BaseTest
+
+
+def change_password(user):
+    """Change the password of `user` in another worker process."""
+    user.session_version += 1
+    auth.forget(user)
+
+
+class TestAuthCache(BaseTest):
+    def setup_method(self):
+        super().setup_method()
+        metrics.reset()
+        self.user = self.create_user()
+
+    def get_orders(self, password='p4ssw0rd', email='email@domain.com'):
+        return self.open_with_auth('/orders/', 'get', email, password, data='')
+
+    def count_verifications(self, monkeypatch):
+        calls = []
+        verify_password = User.verify_password
+
+        def counting_verify_password(user, password):
+            calls.append(password)
+            return verify_password(user, password)
+
+        monkeypatch.setattr(User, 'verify_password', counting_verify_password)
+        return calls
+
+    def test_cached_user__skips_verification(self, monkeypatch):
+        calls = self.count_verifications(monkeypatch)
+
+        for _ in range(3):
+            assert self.get_orders().status_code == OK
+
+        assert len(calls) == 1
+        assert metrics.get('auth_cache_misses_total') == 1
+        assert metrics.get('auth_cache_hits_total') == 2
+
+    def test_wrong_password__not_cached(self, monkeypatch):
+        calls = self.count_verifications(monkeypatch)
+
+        assert self.get_orders().status_code == OK
+        assert self.get_orders(password='wrong').status_code == UNAUTHORIZED
+        assert self.get_orders(password='wrong').status_code == UNAUTHORIZED
+
+        assert len(calls) == 3
+        assert metrics.get('auth_cache_hits_total') == 0
+
+    def test_put__forgets_old_password(self):
+        assert self.get_orders().status_code == OK
+
+        resp = self.open_with_auth(
+            '/users/{}'.format(self.user.uuid), 'put', self.user.email, 'p4ssw0rd',
+            data={'first_name': 'First', 'last_name': 'Last', 'email': 'email@domain.com',
+                  'password': 'n3wp4ssw0rd'})
+        assert resp.status_code == CREATED
+
+        assert self.get_orders().status_code == UNAUTHORIZED
+        assert self.get_orders(password='n3wp4ssw0rd').status_code == OK
+
+    def test_delete__forgets_user(self):
+        assert self.get_orders().status_code == OK
+
+        resp = self.open_with_auth(
+            '/users/{}'.format(self.user.uuid), 'delete', self.user.email, 'p4ssw0rd', data='')
+        assert resp.status_code == NO_CONTENT
+
+        assert self.get_orders().status_code == UNAUTHORIZED
+
+    def test_forget__other_workers(self):
+        assert self.get_orders().status_code == OK
+
+        process = get_context('fork').Process(target=change_password, args=(self.user,))
+        process.start()
+        process.join()
+
+        # Still cached in this process, but with an older session version.
+        assert len(auth.cache) == 1
+        assert auth.cached_user(auth.credentials_key(self.user.email, 'p4ssw0rd')) is None
+        assert len(auth.cache) == 0
+
+    def test_cached_user__expires(self, monkeypatch):
+        monkeypatch.setattr(auth, 'CACHE_TTL', -1)
+
+        assert self.get_orders().status_code == OK
+        assert self.get_orders().status_code == OK
+
+        assert metrics.get('auth_cache_hits_total') == 0
+
+    def test_cache__bounded(self, monkeypatch):
+        monkeypatch.setattr(auth, 'CACHE_SIZE', 1)
+        self.create_user(email='other@domain.com')
+
+        assert self.get_orders().status_code == OK
+        assert self.get_orders(email='other@domain.com').status_code == OK
+        assert len(auth.cache) == 1
+
+        assert self.get_orders().status_code == OK
+        assert metrics.get('auth_cache_hits_total') == 0
+
+    def test_cached_user__copy(self):
+        self.get_orders()
+
+        first = auth.cached_user(auth.credentials_key(self.user.email, 'p4ssw0rd'))
+        first.first_name = 'Changed'
+        second = auth.cached_user(auth.credentials_key(self.user.email, 'p4ssw0rd'))
+
+        assert second == self.user
+        assert second.first_name == self.user.first_name
@@ -0,0 +1,176 @@
+from http.client import OK, CREATED, NO_CONTENT, NOT_FOUND
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import simplejson as json
+import threading
+import os
+
+from app import app
+from models import Item
+import catalog
+import metrics
+
+from .base_test import BaseTest
+
+
+class TestCatalog(BaseTest):
+    def setup_method(self):
+        super().setup_method()
+        metrics.reset()
+        self.admin = self.create_user(email='admin@domain.com', superuser=True)
+
+    def get_item(self, item):
+        resp = self.open('/items/{}'.format(item.uuid), 'get', data='')
+        if resp.status_code == OK:
+            return json.loads(resp.data.decode())
+        return resp.status_code
+
+    def test_get_item__cached(self):
+        item = self.create_item(name='Cached')
+        assert self.get_item(item)['name'] == 'Cached'
+
+        # Changed behind the back of the cache.
+        Item.update(name='Changed').where(Item.id == item.id).execute()
+        assert self.get_item(item)['name'] == 'Cached'
+
+        assert metrics.get('catalog_cache_misses_total') == 1
+        assert metrics.get('catalog_cache_hits_total') == 1
+
+    def test_get_item__not_found_not_cached(self):
+        item = self.create_item()
+        item.delete_instance()
+
+        assert self.get_item(item) == NOT_FOUND
+        assert self.get_item(item) == NOT_FOUND
+        assert metrics.get('catalog_cache_misses_total') == 2
+
+    def test_patch__invalidates(self):
+        item = self.create_item(name='Old name')
+        self.get_item(item)
+
+        resp = self.open_with_auth(
+            '/items/{}'.format(item.uuid), 'patch', self.admin.email, 'p4ssw0rd',
+            data={'name': 'New name'})
+        assert resp.status_code == OK
+        assert self.get_item(item)['name'] == 'New name'
+
+    def test_put__invalidates(self):
+        item = self.create_item(name='Old name')
+        self.get_item(item)
+
+        resp = self.open_with_auth(
+            '/items/{}'.format(item.uuid), 'put', self.admin.email, 'p4ssw0rd', data={
+                'name': 'New name', 'price': 3, 'description': 'Description',
+                'category': 'Category', 'availability': 4})
+        assert resp.status_code == OK
+        assert self.get_item(item)['name'] == 'New name'
+
+    def test_delete__invalidates(self):
+        item = self.create_item()
+        self.get_item(item)
+
+        resp = self.open_with_auth(
+            '/items/{}'.format(item.uuid), 'delete', self.admin.email, 'p4ssw0rd', data='')
+        assert resp.status_code == NO_CONTENT
+        assert self.get_item(item) == NOT_FOUND
+
+    def test_orders__invalidate_stock(self):
+        user = self.create_user()
+        item = self.create_item(availability=5)
+        self.get_item(item)
+
+        resp = self.open_with_auth('/orders/', 'post', user.email, 'p4ssw0rd', data={
+            'user': user.uuid, 'items': json.dumps([[str(item.uuid), 2]])},
+            headers={'Idempotency-Key': 'order-1'})
+        assert resp.status_code == CREATED
+        assert self.get_item(item)['availability'] == 3
+
+        order_uuid = json.loads(resp.data.decode())['uuid']
+        resp = self.open_with_auth(
+            '/orders/{}'.format(order_uuid), 'delete', user.email, 'p4ssw0rd', data='')
+        assert resp.status_code == NO_CONTENT
+        assert self.get_item(item)['availability'] == 5
+
+    def test_invalidate__again_at_the_end_of_the_request(self):
+        with app.test_request_context():
+            catalog.invalidate(['key'])
+            # Cached by a concurrent request before the commit.
+            catalog.store.set('key', {'document': 'stale'})
+            catalog.invalidate_request()
+
+        assert catalog.store.get('key') is None
+
+    def test_get_item__expires(self, monkeypatch):
+        monkeypatch.setattr(catalog.store, 'ttl', -1)
+        item = self.create_item(name='Old name')
+        self.get_item(item)
+
+        Item.update(name='New name').where(Item.id == item.id).execute()
+        assert self.get_item(item)['name'] == 'New name'
+
+    def test_get_item__single_flight(self, monkeypatch):
+        started = threading.Event()
+        release = threading.Event()
+        loaded = []
+
+        def load_item(uuid):
+            loaded.append(uuid)
+            started.set()
+            release.wait(5)
+            return {'id': 1, 'version': 1, 'updated_at': 0, 'document': {'uuid': uuid}}
+
+        monkeypatch.setattr(catalog, 'load_item', load_item)
+
+        with ThreadPoolExecutor(8) as executor:
+            futures = [executor.submit(catalog.get_item, 'key') for _ in range(8)]
+            started.wait(5)
+            release.set()
+            entries = [future.result() for future in futures]
+
+        assert loaded == ['key']
+        assert all(entry['document'] == {'uuid': 'key'} for entry in entries)
+        assert not catalog.loads
+
+    def test_get_item__load_invalidated_meanwhile(self, monkeypatch):
+        def load_item(uuid):
+            catalog.invalidate([uuid])
+            return {'id': 1, 'version': 1, 'updated_at': 0, 'document': {}}
+
+        monkeypatch.setattr(catalog, 'load_item', load_item)
+
+        assert catalog.get_item('key') is not None
+        assert catalog.store.get('key') is None
+        assert not catalog.loads
+
+    def test_invalidate__nothing_kept_without_load(self):
+        catalog.invalidate(['key'])
+        assert not catalog.loads
+
+
+class TestStores:
+    def test_local_store__lru(self):
+        store = catalog.LocalStore(2, 60)
+        store.set('a', 1)
+        store.set('b', 2)
+        store.get('a')
+        store.set('c', 3)
+
+        assert store.get('a') == 1
+        assert store.get('b') is None
+        assert store.get('c') == 3
+
+    def test_sqlite_store__shared(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'catalog.db')
+        first = catalog.SQLiteStore(path, 60)
+        second = catalog.SQLiteStore(path, 60)
+
+        first.set('key', {'document': {'price': Decimal('7.10')}})
+        assert second.get('key') == {'document': {'price': Decimal('7.10')}}
+
+        second.delete(['key'])
+        assert first.get('key') is None
+
+    def test_sqlite_store__expires(self, tmpdir):
+        store = catalog.SQLiteStore(os.path.join(str(tmpdir), 'catalog.db'), -1)
+        store.set('key', 1)
+        assert store.get('key') is None
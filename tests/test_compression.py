@@ -0,0 +1,120 @@
+from http.client import OK, NOT_MODIFIED
+import simplejson as json
+import brotli
+import gzip
+
+import compression
+import metrics
+
+from .base_test import BaseTest
+
+
+class TestCompression(BaseTest):
+    def setup_method(self):
+        super().setup_method()
+        metrics.reset()
+
+    def get(self, url, encoding=None, **headers):
+        if encoding is not None:
+            headers['Accept-Encoding'] = encoding
+        return self.app.get(url, headers=headers)
+
+    def create_items(self, number):
+        return [self.create_item(description='A description of the item. ' * 60)
+                for _ in range(number)]
+
+    def test_gzip(self):
+        items = self.create_items(5)
+
+        resp = self.get('/items/', 'gzip')
+        assert resp.status_code == OK
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in resp.vary
+        assert resp.headers['ETag'].endswith('-gzip"')
+        data = json.loads(gzip.decompress(resp.data).decode())
+        assert data == [item.json() for item in items]
+
+        saved = metrics.get('compression_bytes_saved_total', route='itemsresource')
+        assert saved == len(gzip.decompress(resp.data)) - len(resp.data) > 0
+        assert metrics.get('compression_cpu_seconds_total', route='itemsresource') >= 0
+
+    def test_brotli_preferred(self):
+        items = self.create_items(5)
+
+        resp = self.get('/items/', 'gzip, br')
+        assert resp.headers['Content-Encoding'] == 'br'
+        data = json.loads(brotli.decompress(resp.data).decode())
+        assert data == [item.json() for item in items]
+
+        resp = self.get('/items/', 'gzip, br;q=0')
+        assert resp.headers['Content-Encoding'] == 'gzip'
+
+    def test_not_accepted(self):
+        self.create_items(5)
+
+        resp = self.get('/items/')
+        assert 'Content-Encoding' not in resp.headers
+        assert 'Accept-Encoding' in resp.vary
+        assert not resp.headers['ETag'].endswith('-gzip"')
+
+    def test_small_response_not_compressed(self):
+        self.create_item()
+
+        resp = self.get('/items/', 'gzip')
+        assert resp.status_code == OK
+        assert 'Content-Encoding' not in resp.headers
+        json.loads(resp.data.decode())
+
+    def test_level(self, monkeypatch):
+        self.create_items(5)
+
+        monkeypatch.setattr(compression, 'GZIP_LEVEL', 1)
+        fast = len(self.get('/items/', 'gzip').data)
+        compression.clear()
+        monkeypatch.setattr(compression, 'GZIP_LEVEL', 9)
+        assert len(self.get('/items/', 'gzip').data) <= fast
+
+    def test_compressed_once_per_representation(self, monkeypatch):
+        items = self.create_items(5)
+        compress = compression.compress
+        compressed = []
+
+        def counting_compress(data, encoding):
+            compressed.append(encoding)
+            return compress(data, encoding)
+
+        monkeypatch.setattr(compression, 'compress', counting_compress)
+
+        for _ in range(3):
+            first = self.get('/items/', 'gzip')
+            self.get('/items/{}'.format(items[0].uuid), 'gzip')
+        self.get('/items/', 'br')
+        assert compressed == ['gzip', 'gzip', 'br']
+        assert metrics.get('compression_cache_hits_total', route='itemsresource') == 2
+
+        # A change of the items changes the tag, and the body.
+        items[0].update_changed(name='New name')
+        resp = self.get('/items/', 'gzip')
+        assert resp.headers['ETag'] != first.headers['ETag']
+        assert json.loads(gzip.decompress(resp.data).decode())[0]['name'] == 'New name'
+
+    def test_not_modified__encoded_tag(self):
+        self.create_items(5)
+        tag = self.get('/items/', 'gzip').headers['ETag']
+
+        resp = self.get('/items/', 'gzip', **{'If-None-Match': tag})
+        assert resp.status_code == NOT_MODIFIED
+        assert resp.headers['ETag'] == tag
+
+        # The client's copy is fine whatever its encoding.
+        resp = self.get('/items/', **{'If-None-Match': tag})
+        assert resp.status_code == NOT_MODIFIED
+
+    def test_stream(self):
+        items = self.create_items(5)
+
+        resp = self.get('/items/?stream=true', 'gzip')
+        assert resp.is_streamed
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(resp.data).decode()) == [item.json() for item in items]
+        assert metrics.get('compression_bytes_saved_total', route='itemsresource') > 0
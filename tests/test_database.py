@@ -0,0 +1,73 @@
+from playhouse.pool import PooledDatabase, PooledSqliteExtDatabase
+from playhouse.sqlite_ext import SqliteExtDatabase
+from http.client import OK, BAD_REQUEST
+
+from models import Item
+import app as app_module
+import metrics
+import models
+
+from .base_test import BaseTest
+
+
+class TestConnections(BaseTest):
+    """Requests served by the app on a pooled database file, like the
+    ones of a worker."""
+
+    def setup_method(self):
+        self.database = self.use_temp_database(
+            'pool.db', [Item], PooledSqliteExtDatabase, max_connections=4,
+            check_same_thread=False)
+        self.database.close()
+
+        app_module.database = self.database
+        metrics.reset()
+
+    def teardown_method(self):
+        app_module.database = models.database
+        self.database.close_all()
+        self.restore_databases()
+
+    def test_requests_reuse_pooled_connections(self):
+        assert isinstance(self.database, PooledDatabase)
+
+        for _ in range(3):
+            resp = self.app.get('/items/')
+            assert resp.status_code == OK
+            assert self.database.is_closed()
+
+            # The connection is back in the pool, ready for the next request.
+            assert len(self.database._connections) == 1
+            assert not self.database._in_use
+
+        assert metrics.get('requests_total') == 3
+        assert metrics.get('requests_without_database_total') == 0
+
+    def test_requests_without_queries_take_no_connection(self):
+        # Rejected by the argument validation before any query.
+        resp = self.app.get('/items/?limit=0')
+        assert resp.status_code == BAD_REQUEST
+
+        assert self.database.is_closed()
+        assert not self.database._in_use
+
+        assert metrics.get('requests_total') == 1
+        assert metrics.get('requests_without_database_total') == 1
+
+    def test_connect_database__pooled(self, monkeypatch):
+        monkeypatch.setattr(models, 'POOL_MAX_CONNECTIONS', 5)
+        monkeypatch.setattr(models, 'POOL_STALE_TIMEOUT', 60)
+
+        database = models.connect_database(
+            SqliteExtDatabase, PooledSqliteExtDatabase, ':memory:')
+        assert isinstance(database, PooledSqliteExtDatabase)
+        assert database.max_connections == 5
+        assert database.stale_timeout == 60
+
+    def test_connect_database__pool_disabled(self, monkeypatch):
+        monkeypatch.setattr(models, 'POOL_MAX_CONNECTIONS', 0)
+
+        database = models.connect_database(
+            SqliteExtDatabase, PooledSqliteExtDatabase, ':memory:')
+        assert isinstance(database, SqliteExtDatabase)
+        assert not isinstance(database, PooledSqliteExtDatabase)
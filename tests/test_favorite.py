@@ -29,6 +29,22 @@ class TestFavorites(BaseTest):
         assert len(data) == 1
         assert user_db.favorite_items() == data
 
+    def test_get__favorites_streamed(self):
+        user_db = self.create_user()
+        items = [self.create_item() for _ in range(5)]
+        for item in reversed(items):
+            user_db.add_favorite(item)
+
+        resp = self.open_with_auth(
+            '/favorites/', 'get', user_db.email, "p4ssw0rd", data=None)
+
+        assert resp.status_code == OK
+        assert resp.is_streamed
+        assert json.loads(resp.data.decode()) == user_db.favorite_items()
+        assert list(user_db.iter_favorite_items(size=2)) == user_db.favorite_items()
+        assert [item['uuid'] for item in user_db.favorite_items()] == [
+            str(item.uuid) for item in reversed(items)]
+
     def test_get__favorites_is_empty(self):
         user_db = self.create_user()
         self.create_item()
@@ -0,0 +1,132 @@
+from http.client import OK, CREATED, BAD_REQUEST, NOT_FOUND, NOT_MODIFIED
+from decimal import Decimal
+import simplejson as json
+import base64
+import uuid
+
+from models import Item, Favorites, Order
+import formats
+
+from .base_test import BaseTest
+
+
+class TestFormats(BaseTest):
+    def get(self, url, accept, **headers):
+        headers['Accept'] = accept
+        return self.app.get(url, headers=headers)
+
+    def auth_headers(self, user):
+        return {'Authorization': 'Basic ' + base64.b64encode(
+            '{}:p4ssw0rd'.format(user.email).encode()).decode()}
+
+    def test_msgpack_round_trip(self):
+        data = {'price': Decimal('7.10'), 'uuid': uuid.uuid4(), 'items': [1, 'two']}
+        assert formats.msgpack_loads(formats.msgpack_dumps(data)) == data
+
+    def test_cbor_round_trip(self):
+        data = {'price': Decimal('7.10'), 'uuid': uuid.uuid4(), 'items': [1, 'two']}
+        assert formats.cbor_loads(formats.cbor_dumps(data)) == data
+
+    def test_cbor_array_stream(self):
+        documents = [{'price': Decimal(index)} for index in range(100)]
+
+        chunks = list(formats.cbor_array_stream(iter(documents), chunk_size=64))
+        assert len(chunks) > 1
+        assert formats.cbor_loads(b''.join(chunks)) == documents
+
+    def test_get_items__negotiated(self):
+        item = self.create_item(price=Decimal('7.10'))
+
+        resp = self.get('/items/', formats.MSGPACK)
+        assert resp.status_code == OK
+        assert resp.headers['Content-Type'] == formats.MSGPACK
+        assert formats.msgpack_loads(resp.data) == [item.json()]
+        assert formats.msgpack_loads(resp.data)[0]['price'] == Decimal('7.10')
+
+        resp = self.get('/items/', formats.CBOR)
+        assert resp.headers['Content-Type'] == formats.CBOR
+        assert formats.cbor_loads(resp.data) == [item.json()]
+
+        resp = self.get('/items/', '*/*')
+        assert resp.headers['Content-Type'] == formats.JSON
+        assert json.loads(resp.data.decode())[0]['uuid'] == str(item.uuid)
+
+    def test_get_items__stream(self):
+        items = [self.create_item() for _ in range(3)]
+
+        resp = self.get('/items/?stream=true', formats.CBOR)
+        assert resp.is_streamed
+        assert formats.cbor_loads(resp.data) == [item.json() for item in items]
+
+        resp = self.get('/items/?stream=true', formats.MSGPACK)
+        assert formats.msgpack_loads(resp.data) == [item.json() for item in items]
+
+    def test_get_item__etag_per_representation(self):
+        item = self.create_item()
+        url = '/items/{}'.format(item.uuid)
+
+        resp = self.get(url, formats.JSON)
+        json_tag = resp.headers['ETag']
+        assert 'Accept' in resp.vary
+
+        resp = self.get(url, formats.MSGPACK)
+        msgpack_tag = resp.headers['ETag']
+        assert msgpack_tag != json_tag
+        assert formats.msgpack_loads(resp.data) == item.json()
+
+        resp = self.get(url, formats.MSGPACK, **{'If-None-Match': msgpack_tag})
+        assert resp.status_code == NOT_MODIFIED
+
+        resp = self.get(url, formats.MSGPACK, **{'If-None-Match': json_tag})
+        assert resp.status_code == OK
+
+    def test_errors_negotiated(self):
+        resp = self.get('/items/{}'.format(uuid.uuid4()), formats.CBOR)
+        assert resp.status_code == NOT_FOUND
+        assert resp.headers['Content-Type'] == formats.CBOR
+
+    def test_post_item__msgpack_body(self):
+        user = self.create_user(superuser=True)
+        body = formats.msgpack_dumps({
+            'name': 'Item', 'price': Decimal('12.30'), 'description': 'Description',
+            'category': 'Category', 'availability': 3})
+
+        resp = self.app.post('/items/', data=body, content_type=formats.MSGPACK,
+                             headers=dict(self.auth_headers(user), Accept=formats.MSGPACK))
+        assert resp.status_code == CREATED
+        assert formats.msgpack_loads(resp.data)['price'] == Decimal('12.30')
+        assert Item.get().price == Decimal('12.30')
+
+    def test_post_favorite__cbor_uuid(self):
+        user = self.create_user()
+        item = self.create_item()
+
+        resp = self.app.post(
+            '/favorites/', data=formats.cbor_dumps({'id_item': item.uuid}),
+            content_type=formats.CBOR, headers=self.auth_headers(user))
+        assert resp.status_code == CREATED
+        assert Favorites.get().item.id == item.id
+
+    def test_post_order__msgpack_body(self):
+        user = self.create_user()
+        item = self.create_item()
+        body = formats.msgpack_dumps({'user': user.uuid, 'items': [[item.uuid, 2]]})
+
+        resp = self.app.post('/orders/', data=body, content_type=formats.MSGPACK,
+                             headers=dict(self.auth_headers(user), Accept=formats.MSGPACK))
+        assert resp.status_code == CREATED
+        assert formats.msgpack_loads(resp.data)['items'][0]['quantity'] == 2
+
+        order = Order.get()
+        body = formats.cbor_dumps({'items': [[str(item.uuid), 3]]})
+        resp = self.app.put('/orders/{}'.format(order.uuid), data=body,
+                            content_type=formats.CBOR, headers=self.auth_headers(user))
+        assert resp.status_code == OK
+        assert [line.quantity for line in order.order_items] == [3]
+
+    def test_post__invalid_body(self):
+        user = self.create_user()
+
+        resp = self.app.post('/favorites/', data=b'\xc1', content_type=formats.MSGPACK,
+                             headers=self.auth_headers(user))
+        assert resp.status_code == BAD_REQUEST
@@ -0,0 +1,98 @@
+import datetime
+import json
+from http.client import CREATED, BAD_REQUEST, UNPROCESSABLE_ENTITY
+
+from models import Order, IdempotencyKey
+import idempotency
+
+from .base_test import BaseTest
+
+
+class TestIdempotency(BaseTest):
+    def setup_method(self):
+        super(TestIdempotency, self).setup_method()
+        self.user1 = self.create_user()
+        self.item1 = self.create_item(availability=10)
+
+    def post_order(self, quantity=1, key='key-1', user=None):
+        user = user or self.user1
+        headers = {idempotency.HEADER: key} if key is not None else {}
+        return self.open_with_auth(
+            '/orders/', 'post', user.email, 'p4ssw0rd', headers=headers, data={
+                'user': user.uuid,
+                'items': json.dumps([[str(self.item1.uuid), quantity]]),
+            })
+
+    def test_replay(self):
+        resp1 = self.post_order()
+        assert resp1.status_code == CREATED
+        assert 'Idempotent-Replayed' not in resp1.headers
+
+        resp2 = self.post_order()
+        assert resp2.status_code == CREATED
+        assert resp2.headers['Idempotent-Replayed'] == 'true'
+        assert json.loads(resp2.data.decode()) == json.loads(resp1.data.decode())
+
+        assert Order.select().count() == 1
+        assert self.item1.reload().availability == 9
+
+    def test_replay_failed_request(self):
+        resp1 = self.post_order(quantity=11)
+        assert resp1.status_code == BAD_REQUEST
+
+        self.item1.availability = 20
+        self.item1.save()
+
+        resp2 = self.post_order(quantity=11)
+        assert resp2.status_code == BAD_REQUEST
+        assert resp2.headers['Idempotent-Replayed'] == 'true'
+        assert Order.select().count() == 0
+
+    def test_different_keys(self):
+        assert self.post_order(key='key-1').status_code == CREATED
+        assert self.post_order(key='key-2').status_code == CREATED
+
+        assert Order.select().count() == 2
+        assert self.item1.reload().availability == 8
+
+    def test_keys_belong_to_users(self):
+        user2 = self.create_user(email='user2@domain.com')
+
+        assert self.post_order(user=self.user1).status_code == CREATED
+        resp = self.post_order(user=user2)
+        assert resp.status_code == CREATED
+        assert 'Idempotent-Replayed' not in resp.headers
+
+        assert Order.select().count() == 2
+
+    def test_without_key(self):
+        assert self.post_order(key=None).status_code == CREATED
+        assert self.post_order(key=None).status_code == CREATED
+
+        assert Order.select().count() == 2
+        assert IdempotencyKey.select().count() == 0
+
+    def test_failure_key_reused_for_different_request(self):
+        assert self.post_order(quantity=1).status_code == CREATED
+
+        resp = self.post_order(quantity=2)
+        assert resp.status_code == UNPROCESSABLE_ENTITY
+        assert Order.select().count() == 1
+        assert self.item1.reload().availability == 9
+
+    def test_failure_invalid_key(self):
+        assert self.post_order(key=' ').status_code == BAD_REQUEST
+        assert self.post_order(key='k' * 256).status_code == BAD_REQUEST
+        assert Order.select().count() == 0
+
+    def test_expired_keys_are_evicted(self):
+        assert self.post_order().status_code == CREATED
+
+        expired = datetime.datetime.utcnow() - datetime.timedelta(seconds=idempotency.TTL + 1)
+        IdempotencyKey.update(created_at=expired).execute()
+
+        resp = self.post_order()
+        assert resp.status_code == CREATED
+        assert 'Idempotent-Replayed' not in resp.headers
+        assert Order.select().count() == 2
+        assert IdempotencyKey.select().count() == 1
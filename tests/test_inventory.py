@@ -0,0 +1,153 @@
+from multiprocessing import get_context
+from playhouse.sqlite_ext import SqliteExtDatabase
+import random
+import uuid
+
+from models import Item, User, Order, OrderItem
+import inventory
+import orders
+import pytest
+
+from .base_test import BaseTest
+
+
+class TestInventory(BaseTest):
+    def test_reserve(self):
+        item1 = self.create_item(availability=5)
+        item2 = self.create_item(availability=5)
+
+        inventory.reserve({item1.id: 5, item2.id: 2})
+
+        assert item1.reload().availability == 0
+        assert item2.reload().availability == 3
+
+    def test_reserve__failure_rolls_back_all_items(self):
+        item1 = self.create_item(availability=5)
+        item2 = self.create_item(availability=1)
+
+        with pytest.raises(inventory.OutOfStock):
+            inventory.reserve({item1.id: 2, item2.id: 2})
+
+        assert item1.reload().availability == 5
+        assert item2.reload().availability == 1
+
+    def test_reserve__failure_non_existing_item(self):
+        item = self.create_item(availability=5)
+
+        with pytest.raises(inventory.OutOfStock):
+            inventory.reserve({item.id: 1, item.id + 1: 1})
+
+        assert item.reload().availability == 5
+
+    def test_reserve__many_batches(self):
+        items = [self.create_item(availability=10) for _ in range(400)]
+
+        inventory.reserve({item.id: 3 for item in items})
+        assert {item.reload().availability for item in items} == {7}
+
+        # The last batch fails after the first ones have been applied.
+        quantities = {item.id: 1 for item in items}
+        quantities[items[-1].id] = 8
+        with pytest.raises(inventory.OutOfStock):
+            inventory.reserve(quantities)
+        assert {item.reload().availability for item in items} == {7}
+
+    def test_release(self):
+        item1 = self.create_item(availability=0)
+        item2 = self.create_item(availability=3)
+
+        inventory.release({item1.id: 2, item2.id: 1})
+
+        assert item1.reload().availability == 2
+        assert item2.reload().availability == 4
+
+    def test_place_order__failure_stock_taken_meanwhile(self):
+        user = self.create_user()
+        item1 = self.create_item(availability=5)
+        item2 = self.create_item(availability=5)
+
+        lines = [[str(item1.uuid), 2], [str(item2.uuid), 4]]
+        quantities = orders.parse_lines(lines)
+        items = orders.fetch_items(quantities)
+
+        # Another worker takes the stock after the items have been loaded.
+        Item.update(availability=3).where(Item.id == item2.id).execute()
+
+        with pytest.raises(orders.OrderError):
+            with Order.atomic():
+                order = Order.create(uuid=uuid.uuid4(), total_price=0, user=user.id)
+                orders.add_lines(order, items, quantities)
+                orders.reserve({item.id: quantities[item.uuid] for item in items})
+
+        assert Order.select().count() == 0
+        assert OrderItem.select().count() == 0
+        assert item1.reload().availability == 5
+        assert item2.reload().availability == 3
+
+
+STRESS_PROCESSES = 8
+STRESS_ORDERS = 40
+STRESS_ITEMS = 5
+STRESS_AVAILABILITY = 100
+
+
+def place_random_orders(path, user_id, item_uuids, seed):
+    database = SqliteExtDatabase(path, timeout=60)
+    for model in (Item, User, Order, OrderItem):
+        model._meta.database = database
+
+    rnd = random.Random(seed)
+    user = User.get(User.id == user_id)
+    placed = 0
+
+    for _ in range(STRESS_ORDERS):
+        lines = [[item_uuid, rnd.randint(1, 5)]
+                 for item_uuid in rnd.sample(item_uuids, rnd.randint(1, len(item_uuids)))]
+        try:
+            orders.place_order(user, lines)
+        except orders.OrderError:
+            continue
+        placed += 1
+
+    database.close()
+    return placed
+
+
+class TestInventoryStress(BaseTest):
+    """Orders placed at the same time by several processes on a shared
+    database must never sell more than the available stock."""
+
+    def setup_method(self):
+        self.database = self.use_temp_database(
+            'stress.db', (Item, User, Order, OrderItem), timeout=60)
+        self.path = self.database.database
+
+    def teardown_method(self):
+        self.database.close()
+        self.restore_databases()
+
+    def test_concurrent_orders__no_oversell(self):
+        user = User.create(
+            uuid=uuid.uuid4(), first_name='First', last_name='Last',
+            email='email@domain.com', password='')
+        items = [
+            Item.create(uuid=uuid.uuid4(), name='Item', price=1, description='Description',
+                        category='Category', availability=STRESS_AVAILABILITY)
+            for _ in range(STRESS_ITEMS)]
+        item_uuids = [str(item.uuid) for item in items]
+        self.database.close()
+
+        with get_context('fork').Pool(STRESS_PROCESSES) as pool:
+            placed = pool.starmap(place_random_orders, [
+                (self.path, user.id, item_uuids, seed) for seed in range(STRESS_PROCESSES)])
+
+        # The demand is well above the stock, so some of the orders must fail.
+        assert 0 < sum(placed) < STRESS_PROCESSES * STRESS_ORDERS
+        assert Order.select().count() == sum(placed)
+
+        for item in items:
+            sold = sum(line.quantity for line in OrderItem.select().where(OrderItem.item == item))
+            availability = item.reload().availability
+
+            assert availability >= 0
+            assert availability + sold == STRESS_AVAILABILITY
@@ -6,7 +6,10 @@ from http.client import NOT_FOUND
 from http.client import OK
 from http.client import BAD_REQUEST
 from http.client import UNAUTHORIZED
+from http.client import NOT_MODIFIED
 from models import Item
+import orders
+import utils
 import hashlib
 import uuid
 import os
@@ -28,6 +31,76 @@ class TestItems(BaseTest):
         assert resp.status_code == OK
         assert json.loads(resp.data.decode()) == [item1.json(), item2.json()]
 
+    def test_get_items__pagination(self):
+        items = [self.create_item() for _ in range(5)]
+
+        resp = self.open('/items/?limit=2', 'get', data='')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [items[0].json(), items[1].json()]
+        assert resp.headers['X-Next-Cursor'] == str(items[1].uuid)
+        assert 'rel="next"' in resp.headers['Link']
+
+        resp = self.open('/items/?limit=2&after={}'.format(items[3].uuid), 'get', data='')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [items[4].json()]
+        assert 'Link' not in resp.headers
+        assert 'X-Next-Cursor' not in resp.headers
+
+    def test_get_items__pagination_follow_link(self):
+        items = [self.create_item() for _ in range(3)]
+
+        resp = self.open('/items/?limit=2', 'get', data='')
+        next_url = resp.headers['Link'].split(';')[0].strip('<>')
+
+        resp = self.open(next_url, 'get', data='')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [items[2].json()]
+
+    def test_get_items__failure_invalid_limit(self):
+        resp = self.open('/items/?limit=0', 'get', data='')
+        assert resp.status_code == BAD_REQUEST
+
+        resp = self.open('/items/?limit=100000', 'get', data='')
+        assert resp.status_code == BAD_REQUEST
+
+    def test_get_items__failure_unknown_cursor(self):
+        self.create_item()
+
+        for url in ('/items/?after={}', '/items/?stream=true&after={}'):
+            resp = self.open(url.format(uuid.uuid4()), 'get', data='')
+            assert resp.status_code == BAD_REQUEST
+            assert 'Unknown cursor' in json.loads(resp.data.decode())['message']['after']
+
+    def test_get_items__stream(self):
+        items = [self.create_item() for _ in range(3)]
+
+        resp = self.open('/items/?stream=true', 'get', data='')
+        assert resp.status_code == OK
+        assert resp.is_streamed
+        assert json.loads(resp.data.decode()) == [item.json() for item in items]
+
+        resp = self.open('/items/?stream=true&after={}'.format(items[0].uuid), 'get', data='')
+        assert json.loads(resp.data.decode()) == [items[1].json(), items[2].json()]
+
+    def test_iter_pages(self):
+        items = [self.create_item() for _ in range(5)]
+
+        pages = utils.iter_pages(Item.select(), Item, Item.serialize_many, size=2)
+        assert list(pages) == [item.json() for item in items]
+
+        pages = utils.iter_pages(Item.select(), Item, Item.serialize_many, items[1].uuid, size=2)
+        assert list(pages) == [item.json() for item in items[2:]]
+
+    def test_json_array_stream__chunks(self):
+        documents = [{'name': 'Item {}'.format(index)} for index in range(100)]
+
+        chunks = list(utils.json_array_stream(iter(documents), chunk_size=100))
+        assert len(chunks) > 1
+        assert all(len(chunk) < 200 for chunk in chunks)
+        assert json.loads(''.join(chunks)) == documents
+
+        assert list(utils.json_array_stream(iter([]))) == ['[]']
+
     def test_create_item__failure_user_is_not_superuser(self):
         user = self.create_user()
         new_item_data = {
@@ -517,3 +590,128 @@ class TestItems(BaseTest):
         resp = self.open('/items/{}/pictures'.format(uuid.uuid4()), 'get', data='')
 
         assert resp.status_code == NOT_FOUND
+
+
+class TestItemsCache(BaseTest):
+    def get(self, url, **headers):
+        return self.app.open(url, method='get', headers=headers)
+
+    def patch_item(self, item, data):
+        user = self.create_user(email='admin@domain.com', superuser=True)
+        return self.open_with_auth(
+            '/items/{}'.format(item.uuid), 'patch', user.email, 'p4ssw0rd', data=data)
+
+    def test_get_item__cache_headers(self):
+        item = self.create_item()
+
+        resp = self.get('/items/{}'.format(item.uuid))
+        assert resp.status_code == OK
+        assert resp.headers['ETag'].startswith('"')
+        assert resp.headers['Cache-Control'] == 'public, max-age=60'
+        assert resp.last_modified == item.updated_at.replace(microsecond=0)
+
+    def test_get_item__not_modified(self, monkeypatch):
+        item = self.create_item()
+        etag = self.get('/items/{}'.format(item.uuid)).headers['ETag']
+
+        def json(self):
+            raise AssertionError('Serialized')
+
+        monkeypatch.setattr(Item, 'json', json)
+        resp = self.get('/items/{}'.format(item.uuid), **{'If-None-Match': etag})
+        assert resp.status_code == NOT_MODIFIED
+        assert resp.data == b''
+        assert resp.headers['ETag'] == etag
+
+    def test_get_item__if_modified_since(self):
+        item = self.create_item()
+        last_modified = self.get('/items/{}'.format(item.uuid)).headers['Last-Modified']
+
+        resp = self.get('/items/{}'.format(item.uuid), **{'If-Modified-Since': last_modified})
+        assert resp.status_code == NOT_MODIFIED
+
+        resp = self.get('/items/{}'.format(item.uuid),
+                        **{'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'})
+        assert resp.status_code == OK
+
+    def test_get_item__changed_by_patch(self):
+        item = self.create_item()
+        etag = self.get('/items/{}'.format(item.uuid)).headers['ETag']
+
+        assert self.patch_item(item, {'name': 'New name'}).status_code == OK
+        assert item.reload().version == 2
+
+        resp = self.get('/items/{}'.format(item.uuid), **{'If-None-Match': etag})
+        assert resp.status_code == OK
+        assert resp.headers['ETag'] != etag
+
+    def test_update_changed__concurrent(self):
+        item = self.create_item()
+        # Two requests loaded the same version of the item.
+        first, second = item.reload(), item.reload()
+
+        first = first.update_changed(name='First')
+        second = second.update_changed(name='Second')
+        assert (first.version, second.version) == (2, 3)
+        assert item.reload().version == 3
+
+    def test_get_item__changed_by_order(self):
+        item = self.create_item(availability=5)
+        etag = self.get('/items/{}'.format(item.uuid)).headers['ETag']
+
+        orders.place_order(self.create_user(), [[str(item.uuid), 2]])
+
+        resp = self.get('/items/{}'.format(item.uuid), **{'If-None-Match': etag})
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode())['availability'] == 3
+
+    def test_get_items__not_modified(self, monkeypatch):
+        item = self.create_item()
+        self.create_item()
+        etag = self.get('/items/').headers['ETag']
+
+        def serialize_many(query=None):
+            raise AssertionError('Serialized')
+
+        monkeypatch.setattr(Item, 'serialize_many', serialize_many)
+        resp = self.get('/items/', **{'If-None-Match': etag})
+        assert resp.status_code == NOT_MODIFIED
+        assert resp.data == b''
+        monkeypatch.undo()
+
+        assert self.patch_item(item, {'availability': 1}).status_code == OK
+        resp = self.get('/items/', **{'If-None-Match': etag})
+        assert resp.status_code == OK
+
+        # Other pages are tagged by their own items.
+        resp = self.get('/items/?limit=1', **{'If-None-Match': etag})
+        assert resp.status_code == OK
+
+    def test_get_items__changed_by_delete(self):
+        items = [self.create_item() for _ in range(3)]
+        etag = self.get('/items/').headers['ETag']
+
+        items[1].delete_instance()
+        resp = self.get('/items/', **{'If-None-Match': etag})
+        assert resp.status_code == OK
+        assert len(json.loads(resp.data.decode())) == 2
+
+    def test_get_item_pictures__not_modified(self):
+        item = self.create_item()
+        self.create_item_picture(item)
+        url = '/items/{}/pictures'.format(item.uuid)
+        etag = self.get(url).headers['ETag']
+
+        assert self.get(url, **{'If-None-Match': etag}).status_code == NOT_MODIFIED
+
+        user = self.create_user(superuser=True)
+        with open(os.path.join('.', 'tests', 'images', 'test_image.png'), 'rb') as image:
+            resp = self.open_with_auth(
+                url, 'post', user.email, 'p4ssw0rd',
+                data={'title': 'Picture', 'file': FileStorage(image)},
+                content_type='multipart/form-data')
+        assert resp.status_code == CREATED
+
+        resp = self.get(url, **{'If-None-Match': etag})
+        assert resp.status_code == OK
+        assert len(json.loads(resp.data.decode())) == 2
@@ -1,5 +1,5 @@
 import uuid
-from models import Item, User, Address, Favorites
+from models import Item, User, Address, Favorites, json_validators, compile_validators
 from jsonschema import ValidationError
 import pytest
 
@@ -155,3 +155,16 @@ class TestValidateJsonschema:
 
         with pytest.raises(ValidationError):
             Favorites.verify_json(data)
+
+    def test_validator_is_built_once(self):
+        validator = Item.get_validator()
+
+        assert Item.get_validator() is validator
+        assert json_validators[Item] is validator
+        assert Address.get_validator() is not validator
+
+    def test_compile_validators(self):
+        json_validators.clear()
+        compile_validators()
+
+        assert set(json_validators) >= {Item, User, Address, Favorites}
@@ -0,0 +1,208 @@
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+import simplejson as json
+import datetime
+import threading
+import time
+import uuid
+
+from app import app
+from models import Mail, User
+import utils
+import mail
+
+from .base_test import BaseTest
+
+
+class ProviderHandler(BaseHTTPRequestHandler):
+    """Stand-in of the mail provider API, answering with the statuses
+    queued in the server and recording the received messages."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        self.server.received.append((self.path, parse_qs(body)))
+        time.sleep(self.server.delay)
+
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+class Provider(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ProviderHandler)
+        self.received = []
+        self.statuses = []
+        self.delay = 0
+
+
+class TestMail(BaseTest):
+    def setup_method(self):
+        super().setup_method()
+        self.provider = Provider()
+        threading.Thread(target=self.provider.serve_forever, daemon=True).start()
+        self.session = mail.create_session()
+
+    def teardown_method(self):
+        self.session.close()
+        self.provider.shutdown()
+        self.provider.server_close()
+
+    def send_pending(self, monkeypatch):
+        monkeypatch.setattr(mail, 'API_URL', 'http://127.0.0.1:{}/v2'.format(
+            self.provider.server_address[1]))
+        monkeypatch.setattr(mail, 'SANDBOX', 'sandbox.test')
+
+        with app.app_context():
+            return mail.send_pending(self.session)
+
+    def queue_mail(self):
+        return mail.send_email(
+            'shop@domain.com', 'user@domain.com', 'Your order', message_title='Thank you',
+            message='Your order is on its way')
+
+    def test_send_email__only_queues(self):
+        self.queue_mail()
+
+        outbox = Mail.get()
+        assert outbox.status == 'pending'
+        assert outbox.attempts == 0
+        assert not self.provider.received
+
+    def test_send_pending__delivers(self, monkeypatch):
+        self.queue_mail()
+
+        assert self.send_pending(monkeypatch) == 1
+
+        path, data = self.provider.received[0]
+        assert path == '/v2/sandbox.test/messages'
+        assert data['from'] == ['shop@domain.com']
+        assert data['to'] == ['user@domain.com']
+        assert data['subject'] == ['Your order']
+        assert '<h1>Thank you</h1>' in data['html'][0]
+        assert '<p>Your order is on its way</p>' in data['html'][0]
+
+        outbox = Mail.get()
+        assert outbox.status == 'sent'
+        assert outbox.attempts == 1
+        assert outbox.sent_at is not None
+
+        # Nothing left to send.
+        assert self.send_pending(monkeypatch) == 0
+        assert len(self.provider.received) == 1
+
+    def test_send_pending__retries_with_backoff(self, monkeypatch):
+        self.queue_mail()
+        self.provider.statuses = [500, 503]
+
+        for attempts in (1, 2):
+            start = datetime.datetime.utcnow()
+            assert self.send_pending(monkeypatch) == 1
+
+            outbox = Mail.get()
+            assert outbox.status == 'pending'
+            assert outbox.attempts == attempts
+            assert 'Server Error' in outbox.last_error
+            delay = outbox.next_attempt - start
+            assert mail.backoff(attempts) <= delay.total_seconds() < mail.backoff(attempts) + 5
+
+            # Not due yet.
+            assert self.send_pending(monkeypatch) == 0
+            Mail.update(next_attempt=start).execute()
+
+        assert self.send_pending(monkeypatch) == 1
+        assert Mail.get().status == 'sent'
+        assert len(self.provider.received) == 3
+
+    def test_send_pending__gives_up(self, monkeypatch):
+        monkeypatch.setattr(mail, 'MAX_ATTEMPTS', 1)
+        self.queue_mail()
+        self.provider.statuses = [500]
+
+        self.send_pending(monkeypatch)
+        assert Mail.get().status == 'failed'
+
+    def test_send_pending__timeout(self, monkeypatch):
+        monkeypatch.setattr(mail, 'TIMEOUT', (1, 0.1))
+        self.queue_mail()
+        self.provider.delay = 0.5
+
+        start = time.monotonic()
+        self.send_pending(monkeypatch)
+        assert time.monotonic() - start < 0.5
+
+        outbox = Mail.get()
+        assert outbox.status == 'pending'
+        assert 'timed out' in outbox.last_error
+
+    def test_take__leased(self):
+        self.queue_mail()
+        now = datetime.datetime.utcnow()
+
+        outbox, = mail.due(now)
+        assert mail.take(outbox)
+        assert mail.due(now) == []
+        # Already taken by another worker.
+        assert not mail.take(outbox)
+        assert len(mail.due(now + datetime.timedelta(seconds=mail.LEASE + 1))) == 1
+
+    def test_send_pending__leased_while_sending(self, monkeypatch):
+        monkeypatch.setattr(mail, 'LEASE', 0.5)
+        for _ in range(2):
+            self.queue_mail()
+        deliver = mail.deliver
+        leases = []
+
+        def slow_deliver(session, outbox):
+            lease = Mail.get(Mail.id == outbox.id).next_attempt
+            leases.append((lease - datetime.datetime.utcnow()).total_seconds())
+            time.sleep(mail.LEASE)
+            deliver(session, outbox)
+
+        monkeypatch.setattr(mail, 'deliver', slow_deliver)
+        assert self.send_pending(monkeypatch) == 2
+
+        # The round took longer than the lease, but each mail was still
+        # hidden from the other workers when sent.
+        assert len(leases) == 2
+        assert all(remaining > 0 for remaining in leases)
+        assert len(self.provider.received) == 2
+
+    def test_backoff(self):
+        assert [mail.backoff(attempts) for attempts in (1, 2, 3)] == [30, 60, 120]
+        assert mail.backoff(20) == mail.MAX_BACKOFF
+
+    def test_send_bulk__one_request_per_thousand_recipients(self, monkeypatch):
+        rows = ({
+            'uuid': uuid.uuid4(),
+            'first_name': 'First {}'.format(index),
+            'last_name': 'Last',
+            'email': 'user{}@domain.com'.format(index),
+            'password': '',
+        } for index in range(2500))
+        for batch in utils.batches(rows):
+            User.insert_many(batch).execute()
+
+        outbox = mail.send_bulk(
+            'shop@domain.com', mail.user_recipients(User.select().order_by(User.id)),
+            'News', message_title='Hello %recipient.first_name%', message='News of the shop')
+        assert len(outbox) == Mail.count() == 3
+
+        assert self.send_pending(monkeypatch) == 3
+        assert [len(data['to']) for _, data in self.provider.received] == [1000, 1000, 500]
+
+        _, data = self.provider.received[2]
+        assert data['to'][0] == 'user2000@domain.com'
+        assert '<h1>Hello %recipient.first_name%</h1>' in data['html'][0]
+        variables = json.loads(data['recipient-variables'][0])
+        assert len(variables) == 500
+        assert variables['user2499@domain.com'] == {
+            'first_name': 'First 2499', 'last_name': 'Last'}
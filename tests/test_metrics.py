@@ -0,0 +1,187 @@
+from http.client import OK, NOT_FOUND, BAD_REQUEST, CREATED, UNAUTHORIZED
+from multiprocessing import get_context
+import simplejson as json
+import time
+import uuid
+import os
+
+import catalog
+import metrics
+
+from .base_test import BaseTest
+
+
+def work(directory, name):
+    """Count in a worker process, that exits with a request in progress."""
+    metrics.DIRECTORY = directory
+    metrics.reset()
+    metrics.incr('jobs_total', kind=name)
+    metrics.add_gauge('jobs_in_flight', 1)
+    metrics.observe('job_seconds', 0.02)
+    metrics.flush(force=True)
+
+
+class TestMetrics(BaseTest):
+    def setup_method(self):
+        super().setup_method()
+        metrics.reset()
+
+    def labels(self, resource, method='GET'):
+        return {'resource': resource, 'method': method}
+
+    def test_request_metrics(self):
+        self.create_item()
+
+        resp = self.open('/items/', 'get', data='')
+        assert resp.status_code == OK
+
+        labels = self.labels('ItemsResource')
+        assert metrics.get('http_requests_total', status=OK, **labels) == 1
+        assert metrics.get_histogram('http_request_duration_seconds', **labels)[0] == 1
+        assert metrics.get_gauge('http_requests_in_flight', **labels) == 0
+
+        count, seconds = metrics.get_histogram('http_request_database_seconds', **labels)
+        assert count == 1 and seconds > 0
+        count, seconds = metrics.get_histogram('http_request_serialization_seconds', **labels)
+        assert count == 1 and seconds > 0
+        assert metrics.get_histogram('http_request_password_hash_seconds', **labels) == (1, 0)
+
+    def test_in_flight(self, monkeypatch):
+        item = self.create_item()
+        get_item = catalog.get_item
+        in_flight = []
+
+        def tracking_get_item(uuid):
+            in_flight.append(metrics.get_gauge(
+                'http_requests_in_flight', **self.labels('ItemResource')))
+            return get_item(uuid)
+
+        monkeypatch.setattr(catalog, 'get_item', tracking_get_item)
+
+        self.open('/items/{}'.format(item.uuid), 'get', data='')
+        assert in_flight == [1]
+        assert metrics.get_gauge('http_requests_in_flight', **self.labels('ItemResource')) == 0
+
+    def test_status(self):
+        self.open('/items/{}'.format(uuid.uuid4()), 'get', data='')
+        self.open('/items/?limit=0', 'get', data='')
+
+        labels = self.labels('ItemResource')
+        assert metrics.get('http_requests_total', status=NOT_FOUND, **labels) == 1
+        labels = self.labels('ItemsResource')
+        assert metrics.get('http_requests_total', status=BAD_REQUEST, **labels) == 1
+
+    def test_password_hash_time(self):
+        user = self.create_user()
+
+        resp = self.open('/sessions/', 'post', data={'email': user.email, 'password': 'p4ssw0rd'})
+        assert resp.status_code == CREATED
+
+        count, seconds = metrics.get_histogram(
+            'http_request_password_hash_seconds', **self.labels('SessionsResource', 'POST'))
+        assert count == 1 and seconds > 0
+
+    def test_exposition(self):
+        metrics.incr('jobs_total', 2, kind='a "b"')
+        metrics.add_gauge('jobs_in_flight', 3)
+        metrics.observe('job_seconds', 0.02)
+        metrics.observe('job_seconds', 20)
+
+        lines = metrics.exposition().splitlines()
+        assert '# TYPE jobs_total counter' in lines
+        assert 'jobs_total{kind="a \\"b\\""} 2' in lines
+        assert '# TYPE jobs_in_flight gauge' in lines
+        assert 'jobs_in_flight 3' in lines
+        assert '# TYPE job_seconds histogram' in lines
+        assert 'job_seconds_bucket{le="0.01"} 0' in lines
+        assert 'job_seconds_bucket{le="0.025"} 1' in lines
+        assert 'job_seconds_bucket{le="10"} 1' in lines
+        assert 'job_seconds_bucket{le="+Inf"} 2' in lines
+        assert 'job_seconds_sum 20.02' in lines
+        assert 'job_seconds_count 2' in lines
+
+    def test_endpoint(self):
+        self.open('/items/', 'get', data='')
+
+        user = self.create_user(superuser=True)
+        resp = self.open_with_auth('/metrics', 'get', user.email, 'p4ssw0rd', data='')
+        assert resp.status_code == OK
+        assert resp.headers['Content-Type'] == 'text/plain; version=0.0.4'
+        body = resp.data.decode()
+        assert ('http_requests_total{method="GET",resource="ItemsResource",status="200"} 1'
+                in body.splitlines())
+        assert 'http_request_duration_seconds_bucket{' in body
+
+    def test_endpoint__superusers_only(self):
+        resp = self.open('/metrics', 'get', data='')
+        assert resp.status_code == UNAUTHORIZED
+
+        user = self.create_user()
+        resp = self.open_with_auth('/metrics', 'get', user.email, 'p4ssw0rd', data='')
+        assert resp.status_code == UNAUTHORIZED
+
+    def test_aggregated_across_processes(self, monkeypatch, tmpdir):
+        directory = str(tmpdir)
+        monkeypatch.setattr(metrics, 'DIRECTORY', directory)
+
+        for name in ('a', 'b'):
+            process = get_context('fork').Process(target=work, args=(directory, name))
+            process.start()
+            process.join()
+        assert len(os.listdir(directory)) == 2
+
+        metrics.incr('jobs_total', kind='a')
+        metrics.add_gauge('jobs_in_flight', 1)
+        metrics.observe('job_seconds', 0.02)
+
+        totals = metrics.collect()
+        assert totals['counter'][metrics.key('jobs_total', {'kind': 'a'})] == 2
+        assert totals['counter'][metrics.key('jobs_total', {'kind': 'b'})] == 1
+        # The gauges of the exited workers are dropped.
+        assert totals['gauge'][metrics.key('jobs_in_flight', {})] == 1
+
+        lines = metrics.exposition().splitlines()
+        assert 'job_seconds_count 3' in lines
+        assert 'job_seconds_bucket{le="0.025"} 3' in lines
+
+    def test_flush__idle_process(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(metrics, 'DIRECTORY', str(tmpdir))
+        monkeypatch.setattr(metrics, 'FLUSH_INTERVAL', 0.1)
+
+        metrics.flush()
+        metrics.incr('jobs_total')
+        # Within the interval: written at its end.
+        metrics.flush()
+
+        time.sleep(0.3)
+        with open(os.path.join(str(tmpdir), metrics.filename())) as data:
+            assert json.load(data)['counters'] == [['jobs_total', [], 1]]
+
+    def test_collect__reused_pid(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(metrics, 'DIRECTORY', str(tmpdir))
+        # Written by an exited process with the pid of this one.
+        tmpdir.join('{}-1.json'.format(os.getpid())).write(json.dumps({
+            'counters': [['jobs_total', [], 2]],
+            'gauges': [['jobs_in_flight', [], 1]],
+            'histograms': [],
+        }))
+
+        metrics.incr('jobs_total')
+        metrics.add_gauge('jobs_in_flight', 1)
+
+        totals = metrics.collect()
+        assert totals['counter'][metrics.key('jobs_total', {})] == 3
+        assert totals['gauge'][metrics.key('jobs_in_flight', {})] == 1
+        assert len(tmpdir.listdir()) == 2
+
+    def test_clear_directory(self, monkeypatch, tmpdir):
+        directory = tmpdir.join('metrics')
+        monkeypatch.setattr(metrics, 'DIRECTORY', str(directory))
+
+        metrics.clear_directory()
+        metrics.flush(force=True)
+        directory.join('README').write('')
+        assert len(directory.listdir()) == 2
+
+        metrics.clear_directory()
+        assert [path.basename for path in directory.listdir()] == ['README']
@@ -31,6 +31,80 @@ class TestOrders(BaseTest):
         assert resp.status_code == OK
         assert json.loads(resp.data.decode()) == [order1.json(), order2.json()]
 
+    def test_get_orders__only_own_orders(self):
+        user2 = self.create_user('user2@email.com')
+        order1 = self.create_order(self.user1)
+        self.create_order(user2)
+
+        resp = self.open_with_auth('/orders/', 'get', self.user1.email, 'p4ssw0rd', data='')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [order1.json()]
+
+    def test_get_orders__pagination(self):
+        orders = [self.create_order(self.user1) for _ in range(5)]
+
+        resp = self.open_with_auth(
+            '/orders/?limit=2', 'get', self.user1.email, 'p4ssw0rd', data='')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [orders[0].json(), orders[1].json()]
+        assert resp.headers['X-Next-Cursor'] == str(orders[1].uuid)
+
+        resp = self.open_with_auth(
+            '/orders/?limit=2&after={}'.format(orders[3].uuid), 'get', self.user1.email,
+            'p4ssw0rd', data='')
+        assert json.loads(resp.data.decode()) == [orders[4].json()]
+        assert 'X-Next-Cursor' not in resp.headers
+
+    def test_get_orders__failure_unknown_cursor(self):
+        self.create_order(self.user1)
+
+        for url in ('/orders/?after={}', '/orders/?stream=true&after={}'):
+            resp = self.open_with_auth(
+                url.format(uuid.uuid4()), 'get', self.user1.email, 'p4ssw0rd', data='')
+            assert resp.status_code == BAD_REQUEST
+
+    def test_get_orders__stream(self):
+        orders = [self.create_order(self.user1) for _ in range(3)]
+        self.create_order(self.create_user('user2@email.com'))
+
+        resp = self.open_with_auth(
+            '/orders/?stream=true', 'get', self.user1.email, 'p4ssw0rd', data='')
+        assert resp.status_code == OK
+        assert resp.is_streamed
+        assert json.loads(resp.data.decode()) == [order.json() for order in orders]
+
+        resp = self.open_with_auth(
+            '/orders/?stream=true&after={}'.format(orders[0].uuid), 'get', self.user1.email,
+            'p4ssw0rd', data='')
+        assert json.loads(resp.data.decode()) == [orders[1].json(), orders[2].json()]
+
+    def test_get_orders__constant_queries(self, monkeypatch):
+        database = Order._meta.database
+        execute_sql = database.execute_sql
+        statements = []
+
+        def counting_execute_sql(sql, *args, **kwargs):
+            statements.append(sql)
+            return execute_sql(sql, *args, **kwargs)
+
+        monkeypatch.setattr(database, 'execute_sql', counting_execute_sql)
+
+        # Both the measured requests find the user in the cache of auth.
+        self.open_with_auth('/orders/', 'get', self.user1.email, 'p4ssw0rd', data='')
+
+        counts = []
+        for _ in range(2):
+            for _ in range(5):
+                self.create_order(self.user1)
+
+            del statements[:]
+            resp = self.open_with_auth('/orders/', 'get', self.user1.email, 'p4ssw0rd', data='')
+            assert resp.status_code == OK
+            counts.append(len(statements))
+
+        assert counts[0] == counts[1]
+        assert len(json.loads(resp.data.decode())) == 10
+
     def test_get_order__empty(self):
         resp = self.open_with_auth(
             '/orders/{}'.format(uuid.uuid4()), 'get', self.user1.email, 'p4ssw0rd', data='')
@@ -88,6 +162,65 @@ class TestOrders(BaseTest):
 
         assert self.item1.get().availability == (start_availability - 2)
 
+    def test_create_order__success_many_lines(self):
+        items = [self.create_item(price=i + 1, availability=1000) for i in range(200)]
+        lines = [[str(item.uuid), i + 1] for i, item in enumerate(items)]
+
+        resp = self.open_with_auth(
+            '/orders/', 'post', self.user1.email, 'p4ssw0rd',
+            data={'user': self.user1.uuid, 'items': json.dumps(lines)})
+        assert resp.status_code == CREATED
+
+        order = Order.get(Order.uuid == json.loads(resp.data.decode())['uuid'])
+        assert order.total_price == sum((i + 1) ** 2 for i in range(200))
+
+        order_items = {oi.item_id: oi for oi in order.order_items}
+        assert len(order_items) == 200
+        for i, item in enumerate(items):
+            assert order_items[item.id].quantity == i + 1
+            assert order_items[item.id].subtotal == (i + 1) ** 2
+            assert item.reload().availability == 1000 - (i + 1)
+
+    def test_create_order__failure_repeated_item(self):
+        new_order_data = {
+            'user': self.user1.uuid,
+            'items': json.dumps([
+                [str(self.item1.uuid), 1], [str(self.item1.uuid), 2]
+            ])
+        }
+
+        resp = self.open_with_auth(
+            '/orders/', 'post', self.user1.email, 'p4ssw0rd', data=new_order_data)
+        assert resp.status_code == BAD_REQUEST
+        assert len(Order.select()) == 0
+
+    def test_create_order__failure_invalid_quantity(self):
+        for quantity in [0, -1, 'two', 1.5, True]:
+            new_order_data = {
+                'user': self.user1.uuid,
+                'items': json.dumps([[str(self.item1.uuid), quantity]])
+            }
+
+            resp = self.open_with_auth(
+                '/orders/', 'post', self.user1.email, 'p4ssw0rd', data=new_order_data)
+            assert resp.status_code == BAD_REQUEST
+
+        assert len(Order.select()) == 0
+        assert self.item1.reload().availability == self.item1.availability
+
+    def test_create_order__failure_malformed_lines(self):
+        for lines in [[str(self.item1.uuid)], [['not-a-uuid', 1]], {'a': 1}]:
+            new_order_data = {
+                'user': self.user1.uuid,
+                'items': json.dumps(lines)
+            }
+
+            resp = self.open_with_auth(
+                '/orders/', 'post', self.user1.email, 'p4ssw0rd', data=new_order_data)
+            assert resp.status_code == BAD_REQUEST
+
+        assert len(Order.select()) == 0
+
     def test_create_order__failure_invalid_field_value(self):
         new_order_data = {
             'user': self.user1.uuid,
@@ -177,6 +310,96 @@ class TestOrders(BaseTest):
         temp_item = Item.get(Item.uuid == self.item2.uuid)
         assert temp_item.availability == (start_availability - 2)
 
+    def place_order(self, lines):
+        resp = self.open_with_auth(
+            '/orders/', 'post', self.user1.email, 'p4ssw0rd',
+            data={'user': self.user1.uuid, 'items': json.dumps(lines)})
+        assert resp.status_code == CREATED
+        return Order.get(Order.uuid == json.loads(resp.data.decode())['uuid'])
+
+    def modify_order(self, order, lines):
+        return self.open_with_auth(
+            '/orders/{}'.format(order.uuid), 'put', self.user1.email, 'p4ssw0rd',
+            data={'items': json.dumps(lines)})
+
+    def test_modify_order__diff(self):
+        item3 = self.create_item(availability=5)
+        order = self.place_order([
+            [str(self.item1.uuid), 1], [str(self.item2.uuid), 2], [str(item3.uuid), 3]])
+        lines = {oi.item_id: oi for oi in order.order_items}
+
+        item4 = self.create_item(price=3, availability=5)
+        resp = self.modify_order(order, [
+            [str(self.item1.uuid), 1], [str(self.item2.uuid), 5], [str(item4.uuid), 2]])
+        assert resp.status_code == OK
+
+        new_lines = {oi.item_id: oi for oi in order.order_items}
+        assert set(new_lines) == {self.item1.id, self.item2.id, item4.id}
+
+        # Unchanged and changed lines are kept, not recreated.
+        assert new_lines[self.item1.id].id == lines[self.item1.id].id
+        assert new_lines[self.item2.id].id == lines[self.item2.id].id
+        assert new_lines[self.item2.id].quantity == 5
+        assert new_lines[self.item2.id].subtotal == self.item2.price * 5
+        assert new_lines[item4.id].quantity == 2
+        assert new_lines[item4.id].subtotal == 6
+
+        assert self.item1.reload().availability == self.item1.availability - 1
+        assert self.item2.reload().availability == self.item2.availability - 5
+        assert item3.reload().availability == 5
+        assert item4.reload().availability == 3
+
+        order_from_server = json.loads(resp.data.decode())
+        assert order_from_server == order.reload().json()
+        assert order_from_server['total_price'] == self.item1.price + self.item2.price * 5 + 6
+
+    def test_modify_order__price_changed(self):
+        item_a = self.create_item(price=10)
+        item_b = self.create_item(price=5)
+        order = self.place_order([[str(item_a.uuid), 1], [str(item_b.uuid), 1]])
+        Item.update(price=100).where(Item.id == item_a.id).execute()
+
+        resp = self.modify_order(order, [[str(item_a.uuid), 1], [str(item_b.uuid), 2]])
+        assert resp.status_code == OK
+
+        # The unchanged line keeps the price it was ordered at.
+        order_from_server = json.loads(resp.data.decode())
+        assert [line['subtotal'] for line in order_from_server['items']] == [10, 10]
+        assert order_from_server['total_price'] == 20
+
+    def test_modify_order__held_stock_counts_as_available(self):
+        item = self.create_item(availability=5)
+        order = self.place_order([[str(item.uuid), 5]])
+        assert item.reload().availability == 0
+
+        resp = self.modify_order(order, [[str(item.uuid), 6]])
+        assert resp.status_code == BAD_REQUEST
+        assert item.reload().availability == 0
+        assert order.order_items.get().quantity == 5
+
+        resp = self.modify_order(order, [[str(item.uuid), 3]])
+        assert resp.status_code == OK
+        assert item.reload().availability == 2
+
+        resp = self.modify_order(order, [[str(item.uuid), 5]])
+        assert resp.status_code == OK
+        assert item.reload().availability == 0
+
+    def test_modify_order__failure_rolls_back(self):
+        item = self.create_item(availability=1)
+        order = self.place_order([[str(self.item1.uuid), 1], [str(self.item2.uuid), 1]])
+        total_price = order.total_price
+
+        resp = self.modify_order(order, [[str(self.item1.uuid), 2], [str(item.uuid), 2]])
+        assert resp.status_code == BAD_REQUEST
+
+        assert {(oi.item_id, oi.quantity) for oi in order.order_items} == {
+            (self.item1.id, 1), (self.item2.id, 1)}
+        assert order.reload().total_price == total_price
+        assert self.item1.reload().availability == self.item1.availability - 1
+        assert self.item2.reload().availability == self.item2.availability - 1
+        assert item.reload().availability == 1
+
     def test_modify_order__failure_invalid_field_value(self):
         order1 = self.create_order(self.user1)
 
@@ -0,0 +1,105 @@
+from http.client import OK, CREATED, SERVICE_UNAVAILABLE
+from passlib.hash import pbkdf2_sha256
+from multiprocessing import get_context
+import threading
+import signal
+import time
+import pytest
+import os
+
+from models import User
+import passwords
+
+from .base_test import BaseTest
+
+
+class TestPasswords(BaseTest):
+    def test_hash_password(self):
+        hashed = passwords.hash_password('p4ssw0rd')
+
+        assert pbkdf2_sha256.from_string(hashed).rounds == passwords.ROUNDS
+        assert passwords.verify_password('p4ssw0rd', hashed) == (True, None)
+        assert passwords.verify_password('wrong', hashed) == (False, None)
+
+    def test_hash_password__inline(self, monkeypatch):
+        monkeypatch.setattr(passwords, 'POOL_SIZE', 0)
+        monkeypatch.setattr(passwords, 'get_executor', None)
+
+        hashed = passwords.hash_password('p4ssw0rd')
+        assert passwords.verify_password('p4ssw0rd', hashed) == (True, None)
+
+    def test_run__busy(self, monkeypatch):
+        monkeypatch.setattr(passwords, 'SLOTS', 1)
+        monkeypatch.setattr(passwords, 'TIMEOUT', 0.01)
+
+        with pytest.raises(passwords.Busy):
+            passwords.run(time.sleep, 0.5)
+
+        # The slot is still held by the sleep that timed out.
+        with pytest.raises(passwords.Busy):
+            passwords.run(time.sleep, 0)
+
+        time.sleep(1)
+        passwords.run(time.sleep, 0)
+
+    def test_run__broken_pool(self):
+        def kill_pool():
+            for process in list(passwords.get_executor()._processes.values()):
+                os.kill(process.pid, signal.SIGKILL)
+
+        # A process dies while hashing, e.g. killed when out of memory.
+        passwords.run(time.sleep, 0)
+        threading.Timer(0.2, kill_pool).start()
+        with pytest.raises(passwords.Busy):
+            passwords.run(time.sleep, 2)
+
+        # A new pool replaces the broken one.
+        hashed = passwords.hash_password('p4ssw0rd')
+        assert passwords.verify_password('p4ssw0rd', hashed) == (True, None)
+
+    def test_acquire__lease(self, monkeypatch):
+        monkeypatch.setattr(passwords, 'SLOTS', 1)
+        monkeypatch.setattr(passwords, 'LEASE', 0.1)
+
+        # The slot of a worker that died while hashing is given back.
+        assert passwords.acquire() is not None
+        assert passwords.acquire() is None
+        time.sleep(0.2)
+        assert passwords.acquire() is not None
+
+    def test_post_user__busy(self, monkeypatch):
+        monkeypatch.setattr(passwords, 'SLOTS', 1)
+
+        # Another worker is hashing a password.
+        process = get_context('fork').Process(target=passwords.acquire)
+        process.start()
+        process.join()
+
+        resp = self.open('/users/', 'post', data={
+            'first_name': 'First', 'last_name': 'Last', 'email': 'email@domain.com',
+            'password': 'p4ssw0rd'})
+
+        assert resp.status_code == SERVICE_UNAVAILABLE
+        assert resp.headers['Retry-After'] == str(passwords.RETRY_AFTER)
+        assert User.count() == 0
+
+    def test_login__upgrades_hash(self):
+        user = self.create_user()
+        user.password = pbkdf2_sha256.using(rounds=1000).hash('p4ssw0rd')
+        user.save()
+
+        resp = self.open_with_auth('/orders/', 'get', user.email, 'p4ssw0rd', data='')
+        assert resp.status_code == OK
+
+        hashed = user.reload().password
+        assert pbkdf2_sha256.from_string(hashed).rounds == passwords.ROUNDS
+        assert pbkdf2_sha256.verify('p4ssw0rd', hashed)
+
+    def test_create_session__keeps_current_hash(self):
+        user = self.create_user()
+        hashed = user.password
+
+        resp = self.open('/sessions/', 'post', data={
+            'email': user.email, 'password': 'p4ssw0rd'})
+        assert resp.status_code == CREATED
+        assert user.reload().password == hashed
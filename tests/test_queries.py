@@ -0,0 +1,119 @@
+from http.client import OK, CREATED
+import simplejson as json
+import pytest
+
+from app import app
+from models import Item
+import metrics
+import queries
+
+from .base_test import BaseTest
+
+
+class TestQueries(BaseTest):
+    def setup_method(self):
+        super().setup_method()
+        metrics.reset()
+
+    def test_shape(self):
+        assert queries.shape('SELECT 1 FROM "item" WHERE "id" IN (?, ?, ?)') == (
+            'SELECT 1 FROM "item" WHERE "id" IN (?)')
+        assert queries.shape('INSERT INTO "a" VALUES (%s, %s), (%s, %s)') == (
+            'INSERT INTO "a" VALUES (%s), (%s)')
+
+    def test_recording(self):
+        item = self.create_item()
+
+        with queries.recording() as recorder:
+            for _ in range(5):
+                Item.get(Item.id == item.id)
+            Item.select().where(Item.id << [1, 2]).count()
+            Item.select().where(Item.id << [1, 2, 3]).count()
+
+        assert len(recorder) == 7
+        assert recorder.duration > 0
+        assert [count for _, count in recorder.repeated()] == [5]
+        assert [count for _, count in recorder.repeated(threshold=2)] == [5, 2]
+
+    def test_assert_max_queries(self):
+        with self.assert_max_queries(1):
+            Item.select().count()
+
+        with pytest.raises(AssertionError):
+            with self.assert_max_queries(1):
+                Item.select().count()
+                Item.select().count()
+
+    def test_debug_headers(self, monkeypatch):
+        self.create_item()
+
+        resp = self.open('/items/', 'get', data='')
+        assert 'X-Query-Count' not in resp.headers
+
+        monkeypatch.setattr(app, 'debug', True)
+        resp = self.open('/items/', 'get', data='')
+        assert int(resp.headers['X-Query-Count']) == 2
+        assert float(resp.headers['X-Query-Time']) > 0
+        assert resp.headers['X-Query-Repeated'] == '0'
+
+    def test_repeated_queries_flagged(self):
+        item = self.create_item()
+
+        with app.test_request_context('/items/'):
+            app.preprocess_request()
+            for _ in range(queries.REPEAT_THRESHOLD):
+                Item.get(Item.id == item.id)
+
+        assert metrics.get('queries_repeated_total', route='itemsresource') == 1
+
+    def warm_auth(self, user):
+        # The measured requests find the user in the cache of auth.
+        self.open_with_auth('/favorites/', 'get', user.email, 'p4ssw0rd', data='')
+
+    def test_get_picture__no_lazy_item(self):
+        picture = self.create_item_picture()
+
+        with self.assert_max_queries(1):
+            resp = self.open('/pictures/{}'.format(picture.uuid), 'get', data='')
+        assert resp.status_code == OK
+
+    def test_get_order__constant_queries(self):
+        user = self.create_user()
+        self.warm_auth(user)
+
+        for lines in (1, 10):
+            order = self.create_order(user, [[self.create_item(), 1] for _ in range(lines)])
+            with self.assert_max_queries(3):
+                resp = self.open_with_auth(
+                    '/orders/{}'.format(order.uuid), 'get', user.email, 'p4ssw0rd', data='')
+            assert resp.status_code == OK
+            assert len(json.loads(resp.data.decode())['items']) == lines
+
+    def test_put_order__constant_queries(self):
+        user = self.create_user()
+        self.warm_auth(user)
+        items = [self.create_item() for _ in range(10)]
+        order = self.create_order(user, [[item, 1] for item in items[:5]])
+
+        with self.assert_max_queries(13):
+            resp = self.open_with_auth(
+                '/orders/{}'.format(order.uuid), 'put', user.email, 'p4ssw0rd',
+                data={'items': json.dumps([[str(item.uuid), 2] for item in items])})
+        assert resp.status_code == OK
+        assert len(json.loads(resp.data.decode())['items']) == 10
+
+    def test_favorites__constant_queries(self):
+        user = self.create_user()
+        self.warm_auth(user)
+        for _ in range(10):
+            user.add_favorite(self.create_item())
+
+        with self.assert_max_queries(2):
+            resp = self.open_with_auth('/favorites/', 'get', user.email, 'p4ssw0rd', data='')
+        assert len(json.loads(resp.data.decode())) == 10
+
+        item = self.create_item()
+        with self.assert_max_queries(2):
+            resp = self.open_with_auth('/favorites/', 'post', user.email, 'p4ssw0rd', data={
+                'id_item': item.uuid})
+        assert resp.status_code == CREATED
@@ -0,0 +1,130 @@
+from http.client import OK, CREATED, UNAUTHORIZED, TOO_MANY_REQUESTS
+from multiprocessing import get_context
+import simplejson as json
+
+from ratelimit import Limit
+import ratelimit
+
+from .base_test import BaseTest
+
+
+def take_all(path, key, number):
+    ratelimit.PATH = path
+    return sum(ratelimit.take(key, Limit(20, 3600))[1] for _ in range(number))
+
+
+class TestRateLimit(BaseTest):
+    def sign_up(self, email, headers=None):
+        return self.app.open('/users/', method='post', headers=headers, data=json.dumps({
+            'first_name': 'First', 'last_name': 'Last', 'email': email,
+            'password': 'p4ssw0rd'}), content_type='application/json')
+
+    def place_order(self, user, item):
+        return self.open_with_auth('/orders/', 'post', user.email, 'p4ssw0rd', data={
+            'user': user.uuid, 'items': json.dumps([[str(item.uuid), 1]])})
+
+    def test_sign_up__limited_by_address(self, monkeypatch):
+        monkeypatch.setitem(ratelimit.LIMITS, 'signup', Limit(2, 60))
+
+        resp = self.sign_up('first@domain.com')
+        assert resp.status_code == CREATED
+        assert resp.headers['RateLimit-Limit'] == '2'
+        assert resp.headers['RateLimit-Remaining'] == '1'
+        assert resp.headers['RateLimit-Reset'] == '30'
+
+        assert self.sign_up('second@domain.com').status_code == CREATED
+
+        resp = self.sign_up('third@domain.com')
+        assert resp.status_code == TOO_MANY_REQUESTS
+        assert resp.headers['RateLimit-Remaining'] == '0'
+        assert resp.headers['Retry-After'] == '30'
+
+    def test_sign_up__forwarded_address(self, monkeypatch):
+        monkeypatch.setitem(ratelimit.LIMITS, 'signup', Limit(1, 60))
+        monkeypatch.setattr(ratelimit, 'PROXIES', 1)
+
+        # Only the address appended by the proxy counts.
+        headers = {'X-Forwarded-For': '10.0.0.1, 192.168.0.1'}
+        assert self.sign_up('first@domain.com', headers).status_code == CREATED
+        headers = {'X-Forwarded-For': '10.0.0.2, 192.168.0.1'}
+        assert self.sign_up('second@domain.com', headers).status_code == TOO_MANY_REQUESTS
+        headers = {'X-Forwarded-For': '192.168.0.2'}
+        assert self.sign_up('third@domain.com', headers).status_code == CREATED
+
+    def test_orders__limited_by_user(self, monkeypatch):
+        monkeypatch.setitem(ratelimit.LIMITS, 'orders', Limit(1, 60))
+        user1 = self.create_user(email='first@domain.com')
+        user2 = self.create_user(email='second@domain.com')
+        item = self.create_item()
+
+        assert self.place_order(user1, item).status_code == CREATED
+        assert self.place_order(user1, item).status_code == TOO_MANY_REQUESTS
+        assert self.place_order(user2, item).status_code == CREATED
+
+    def test_failed_logins(self, monkeypatch):
+        monkeypatch.setitem(ratelimit.LIMITS, 'failed_login', Limit(2, 300))
+        user = self.create_user()
+
+        for _ in range(2):
+            resp = self.open_with_auth('/orders/', 'get', user.email, 'wrong', data='')
+            assert resp.status_code == UNAUTHORIZED
+
+        resp = self.open_with_auth('/orders/', 'get', user.email, 'wrong', data='')
+        assert resp.status_code == TOO_MANY_REQUESTS
+        assert resp.headers['Retry-After'] == '150'
+
+        # Until the bucket refills, the right password isn't checked either.
+        resp = self.open_with_auth('/orders/', 'get', user.email, 'p4ssw0rd', data='')
+        assert resp.status_code == TOO_MANY_REQUESTS
+
+    def test_logins__cached_credentials_not_counted(self, monkeypatch):
+        monkeypatch.setitem(ratelimit.LIMITS, 'login', Limit(1, 60))
+        user = self.create_user()
+
+        for _ in range(3):
+            resp = self.open_with_auth('/orders/', 'get', user.email, 'p4ssw0rd', data='')
+            assert resp.status_code == OK
+
+        resp = self.open_with_auth('/orders/', 'get', user.email, 'wrong', data='')
+        assert resp.status_code == TOO_MANY_REQUESTS
+
+    def test_no_credentials__not_counted(self, monkeypatch):
+        monkeypatch.setitem(ratelimit.LIMITS, 'failed_login', Limit(1, 300))
+
+        for _ in range(3):
+            assert self.open('/orders/', 'get', data='').status_code == UNAUTHORIZED
+
+    def test_take__refills(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(ratelimit.time, 'time', lambda: now[0])
+        limit = Limit(2, 10)
+
+        assert ratelimit.take('key', limit) == ((limit, 1), True)
+        assert ratelimit.take('key', limit) == ((limit, 0), True)
+        assert ratelimit.take('key', limit) == ((limit, 0), False)
+
+        now[0] += 5
+        assert ratelimit.take('key', limit) == ((limit, 0), True)
+
+        now[0] += 60
+        assert ratelimit.take('key', limit) == ((limit, 1), True)
+
+    def test_peek__no_write(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(ratelimit.time, 'time', lambda: now[0])
+        limit = Limit(2, 10)
+
+        assert ratelimit.peek('key', limit) == (limit, 2)
+        assert ratelimit.connection().execute('SELECT count(*) FROM bucket').fetchone() == (0,)
+
+        ratelimit.take('key', limit)
+        ratelimit.take('key', limit)
+        now[0] += 5
+        assert ratelimit.peek('key', limit) == (limit, 1)
+        assert ratelimit.take('key', limit) == ((limit, 0), True)
+
+    def test_take__shared_by_processes(self):
+        with get_context('fork').Pool(4) as pool:
+            taken = pool.starmap(take_all, [(ratelimit.PATH, 'key', 10)] * 4)
+
+        assert sum(taken) == 20
@@ -0,0 +1,133 @@
+from playhouse.sqlite_ext import SqliteExtDatabase
+from multiprocessing import get_context
+from http.client import OK, CREATED
+from flask import g
+import simplejson as json
+import shutil
+import os
+
+from app import app
+from models import Item, Order
+import replicas
+
+from .base_test import BaseTest
+
+
+class TestReplicas(BaseTest):
+    """The tables live in two SQLite files, standing in for the primary
+    and its replica. `replicate` copies the primary over the replica."""
+
+    def setup_method(self):
+        self.primary = self.use_temp_database('primary.db')
+        self.primary_path = self.primary.database
+        self.replica_path = os.path.join(self.database_dir, 'replica.db')
+        self.replica = SqliteExtDatabase(self.replica_path)
+        self.replicate()
+
+        replicas.databases[:] = [self.replica]
+        replicas.reset()
+
+    def teardown_method(self):
+        replicas.databases[:] = []
+        self.close()
+        self.restore_databases()
+
+    def close(self):
+        for database in (self.primary, self.replica):
+            if not database.is_closed():
+                database.close()
+
+    def replicate(self):
+        self.close()
+        shutil.copy(self.primary_path, self.replica_path)
+
+    def test_get_items__reads_replica(self):
+        item = self.create_item(name='Replicated')
+        self.replicate()
+        Item.update(name='Not replicated').where(Item.id == item.id).execute()
+        self.create_item()
+
+        resp = self.open('/items/', 'get', data='')
+        assert resp.status_code == OK
+        assert [i['name'] for i in json.loads(resp.data.decode())] == ['Replicated']
+
+    def test_get_item__cached_from_primary(self):
+        user = self.create_user(superuser=True)
+        item = self.create_item(name='Old name')
+        self.replicate()
+
+        resp = self.open_with_auth(
+            '/items/{}'.format(item.uuid), 'patch', user.email, 'p4ssw0rd',
+            data={'name': 'New name'})
+        assert resp.status_code == OK
+        assert item.reload().name == 'New name'
+
+        # The replica lags behind, but the cached item is loaded from the
+        # primary, and new items are found before they're replicated.
+        resp = self.open('/items/{}'.format(item.uuid), 'get', data='')
+        assert json.loads(resp.data.decode())['name'] == 'New name'
+        new_item = self.create_item()
+        resp = self.open('/items/{}'.format(new_item.uuid), 'get', data='')
+        assert resp.status_code == OK
+
+    def test_on_primary(self):
+        with app.test_request_context():
+            g.read_only = True
+            with replicas.on_primary():
+                assert replicas.replica_for(self.primary) is None
+            assert replicas.replica_for(self.primary) is self.replica
+
+    def test_get_orders__reads_own_writes(self, monkeypatch):
+        user = self.create_user()
+        item = self.create_item()
+        self.replicate()
+
+        resp = self.open_with_auth(
+            '/orders/', 'post', user.email, 'p4ssw0rd',
+            data={'user': user.uuid, 'items': json.dumps([[str(item.uuid), 1]])})
+        assert resp.status_code == CREATED
+        assert Order.select().count() == 1
+
+        resp = self.open_with_auth('/orders/', 'get', user.email, 'p4ssw0rd', data='')
+        assert len(json.loads(resp.data.decode())) == 1
+
+        # Once the window is over the orders are read from the replica.
+        monkeypatch.setattr(replicas, 'READ_YOUR_WRITES_WINDOW', 0)
+        resp = self.open_with_auth('/orders/', 'get', user.email, 'p4ssw0rd', data='')
+        assert json.loads(resp.data.decode()) == []
+
+    def test_record_write__shared_by_workers(self):
+        # The write is served by another worker.
+        process = get_context('fork').Process(target=replicas.record_write, args=(1,))
+        process.start()
+        process.join()
+
+        assert replicas.recently_wrote(1)
+        assert not replicas.recently_wrote(2)
+
+    def test_record_write__drops_old_writes(self, monkeypatch):
+        replicas.record_write(1)
+        # Written before the window.
+        replicas.connection().execute(
+            'UPDATE write SET time = time - ?', (replicas.READ_YOUR_WRITES_WINDOW,))
+
+        monkeypatch.setattr(replicas, 'PURGE_PROBABILITY', 1)
+        replicas.record_write(2)
+        rows = replicas.connection().execute('SELECT user_id FROM write').fetchall()
+        assert rows == [(2,)]
+
+    def test_replica_for__read_only_only(self):
+        with app.test_request_context():
+            assert replicas.replica_for(self.primary) is None
+
+            g.read_only = True
+            assert replicas.replica_for(self.primary) is self.replica
+
+    def test_replica_for__not_in_transaction(self):
+        with app.test_request_context():
+            g.read_only = True
+
+            with Item.atomic():
+                assert replicas.replica_for(self.primary) is None
+
+            assert replicas.replica_for(self.primary) is self.replica
@@ -0,0 +1,112 @@
+import json
+from http.client import OK, BAD_REQUEST
+
+from models import ItemIndex
+import search
+
+from .base_test import BaseTest
+
+
+class TestSearch(BaseTest):
+    def search(self, url):
+        resp = self.open(url, 'get', data='')
+        assert resp.status_code == OK
+        return resp, json.loads(resp.data.decode())
+
+    def create_indexed_item(self, **kwargs):
+        item = self.create_item(**kwargs)
+        search.index_item(item)
+        return item
+
+    def test_search__empty(self):
+        self.create_indexed_item(name='Chair')
+
+        resp, data = self.search('/items/search?q=table')
+        assert data == []
+
+    def test_search__match_any_field(self):
+        chair = self.create_indexed_item(name='Chair', description='Wooden', category='Kitchen')
+        table = self.create_indexed_item(name='Table', description='Glass', category='Office')
+
+        assert self.search('/items/search?q=chair')[1] == [chair.json()]
+        assert self.search('/items/search?q=glass')[1] == [table.json()]
+        assert self.search('/items/search?q=office')[1] == [table.json()]
+
+    def test_search__all_terms_required(self):
+        self.create_indexed_item(name='Red chair')
+        red_table = self.create_indexed_item(name='Red table')
+
+        assert self.search('/items/search?q=red table')[1] == [red_table.json()]
+
+    def test_search__stemming(self):
+        chairs = self.create_indexed_item(name='Chairs')
+
+        assert self.search('/items/search?q=chair')[1] == [chairs.json()]
+
+    def test_search__ranking(self):
+        once = self.create_indexed_item(name='Lamp', description='Desk')
+        twice = self.create_indexed_item(name='Desk', description='Desk lamp', category='Desk')
+
+        assert self.search('/items/search?q=desk')[1] == [twice.json(), once.json()]
+
+    def test_search__query_syntax_is_escaped(self):
+        item = self.create_indexed_item(name='Chair', description='"Comfy" NOT cheap')
+
+        assert self.search('/items/search?q="comfy" NOT')[1] == [item.json()]
+        assert self.search('/items/search?q=chair*(')[1] == [item.json()]
+
+    def test_search__pagination(self):
+        items = [self.create_indexed_item(name='Chair') for _ in range(3)]
+
+        resp, data = self.search('/items/search?q=chair&limit=2')
+        assert data == [items[0].json(), items[1].json()]
+        next_url = resp.headers['Link'].split(';')[0].strip('<>')
+
+        resp, data = self.search(next_url)
+        assert data == [items[2].json()]
+        assert 'Link' not in resp.headers
+
+    def test_search__failure_missing_query(self):
+        resp = self.open('/items/search', 'get', data='')
+        assert resp.status_code == BAD_REQUEST
+
+        resp = self.open('/items/search?q=%20', 'get', data='')
+        assert resp.status_code == BAD_REQUEST
+
+    def test_search__index_follows_item_changes(self):
+        user = self.create_user(superuser=True)
+        item_data = {
+            'name': 'Chair',
+            'price': 10,
+            'description': 'Wooden',
+            'category': 'Kitchen',
+            'availability': 1,
+        }
+
+        resp = self.open_with_auth('/items/', 'post', user.email, 'p4ssw0rd', data=item_data)
+        item_uuid = json.loads(resp.data.decode())['uuid']
+        assert [i['uuid'] for i in self.search('/items/search?q=chair')[1]] == [item_uuid]
+
+        item_data['name'] = 'Table'
+        self.open_with_auth(
+            '/items/{}'.format(item_uuid), 'put', user.email, 'p4ssw0rd', data=item_data)
+        assert self.search('/items/search?q=chair')[1] == []
+        assert [i['uuid'] for i in self.search('/items/search?q=table')[1]] == [item_uuid]
+
+        self.open_with_auth(
+            '/items/{}'.format(item_uuid), 'patch', user.email, 'p4ssw0rd',
+            data={'name': 'Sofa'})
+        assert self.search('/items/search?q=table')[1] == []
+        assert [i['uuid'] for i in self.search('/items/search?q=sofa')[1]] == [item_uuid]
+
+        self.open_with_auth('/items/{}'.format(item_uuid), 'delete', user.email, 'p4ssw0rd',
+                            data='')
+        assert self.search('/items/search?q=sofa')[1] == []
+        assert ItemIndex.select().count() == 0
+
+    def test_rebuild_index(self):
+        item = self.create_item(name='Chair')
+        assert self.search('/items/search?q=chair')[1] == []
+
+        search.rebuild_index()
+        assert self.search('/items/search?q=chair')[1] == [item.json()]
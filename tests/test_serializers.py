@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+from models import Item, User, Address, Order, OrderItem, Favorites, Picture
+
+from .base_test import BaseTest
+
+
+class TestSerializeMany(BaseTest):
+    def setup_method(self):
+        super(TestSerializeMany, self).setup_method()
+        self.user1 = self.create_user()
+        self.user2 = self.create_user(email='user2@domain.com', superuser=True)
+        self.item1 = self.create_item(price=Decimal('10.25'))
+        self.item2 = self.create_item(name='Another item', price=3, availability=0)
+
+    def assert_equivalent(self, model, query=None):
+        if query is None:
+            query = model.select()
+
+        expected = [obj.json() for obj in query.clone()]
+        assert expected
+        assert model.serialize_many(query) == expected
+
+    def test_item(self):
+        self.assert_equivalent(Item)
+
+    def test_user(self):
+        User.update(status='blocked').where(User.id == self.user2.id).execute()
+
+        self.assert_equivalent(User)
+        assert 'password' not in User.serialize_many()[0]
+
+    def test_address(self):
+        self.create_address(self.user1)
+        self.create_address(self.user2, city='Firenze')
+
+        self.assert_equivalent(Address)
+
+    def test_order_item(self):
+        self.create_order(self.user1, [[self.item1, 2], [self.item2, 1]])
+
+        self.assert_equivalent(OrderItem)
+
+    def test_order(self):
+        self.create_order(self.user1, [[self.item1, 2]])
+        self.create_order(self.user2, [[self.item1, 1], [self.item2, 3]])
+
+        self.assert_equivalent(Order)
+
+    def test_favorites(self):
+        self.user1.add_favorite(self.item1)
+        self.user2.add_favorite(self.item2)
+
+        self.assert_equivalent(Favorites)
+
+    def test_picture(self):
+        self.create_item_picture(self.item1)
+        self.create_item_picture(self.item2, title='Other picture', extension='png')
+
+        self.assert_equivalent(Picture)
+
+    def test_query_is_honored(self):
+        items = [self.create_item() for _ in range(3)]
+        query = Item.select().where(Item.id > self.item2.id).order_by(Item.id.desc()).limit(2)
+
+        assert Item.serialize_many(query) == [items[2].json(), items[1].json()]
+
+    def test_joined_query(self):
+        self.create_address(self.user1)
+        self.create_address(self.user2)
+        query = Address.select().join(User).where(User.superuser == True)  # noqa: E712
+
+        self.assert_equivalent(Address, query)
+        assert [a['user'] for a in Address.serialize_many(query)] == [str(self.user2.uuid)]
+
+    def test_favorite_items(self):
+        self.user1.add_favorite(self.item2)
+        self.user1.add_favorite(self.item1)
+        self.user2.add_favorite(self.item1)
+
+        assert self.user1.favorite_items() == [self.item2.json(), self.item1.json()]
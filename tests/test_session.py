@@ -0,0 +1,115 @@
+from http.client import OK, CREATED, NO_CONTENT, UNAUTHORIZED, BAD_REQUEST
+import simplejson as json
+
+from models import User, Item
+import auth
+
+from .base_test import BaseTest
+
+
+class TestSession(BaseTest):
+    def create_session(self, email='email@domain.com', password='p4ssw0rd'):
+        return self.open('/sessions/', 'post', data={'email': email, 'password': password})
+
+    def create_token(self, **kwargs):
+        resp = self.create_session(**kwargs)
+        assert resp.status_code == CREATED
+        return json.loads(resp.data.decode())['token']
+
+    def open_with_token(self, url, method, token, data=''):
+        return self.app.open(
+            url, method=method, headers={'Authorization': 'Bearer ' + token},
+            data=json.dumps(data), content_type='application/json')
+
+    def test_post__success(self):
+        self.create_user()
+
+        resp = self.create_session()
+        assert resp.status_code == CREATED
+
+        session = json.loads(resp.data.decode())
+        assert session['token']
+        assert session['expires_in'] == auth.SESSION_TTL
+
+    def test_post__failure_wrong_password(self):
+        self.create_user()
+
+        assert self.create_session(password='wrong').status_code == UNAUTHORIZED
+
+    def test_post__failure_missing_password(self):
+        resp = self.open('/sessions/', 'post', data={'email': 'email@domain.com'})
+        assert resp.status_code == BAD_REQUEST
+
+    def test_token__authenticates_without_password(self, monkeypatch):
+        user = self.create_user()
+        token = self.create_token()
+
+        def verify_password(user, password):
+            raise AssertionError('The password is verified again')
+
+        monkeypatch.setattr(User, 'verify_password', verify_password)
+        order = self.create_order(user)
+
+        resp = self.open_with_token('/orders/', 'get', token)
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [order.json()]
+
+    def test_token__superuser(self):
+        self.create_user(superuser=True)
+        token = self.create_token()
+
+        resp = self.open_with_token('/items/', 'post', token, data={
+            'name': 'Item', 'price': 5, 'description': 'Description', 'category': 'Category',
+            'availability': 1})
+        assert resp.status_code == CREATED
+        assert Item.count() == 1
+
+    def test_token__failure_tampered(self):
+        self.create_user()
+        token = self.create_token()
+
+        resp = self.open_with_token('/orders/', 'get', token[:-2] + 'xx')
+        assert resp.status_code == UNAUTHORIZED
+
+    def test_token__failure_expired(self, monkeypatch):
+        self.create_user()
+        token = self.create_token()
+
+        monkeypatch.setattr(auth, 'SESSION_TTL', -1)
+        assert self.open_with_token('/orders/', 'get', token).status_code == UNAUTHORIZED
+
+    def test_token__failure_password_changed(self):
+        user = self.create_user()
+        token = self.create_token()
+
+        resp = self.open_with_token('/users/{}'.format(user.uuid), 'put', token, data={
+            'first_name': 'First', 'last_name': 'Last', 'email': 'email@domain.com',
+            'password': 'n3wp4ssw0rd'})
+        assert resp.status_code == CREATED
+        assert user.reload().session_version == 1
+
+        assert self.open_with_token('/orders/', 'get', token).status_code == UNAUTHORIZED
+
+        token = self.create_token(password='n3wp4ssw0rd')
+        assert self.open_with_token('/orders/', 'get', token).status_code == OK
+
+    def test_token__failure_changed_by_other_worker(self):
+        user = self.create_user()
+        token = self.create_token()
+
+        # The session version of the user was bumped by another worker.
+        auth.connection().execute(
+            'INSERT INTO session_version (user_id, version, updated) VALUES (?, 1, 0)',
+            (user.id,))
+
+        assert self.open_with_token('/orders/', 'get', token).status_code == UNAUTHORIZED
+
+    def test_token__failure_user_deleted(self):
+        user = self.create_user()
+        token = self.create_token()
+
+        resp = self.open_with_token('/users/{}'.format(user.uuid), 'delete', token)
+        assert resp.status_code == NO_CONTENT
+
+        assert self.open_with_token('/orders/', 'get', token).status_code == UNAUTHORIZED
+        assert self.create_session().status_code == UNAUTHORIZED
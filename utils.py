@@ -1,4 +1,175 @@
+from flask import request, Response
+from werkzeug.http import http_date, quote_etag
+from urllib.parse import urlencode
+from http.client import NOT_MODIFIED
+import simplejson as json
+import itertools
+import compression
+import formats
+import hashlib
+import uuid
+import os
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows written per statement, to keep the bound parameters of each query
+# under the SQLite limit of 999.
+BATCH_SIZE = 150
+
+# Characters of a streamed JSON response sent at once.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Seconds the clients and the proxies in between may reuse a response of
+# the catalog without asking again.
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', 60))
+
+
 def non_empty_str(val, name):
     if not str(val).strip():
         raise ValueError('The argument {} is not empty'.format(name))
     return str(val)
+
+
+def uuid_value(val, name):
+    """UUID from its string, or as decoded from a binary request body."""
+    if isinstance(val, uuid.UUID):
+        return val
+    return uuid.UUID(str(val))
+
+
+def body_location():
+    """Location of the arguments of the request body for `reqparse`: the
+    decoded JSON, MessagePack or CBOR body, whose lists would be split in
+    several values if merged with the form, or else the form."""
+    if request.get_json(silent=True) is not None:
+        return 'json'
+    return 'values'
+
+
+def cursor(model):
+    """Type of the `after` argument of the listings of `model`: the uuid of
+    one of its rows. `keyset` would answer an unknown one with an empty page,
+    as at the end of the listing."""
+    def parse(val, name):
+        after = uuid_value(val, name)
+        if not model.select().where(model.uuid == after).exists():
+            raise ValueError('Unknown cursor {}'.format(after))
+        return after
+    return parse
+
+
+def page_size(val, name):
+    size = int(val)
+    if not 1 <= size <= MAX_PAGE_SIZE:
+        raise ValueError('The argument {} must be between 1 and {}'.format(name, MAX_PAGE_SIZE))
+    return size
+
+
+def keyset(query, model, after=None, limit=DEFAULT_PAGE_SIZE):
+    """Restrict `query` to the rows following the one whose uuid is `after`.
+
+    Rows are ordered by primary key and one extra row is fetched, so that
+    `paginate` can tell whether a next page exists.
+    """
+    if after is not None:
+        query = query.where(model.id > model.select(model.id).where(model.uuid == after))
+
+    return query.order_by(model.id).limit(limit + 1)
+
+
+def paginate(data, limit):
+    """Trim the extra row fetched by `keyset` and build the headers
+    pointing to the next page, if any."""
+    if len(data) <= limit:
+        return data, {}
+
+    data = data[:limit]
+    cursor = str(data[-1]['uuid'])
+
+    return data, {
+        'Link': next_page_link(after=cursor, limit=limit),
+        'X-Next-Cursor': cursor,
+    }
+
+
+def next_page_link(**params):
+    """Build a Link header to the current url with `params` replaced."""
+    args = request.args.to_dict()
+    args.update(params)
+    next_url = '{}?{}'.format(request.base_url, urlencode(sorted(args.items())))
+
+    return '<{}>; rel="next"'.format(next_url)
+
+
+def batches(rows, size=BATCH_SIZE):
+    """Split `rows`, any iterable, in lists of up to `size` rows, consuming
+    it one batch at a time."""
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_pages(query, model, serialize, after=None, size=MAX_PAGE_SIZE):
+    """Yield the rows of `query` serialized by `serialize` one keyset page at
+    a time, so that exports never hold more than a page of rows in memory."""
+    while True:
+        page = serialize(keyset(query, model, after, size))
+        yield from page[:size]
+
+        if len(page) <= size:
+            return
+        after = page[size - 1]['uuid']
+
+
+def json_array_stream(documents, chunk_size=STREAM_CHUNK_SIZE):
+    """Encode an iterable of documents as a JSON array, in chunks of about
+    `chunk_size` characters."""
+    chunk = ['[']
+    length = 1
+    for index, document in enumerate(documents):
+        encoded = (',' if index else '') + json.dumps(document)
+        chunk.append(encoded)
+        length += len(encoded)
+        if length >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+def etag(*parts):
+    """Strong ETag of a representation built from `parts`."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def cache_headers(tag, last_modified=None):
+    headers = {
+        'ETag': quote_etag(formats.representation_tag(tag)),
+        'Cache-Control': 'public, max-age={}'.format(CATALOG_MAX_AGE),
+        'Vary': 'Accept',
+    }
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def not_modified(tag, last_modified=None):
+    """Whether the copy cached by the client is still fresh, according to
+    If-None-Match or, when missing, If-Modified-Since."""
+    if request.if_none_match:
+        tags = compression.tag_variants(formats.representation_tag(tag))
+        return any(request.if_none_match.contains_weak(variant) for variant in tags)
+
+    if request.if_modified_since and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+
+    return False
+
+
+def not_modified_response(headers):
+    return Response(status=NOT_MODIFIED, headers=headers)
@@ -4,6 +4,7 @@ from http.client import CREATED, NOT_FOUND, NO_CONTENT, BAD_REQUEST, OK
 from flask_restful import Resource
 from flask import g, request
 import auth
+import replicas
 from jsonschema import ValidationError
 
 # import utils
@@ -33,6 +34,7 @@ class AddressesResource(Resource):
 
 class AddressResource(Resource):
     @auth.login_required
+    @replicas.read_only
     def get(self, address_id):
         try:
             address = (
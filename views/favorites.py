@@ -5,20 +5,20 @@ from http.client import NO_CONTENT
 from http.client import CREATED
 from http.client import BAD_REQUEST
 from models import Item, Favorites
-import uuid
 import auth
+import utils
 from flask import g
 
 
 class FavoritesResource(Resource):
     @auth.login_required
     def get(self):
-        return g.current_user.favorite_items(), OK
+        return g.current_user.iter_favorite_items(), OK
 
     @auth.login_required
     def post(self):
         parser = reqparse.RequestParser()
-        parser.add_argument('id_item', type=type(uuid.uuid4()), required=True)
+        parser.add_argument('id_item', type=utils.uuid_value, required=True)
         args = parser.parse_args(strict=True)
 
         try:
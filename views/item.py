@@ -1,4 +1,4 @@
-from flask_restful import Resource, reqparse, abort, request
+from flask_restful import Resource, reqparse, abort, request, inputs
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 from http.client import CREATED
@@ -8,12 +8,16 @@ from http.client import OK
 from http.client import BAD_REQUEST
 from http.client import UNAUTHORIZED
 from flask import current_app, g
+import datetime
 import uuid
 import os
 
 from models import Item, Picture
+import catalog
+import search
 import utils
 import auth
+import replicas
 
 from jsonschema import ValidationError
 
@@ -27,8 +31,30 @@ def non_empty_string(string):
 
 
 class ItemsResource(Resource):
+    @replicas.read_only
     def get(self):
-        return [obj.json() for obj in Item.select()], OK
+        parser = reqparse.RequestParser()
+        parser.add_argument('limit', type=utils.page_size, location='args',
+                            default=utils.DEFAULT_PAGE_SIZE)
+        parser.add_argument('after', type=utils.cursor(Item), location='args')
+        parser.add_argument('stream', type=inputs.boolean, location='args', default=False)
+        args = parser.parse_args()
+
+        if args['stream']:
+            return utils.iter_pages(Item.select(), Item, Item.serialize_many, args['after']), OK
+
+        query = utils.keyset(Item.select(), Item, args['after'], args['limit'])
+
+        # The page is tagged with the versions of its items, so that it's
+        # serialized only when the client's copy is stale.
+        tag = utils.etag(list(query.select(Item.id, Item.version).tuples()))
+        cache_headers = utils.cache_headers(tag)
+        if utils.not_modified(tag):
+            return utils.not_modified_response(cache_headers)
+
+        data, headers = utils.paginate(Item.serialize_many(query), args['limit'])
+        headers.update(cache_headers)
+        return data, OK, headers
 
     @auth.login_required
     def post(self):
@@ -47,25 +73,56 @@ class ItemsResource(Resource):
         except ValidationError as ver_json_error:
             return ver_json_error.message, BAD_REQUEST
 
-        obj = Item.create(
-            uuid=uuid.uuid4(),
-            name=jsondata['name'],
-            price=jsondata['price'],
-            description=jsondata['description'],
-            category=jsondata['category'],
-            availability=jsondata['availability']
-        )
+        with Item.atomic():
+            obj = Item.create(
+                uuid=uuid.uuid4(),
+                name=jsondata['name'],
+                price=jsondata['price'],
+                description=jsondata['description'],
+                category=jsondata['category'],
+                availability=jsondata['availability']
+            )
+            search.index_item(obj)
 
         return obj.json(), CREATED
 
 
+class ItemsSearchResource(Resource):
+    def get(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('q', type=utils.non_empty_str, location='args', required=True)
+        parser.add_argument('page', type=inputs.positive, location='args', default=1)
+        parser.add_argument('limit', type=utils.page_size, location='args',
+                            default=utils.DEFAULT_PAGE_SIZE)
+        args = parser.parse_args()
+
+        limit = args['limit']
+        query = search.search_items(args['q']).limit(limit + 1).offset((args['page'] - 1) * limit)
+        data = Item.serialize_many(query)
+
+        headers = {}
+        if len(data) > limit:
+            data = data[:limit]
+            headers['Link'] = utils.next_page_link(page=args['page'] + 1)
+
+        return data, OK, headers
+
+
 class ItemResource(Resource):
+    @replicas.read_only
     def get(self, uuid):
-        try:
-            return Item.get(Item.uuid == uuid).json(), OK
-        except Item.DoesNotExist:
+        item = catalog.get_item(uuid)
+        if item is None:
             return None, NOT_FOUND
 
+        tag = utils.etag(item['id'], item['version'])
+        updated_at = datetime.datetime.utcfromtimestamp(item['updated_at'])
+        headers = utils.cache_headers(tag, updated_at)
+        if utils.not_modified(tag, updated_at):
+            return utils.not_modified_response(headers)
+
+        return item['document'], OK, headers
+
     @auth.login_required
     def delete(self, uuid):
         if not g.current_user.superuser:
@@ -76,7 +133,10 @@ class ItemResource(Resource):
         except Item.DoesNotExist:
             return None, NOT_FOUND
 
-        item.delete_instance()
+        with Item.atomic():
+            search.unindex_item(item)
+            item.delete_instance()
+        catalog.invalidate([item.uuid])
         return None, NO_CONTENT
 
     @auth.login_required
@@ -101,12 +161,16 @@ class ItemResource(Resource):
         except ValidationError as ver_json_error:
             return ver_json_error.message, BAD_REQUEST
 
-        obj.name = jsondata['name']
-        obj.price = jsondata['price']
-        obj.description = jsondata['description']
-        obj.category = jsondata['category']
-        obj.availability = jsondata['availability']
-        obj.save()
+        with Item.atomic():
+            obj = obj.update_changed(
+                name=jsondata['name'],
+                price=jsondata['price'],
+                description=jsondata['description'],
+                category=jsondata['category'],
+                availability=jsondata['availability'],
+            )
+            search.index_item(obj)
+        catalog.invalidate([obj.uuid])
 
         return obj.json(), OK
 
@@ -134,23 +198,30 @@ class ItemResource(Resource):
             if args['availability'] < 0:
                 return None, BAD_REQUEST
 
-        for attr in args.keys():
-            if args.get(attr) is not None:
-                setattr(obj, attr, args[attr])
-
-        obj.save()
+        values = {attr: value for attr, value in args.items() if value is not None}
+        with Item.atomic():
+            obj = obj.update_changed(**values)
+            search.index_item(obj)
+        catalog.invalidate([obj.uuid])
 
         return obj.json(), OK
 
 
 class ItemPicturesResource(Resource):
+    @replicas.read_only
     def get(self, item_id):
         try:
             item = Item.get(Item.uuid == item_id)
         except Item.DoesNotExist:
             return None, NOT_FOUND
 
-        return [pic.json() for pic in item.pictures], OK
+        # The version of the item changes with its pictures too.
+        tag = utils.etag(item.id, item.version)
+        headers = utils.cache_headers(tag, item.updated_at)
+        if utils.not_modified(tag, item.updated_at):
+            return utils.not_modified_response(headers)
+
+        return Picture.serialize_many(item.pictures.order_by(Picture.id)), OK, headers
 
     @auth.login_required
     def post(self, item_id):
@@ -176,12 +247,15 @@ class ItemPicturesResource(Resource):
         if '.' in image.filename and extension not in config['ALLOWED_EXTENSIONS']:
             abort(400, message='Extension not supported.')
 
-        picture = Picture.create(
-            uuid=uuid.uuid4(),
-            title=title,
-            extension=extension,
-            item=item
-        )
+        with Item.atomic():
+            picture = Picture.create(
+                uuid=uuid.uuid4(),
+                title=title,
+                extension=extension,
+                item=item
+            )
+            Item.update(Item.changes()).where(Item.id == item.id).execute()
+        catalog.invalidate([item.uuid])
 
         save_path = os.path.join('.', config['UPLOADS_FOLDER'], 'items', str(item_id))
         new_filename = secure_filename('.'.join([str(picture.uuid), extension]))
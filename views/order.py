@@ -1,26 +1,38 @@
-from flask_restful import reqparse, Resource
+from flask_restful import reqparse, Resource, inputs
 from http.client import OK, NOT_FOUND, NO_CONTENT, CREATED, BAD_REQUEST, UNAUTHORIZED
 import uuid
 import json
 import auth
+import replicas
 from flask import g
-from models import Order, OrderItem, Item, User, database
+from models import Order, User
+import idempotency
+import orders
+import ratelimit
+import utils
 
 
 def is_valid_uuid(user_id):
-    return uuid.UUID(user_id, version=4)
+    return uuid.UUID(str(user_id), version=4)
 
 
-def is_valid_item_list(json_item_list):
-    return json.loads(json_item_list)
+def is_valid_item_list(item_list):
+    """Lines of the order, from their JSON string, or as decoded from a binary
+    request body."""
+    if isinstance(item_list, list):
+        return item_list
+    return json.loads(item_list)
 
 
 class OrdersResource(Resource):
     @auth.login_required
+    @ratelimit.limit('orders')
+    @idempotency.idempotent
     def post(self):
         parser = reqparse.RequestParser()
         parser.add_argument('user', type=is_valid_uuid, required=True)
-        parser.add_argument('items', type=is_valid_item_list, required=True)
+        parser.add_argument('items', type=is_valid_item_list, required=True,
+                            location=utils.body_location())
         args = parser.parse_args(strict=True)
 
         try:
@@ -31,50 +43,35 @@ class OrdersResource(Resource):
         if user != g.current_user:
             return '', UNAUTHORIZED
 
-        total_price = 0
-        items = args['items']
-        items_uuid = [i[0] for i in items]
-        items_query = Item.select().where(Item.uuid << items_uuid)
-
-        if items_query.count() != len(items) or len(items) == 0:
+        try:
+            order = orders.place_order(user, args['items'])
+        except orders.OrderError:
             return None, BAD_REQUEST
 
-        for item in items_query:
-            item_quantity = [x[1] for x in items if x[0] == str(item.uuid)][0]
-            total_price += float(item.price * item_quantity)
-
-        for item in items_query:
-            item_quantity = [x[1] for x in items if x[0] == str(item.uuid)][0]
-            if item_quantity > item.availability:
-                return None, BAD_REQUEST
-
-        with database.transaction():
-            order = Order.create(
-                uuid=uuid.uuid4(),
-                total_price=total_price,
-                user=user.id
-            )
-
-            for item in items_query:
-                item_quantity = [x[1] for x in items if x[0] == str(item.uuid)][0]
-                OrderItem.create(
-                    order=order,
-                    item=item.id,
-                    quantity=item_quantity,
-                    subtotal=float(item.price * item_quantity)
-                )
-                item.availability = (item.availability - item_quantity)
-                item.save()
-
         return order.json(), CREATED
 
     @auth.login_required
+    @replicas.read_only
     def get(self):
-        return [order.json() for order in Order.select()], OK
+        parser = reqparse.RequestParser()
+        parser.add_argument('limit', type=utils.page_size, location='args',
+                            default=utils.DEFAULT_PAGE_SIZE)
+        parser.add_argument('after', type=utils.cursor(Order), location='args')
+        parser.add_argument('stream', type=inputs.boolean, location='args', default=False)
+        args = parser.parse_args()
+
+        orders = Order.select().where(Order.user == g.current_user)
+        if args['stream']:
+            return utils.iter_pages(orders, Order, Order.serialize_many, args['after']), OK
+
+        query = utils.keyset(orders, Order, args['after'], args['limit'])
+        data, headers = utils.paginate(Order.serialize_many(query), args['limit'])
+        return data, OK, headers
 
 
 class OrderResource(Resource):
     @auth.login_required
+    @replicas.read_only
     def get(self, uuid):
         try:
             order = (
@@ -95,49 +92,15 @@ class OrderResource(Resource):
             return None, NOT_FOUND
 
         parser = reqparse.RequestParser()
-        parser.add_argument('items', type=is_valid_item_list, required=True)
+        parser.add_argument('items', type=is_valid_item_list, required=True,
+                            location=utils.body_location())
         args = parser.parse_args(strict=True)
 
-        total_price = 0
-
-        items = args['items']
-        uuid = [i[0] for i in items]
-        items_query = Item.select().where(Item.uuid << uuid)
-
-        if items_query.count() != len(items) or len(items) == 0:
+        try:
+            orders.update_order(order, args['items'])
+        except orders.OrderError:
             return None, BAD_REQUEST
 
-        for item in items_query:
-            item_quantity = [x[1] for x in items if x[0] == str(item.uuid)][0]
-            total_price += float(item.price * item_quantity)
-
-        for item in items_query:
-            item_quantity = [x[1] for x in items if x[0] == str(item.uuid)][0]
-            if item_quantity > item.availability:
-                return None, BAD_REQUEST
-
-        with database.transaction():
-            temp_query = OrderItem.select().where(OrderItem.order == order.id)
-            for order_item in temp_query:
-                order_item.item.availability = (order_item.item.availability + order_item.quantity)
-                order_item.item.save()
-
-            OrderItem.delete().where(OrderItem.order == order.id).execute()
-
-            for item in items_query:
-                item_quantity = [x[1] for x in items if x[0] == str(item.uuid)][0]
-                OrderItem.create(
-                    order=order,
-                    item=item.id,
-                    quantity=item_quantity,
-                    subtotal=float(item.price * item_quantity)
-                )
-                item.availability = (item.availability - item_quantity)
-                item.save()
-
-            order.total_price = total_price
-            order.save()
-
         return order.json(), OK
 
     @auth.login_required
@@ -151,14 +114,5 @@ class OrderResource(Resource):
         except Order.DoesNotExist:
             return None, NOT_FOUND
 
-        with database.transaction():
-            for order_item in order.order_items:
-                order_item.item.availability += order_item.quantity
-                order_item.item.save()
-
-            for order_item in order.order_items:
-                order_item.delete_instance()
-
-            order.delete_instance()
-
+        orders.cancel_order(order)
         return None, NO_CONTENT
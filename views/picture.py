@@ -1,16 +1,20 @@
 from flask_restful import Resource
 from http.client import NOT_FOUND, NO_CONTENT
 from flask import send_from_directory, current_app
-from models import Picture
+from models import Item, Picture
 from werkzeug.utils import secure_filename
 import os
+import catalog
+import replicas
 
 
 class PictureResource(Resource):
 
+    @replicas.read_only
     def get(self, uuid):
         try:
-            picture = Picture.get(Picture.uuid == uuid)
+            picture = (
+                Picture.select(Picture, Item.uuid).join(Item).where(Picture.uuid == uuid).get())
         except Picture.DoesNotExist:
             return None, NOT_FOUND
 
@@ -29,5 +33,8 @@ class PictureResource(Resource):
         except Picture.DoesNotExist:
             return None, NOT_FOUND
 
-        picture.delete_instance()
+        with Item.atomic():
+            picture.delete_instance()
+            Item.update(Item.changes()).where(Item.id == picture.item_id).execute()
+        catalog.invalidate_ids([picture.item_id])
         return None, NO_CONTENT
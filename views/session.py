@@ -0,0 +1,23 @@
+from flask_restful import Resource, reqparse
+from http.client import CREATED, UNAUTHORIZED
+from flask import g
+import auth
+import utils
+
+
+class SessionsResource(Resource):
+    def post(self):
+        """Check the credentials once and return a token to authenticate
+        the next requests with `Authorization: Bearer <token>`."""
+        parser = reqparse.RequestParser()
+        parser.add_argument('email', type=utils.non_empty_str, required=True)
+        parser.add_argument('password', type=utils.non_empty_str, required=True)
+        args = parser.parse_args(strict=True)
+
+        if not auth.verify_pw(args['email'], args['password']):
+            return None, UNAUTHORIZED
+
+        return {
+            'token': auth.create_token(g.current_user),
+            'expires_in': auth.SESSION_TTL,
+        }, CREATED
@@ -5,7 +5,8 @@ from flask import g
 from http.client import CREATED, NOT_FOUND, NO_CONTENT, BAD_REQUEST, UNAUTHORIZED
 from flask_restful import Resource, reqparse
 import re
-from passlib.hash import pbkdf2_sha256
+import passwords
+import ratelimit
 import utils
 
 
@@ -14,12 +15,11 @@ def valid_email(email):
 
 
 def crypt_password(password):
-    crypt = pbkdf2_sha256.hash(password)
-
-    return crypt
+    return passwords.hash_password(password)
 
 
 class UsersResource(Resource):
+    @ratelimit.limit('signup')
     def post(self):
         parser = reqparse.RequestParser()
         parser.add_argument('first_name', type=utils.non_empty_str, required=True)
@@ -65,7 +65,9 @@ class UserResource(Resource):
             obj.last_name = args['last_name']
             obj.email = args['email']
             obj.password = crypt_password(args['password'])
+            obj.session_version += 1
             obj.save()
+            auth.forget(obj)
 
             return obj.json(), CREATED
         else:
@@ -82,6 +84,8 @@ class UserResource(Resource):
             return '', UNAUTHORIZED
 
         obj.status = 'deleted'
+        obj.session_version += 1
         obj.save()
+        auth.forget(obj)
 
         return None, NO_CONTENT